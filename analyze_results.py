@@ -8,22 +8,114 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 import os
-from typing import Tuple, List
+from typing import Iterator, Tuple, List, Optional
 import base64
 from io import BytesIO
 
-def load_data(client_log: str, server_log: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+from clock_offset import estimate_clock_offset, one_way_delays, read_clock_sync
+from histogram import LogHistogram
+from jitter import delay_variation, interarrival_jitter
+from sequence_analysis import (StreamingSequences, read_sent_counts, select_client_rows, sent_sequence_numbers,
+                               sequence_metrics)
+from packet_log import ADDR, TIME, ack_log_path, log_shards, read_binary_header, upload_log_path
+from upload_analysis import UploadAnalysis
+
+# DATA packet size assumed for rows of logs written before packet sizes were logged
+LEGACY_PACKET_SIZE = 1400
+
+def read_log(log_file: str) -> pd.DataFrame:
+    """Read a log, concatenating its per-process shards if it was sharded"""
+    paths = log_shards(log_file)
+    if not paths:
+        raise FileNotFoundError(f"No log file or shards found for {log_file}")
+    return pd.concat([read_log_file(path) for path in paths], ignore_index=True)
+
+def read_log_file(path: str) -> pd.DataFrame:
+    """Read one CSV or binary log file, detected from its header"""
+    header = read_binary_header(path)
+    if header is None:
+        return pd.read_csv(path)
+    return binary_log_frame(header, map_binary_log(path, header))
+
+def map_binary_log(path: str, header: dict) -> np.ndarray:
+    """Memory-map the records of a binary log as a structured array (no copy)"""
+    dtype = np.dtype([tuple(field) for field in header['fields']])
+    if header['records'] == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=header['data_offset'],
+                     shape=(header['records'],))
+
+def binary_log_frame(header: dict, records: np.ndarray,
+                     usecols: Optional[List[str]] = None) -> pd.DataFrame:
+    """Columns of a binary log as a DataFrame shaped like the CSV log.
+
+    Addresses become a single integer key (IPv4 << 16 | port), which joins
+    like the CSV "host:port" strings without building a string per row.
+    """
+    columns = {}
+    for name, kind in header['columns']:
+        if usecols is not None and name not in usecols:
+            continue
+        if kind == ADDR:
+            ip = records[f"{name}_ip"].astype(np.int64)
+            columns[name] = (ip << 16) | records[f"{name}_port"]
+        elif kind == TIME:
+            # Same local wall-clock time the CSV log writes
+            utc = pd.to_datetime(records[name], unit='s', utc=True)
+            columns[name] = utc.tz_convert(datetime.now().astimezone().tzinfo).tz_localize(None)
+        else:
+            columns[name] = records[name]
+    return pd.DataFrame(columns)
+
+def load_data(client_log: str, server_log: str,
+              server_ack_log: Optional[str] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """Load and preprocess client and server logs"""
-    client_df = pd.read_csv(client_log)
-    server_df = pd.read_csv(server_log)
+    client_df = read_log(client_log)
+    server_df = read_log(server_log)
     
     # Convert timestamp columns to datetime
     for df in [client_df, server_df]:
         df['timestamp'] = pd.to_datetime(df['timestamp'])
     
+    # Fill ACK time and RTT in the send log from the server's ACK journal(s)
+    if server_ack_log is not None:
+        ack_paths = log_shards(server_ack_log)
+    else:
+        ack_paths = [ack_log_path(path) for path in log_shards(server_log)]
+    ack_paths = [path for path in ack_paths if os.path.exists(path)]
+    if ack_paths:
+        ack_df = pd.concat([read_log_file(path) for path in ack_paths], ignore_index=True)
+        server_df = join_ack_journal(server_df, ack_df)
+    
+    # A server log may hold several clients or tests; keep this client's flows
+    if 'flow_id' in server_df:
+        rows = len(server_df)
+        sent_counts = read_sent_counts(log_shards(client_log))
+        server_df = select_client_rows(client_df, server_df, sent_counts.index if sent_counts is not None else None)
+        if len(server_df) < rows:
+            print(f"Ignoring {rows - len(server_df)} server log rows of other clients or tests")
+    
     return client_df, server_df
 
-def calculate_metrics(client_df: pd.DataFrame, server_df: pd.DataFrame) -> dict:
+def packet_bytes(df: pd.DataFrame) -> pd.Series:
+    """Logged size of every packet in bytes"""
+    if 'packet_size' not in df:
+        return pd.Series(LEGACY_PACKET_SIZE, index=df.index)
+    return df['packet_size'].fillna(LEGACY_PACKET_SIZE)
+
+def join_ack_journal(server_df: pd.DataFrame, ack_df: pd.DataFrame) -> pd.DataFrame:
+    """Join append-only ACK records onto the server send records"""
+    keys = [key for key in ['client_addr', 'flow_id', 'sequence_number']
+            if key in server_df and key in ack_df]
+    columns = [column for column in ack_df.columns if column != 'timestamp']
+    acks = ack_df.drop_duplicates(subset=keys, keep='first')[columns]
+    server_df = server_df.drop(columns=[c for c in columns if c not in keys], errors='ignore')
+    return server_df.merge(acks, on=keys, how='left')
+
+def calculate_metrics(client_df: pd.DataFrame, server_df: pd.DataFrame,
+                      sequences: Optional[Tuple[pd.DataFrame, pd.DataFrame]] = None,
+                      clock_fit: Optional[pd.DataFrame] = None,
+                      jitter: Optional[Tuple[pd.DataFrame, pd.DataFrame, pd.Series]] = None) -> dict:
     """Calculate various network performance metrics"""
     metrics = {}
     
@@ -35,21 +127,255 @@ def calculate_metrics(client_df: pd.DataFrame, server_df: pd.DataFrame) -> dict:
     metrics['rtt_p95'] = client_df['rtt_ms'].quantile(0.95)
     metrics['rtt_p99'] = client_df['rtt_ms'].quantile(0.99)
     
-    # Calculate packet loss
-    total_packets = len(client_df)
-    received_packets = len(server_df)
-    metrics['packet_loss_rate'] = (total_packets - received_packets) / total_packets * 100
+    # Calculate packet loss from sequence number gaps
+    if sequences is None:
+        sequences = sequence_metrics(client_df, server_df)
+    metrics.update(calculate_sequence_metrics(sequences[0]))
     
     # Calculate throughput
     duration = (client_df['timestamp'].max() - client_df['timestamp'].min()).total_seconds()
-    total_bytes = client_df['sequence_number'].count() * 1400  # Assuming 1400 bytes per packet
+    total_bytes = packet_bytes(client_df).sum()
     metrics['throughput_mbps'] = (total_bytes * 8) / (duration * 1_000_000)
     
-    # Calculate jitter (standard deviation of RTT)
-    metrics['jitter_ms'] = client_df['rtt_ms'].std()
+    # RFC 3550 interarrival jitter and IPDV of the DATA packets
+    if jitter is None:
+        jitter = delay_variation(client_df)
+    overall = jitter[2]
+    metrics['jitter_ms'] = overall['jitter_ms']
+    metrics['jitter_max_ms'] = overall['jitter_max_ms']
+    for quantile in (50, 95, 99):
+        metrics[f'ipdv_p{quantile}'] = overall[f'ipdv_p{quantile}_ms']
+    
+    metrics.update(calculate_host_delay_metrics(client_df, server_df))
+    
+    # Split RTT into forward and reverse one-way delay with the estimated clock offset
+    if clock_fit is None:
+        clock_fit = estimate_clock_offset(client_df)
+    metrics.update(calculate_one_way_delay_metrics(client_df, clock_fit))
+    
+    return metrics
+
+def calculate_sequence_metrics(flow_sequences: pd.DataFrame) -> dict:
+    """Loss, duplicate and reordering totals over all flows"""
+    totals = flow_sequences.sum()
+    sent = totals['packets_sent']
+    return {
+        'packet_loss_rate': (totals['request_lost'] + totals['data_lost']) / sent * 100,
+        'request_loss_rate': totals['request_lost'] / sent * 100,
+        'data_loss_rate': totals['data_lost'] / totals['requests_received'] * 100,
+        'duplicate_packets': totals['duplicates'],
+        'reordered_rate': totals['reordered'] / totals['data_received'] * 100,
+        'max_reorder_extent': flow_sequences['max_reorder_extent'].max(),
+        'max_reorder_distance': flow_sequences['max_reorder_distance'].max(),
+    }
+
+def calculate_host_delay_metrics(client_df: pd.DataFrame, server_df: pd.DataFrame) -> dict:
+    """Split RTT into network time and host processing delay using kernel timestamps"""
+    metrics = {}
+    if 'kernel_receive_time' not in client_df or client_df['kernel_receive_time'].isna().all():
+        return metrics
+    
+    # Client: kernel receive to userspace handling of the DATA packet
+    client_delay = (client_df['receive_time'] - client_df['kernel_receive_time']) * 1000
+    metrics['client_host_delay_mean'] = client_delay.mean()
+    metrics['client_host_delay_p99'] = client_delay.quantile(0.99)
+    
+    network_rtt = (client_df['kernel_receive_time'] - client_df['request_time']) * 1000
+    
+    if 'kernel_request_time' in server_df and server_df['kernel_request_time'].notna().any():
+        # Server: kernel receive of the REQUEST to the DATA send
+        server_delay = (server_df['send_time'] - server_df['kernel_request_time']) * 1000
+        metrics['server_host_delay_mean'] = server_delay.mean()
+        metrics['server_host_delay_p99'] = server_delay.quantile(0.99)
+        
+        # Both ends carry the same request/send timestamps, so they identify a packet
+        delays = server_df[['request_time', 'send_time']].assign(server_delay=server_delay)
+        joined = client_df[['request_time', 'server_send_time']].assign(network_rtt=network_rtt).merge(
+            delays, left_on=['request_time', 'server_send_time'],
+            right_on=['request_time', 'send_time'], how='left')
+        network_rtt = joined['network_rtt'] - joined['server_delay'].fillna(0)
     
+    metrics['network_rtt_mean'] = network_rtt.mean()
+    metrics['network_rtt_p99'] = network_rtt.quantile(0.99)
     return metrics
 
+def calculate_one_way_delay_metrics(client_df: pd.DataFrame, clock_fit: pd.DataFrame) -> dict:
+    """Forward (client to server) and reverse (server to client) delay and jitter"""
+    forward, reverse = one_way_delays(client_df, clock_fit)
+    metrics = {
+        'clock_offset_ms': clock_fit['offset_ms'].mean(),
+        'clock_skew_ppm': clock_fit['skew_ppm'].mean(),
+    }
+    for direction, delays in (('forward', pd.Series(forward)), ('reverse', pd.Series(reverse))):
+        metrics[f'{direction}_delay_mean'] = delays.mean()
+        metrics[f'{direction}_delay_p99'] = delays.quantile(0.99)
+        metrics[f'{direction}_jitter_ms'] = delays.std()
+    return metrics
+
+def iter_log_chunks(log_file: str, chunk_size: int,
+                    usecols: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """Yield a (possibly sharded) log as DataFrames of at most chunk_size rows"""
+    paths = log_shards(log_file)
+    if not paths:
+        raise FileNotFoundError(f"No log file or shards found for {log_file}")
+    for path in paths:
+        header = read_binary_header(path)
+        if header is not None:
+            records = map_binary_log(path, header)
+            for start in range(0, len(records), chunk_size):
+                yield binary_log_frame(header, records[start:start + chunk_size], usecols)
+            continue
+        columns = None if usecols is None else (lambda column: column in usecols)
+        for chunk in pd.read_csv(path, chunksize=chunk_size, usecols=columns):
+            chunk['timestamp'] = pd.to_datetime(chunk['timestamp'])
+            yield chunk
+
+class StreamingAnalysis:
+    """Running aggregates over log chunks, for logs too large to load at once.
+
+    Moments and quantiles come from mergeable ``LogHistogram`` sketches
+    (quantiles within 1%), throughput from per-second byte counts and the
+    flow plots from per-flow moments, so their memory depends on the run
+    duration and flow count but not on the number of packets. Loss,
+    duplicates and reordering come from ``StreamingSequences``, the same
+    sequence-number analysis as the in-memory mode at a few bytes per packet.
+    """
+
+    CLIENT_COLUMNS = ['timestamp', 'flow_id', 'sequence_number', 'rtt_ms', 'request_time', 'server_send_time',
+                      'receive_time', 'kernel_receive_time', 'packet_size']
+    SERVER_COLUMNS = ['timestamp', 'client_addr', 'flow_id', 'sequence_number', 'request_time', 'send_time',
+                      'kernel_request_time']
+
+    def __init__(self):
+        self.rtt = LogHistogram()
+        self.client_delay = LogHistogram()
+        self.server_delay = LogHistogram()
+        self.kernel_rtt = LogHistogram()  # client request to kernel receive, server time included
+        self.client_bytes = pd.Series(dtype=np.int64)
+        self.sequences = StreamingSequences()
+        self.flows = pd.DataFrame(columns=['packets', 'rtt_sum', 'rtt_sum_sq'], dtype=np.float64)
+        self.jitter_state = {}  # flow -> last (send_time, receive_time, jitter), carried across chunks
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+        self.client_rows = 0
+        self.server_rows = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def add_client_chunk(self, chunk: pd.DataFrame):
+        """Fold a chunk of the client log into the aggregates"""
+        self.client_rows += len(chunk)
+        if not len(chunk):
+            return
+        rtt = chunk['rtt_ms']
+        self.rtt.add(rtt.to_numpy())
+        
+        first, last = chunk['timestamp'].min(), chunk['timestamp'].max()
+        self.first_timestamp = first if self.first_timestamp is None else min(self.first_timestamp, first)
+        self.last_timestamp = last if self.last_timestamp is None else max(self.last_timestamp, last)
+        second = chunk['timestamp'].dt.floor('s')
+        self.client_bytes = self.client_bytes.add(packet_bytes(chunk).groupby(second).sum(), fill_value=0)
+        
+        flows = pd.DataFrame({'flow_id': chunk['flow_id'], 'rtt': rtt, 'rtt_sq': rtt * rtt}).groupby('flow_id')
+        chunk_flows = pd.DataFrame({'packets': flows['rtt'].size(), 'rtt_sum': flows['rtt'].sum(),
+                                    'rtt_sum_sq': flows['rtt_sq'].sum()})
+        self.flows = chunk_flows if self.flows.empty else self.flows.add(chunk_flows, fill_value=0)
+        self.sequences.add_client_chunk(chunk)
+        
+        # Log order is arrival order within each flow
+        _, jitter = interarrival_jitter(chunk['flow_id'].to_numpy(), chunk['server_send_time'].to_numpy(np.float64),
+                                        chunk['receive_time'].to_numpy(np.float64), self.jitter_state)
+        self.jitter_sum += jitter.sum()
+        self.jitter_max = max(self.jitter_max, jitter.max())
+        
+        if 'kernel_receive_time' in chunk:
+            kernel_time = chunk['kernel_receive_time'].to_numpy(dtype=np.float64)
+            self.client_delay.add((chunk['receive_time'].to_numpy() - kernel_time) * 1000)
+            self.kernel_rtt.add((kernel_time - chunk['request_time'].to_numpy()) * 1000)
+
+    def add_server_chunk(self, chunk: pd.DataFrame):
+        """Fold a chunk of the server send log into the aggregates"""
+        self.server_rows += len(chunk)
+        if not len(chunk):
+            return
+        self.sequences.add_server_chunk(chunk)
+        if 'kernel_request_time' in chunk:
+            kernel_time = chunk['kernel_request_time'].to_numpy(dtype=np.float64)
+            self.server_delay.add((chunk['send_time'].to_numpy() - kernel_time) * 1000)
+
+    def metrics(self, sequences: Optional[Tuple[pd.DataFrame, pd.DataFrame]] = None) -> dict:
+        """The metrics calculate_metrics reports, from the aggregates"""
+        if sequences is None:
+            sequences = self.sequences.frames()
+        metrics = calculate_sequence_metrics(sequences[0])
+        if not self.client_rows:
+            return metrics  # every DATA packet lost
+        rtt = self.rtt
+        metrics.update({
+            'rtt_mean': rtt.mean(),
+            'rtt_std': rtt.std(),
+            'rtt_min': rtt.min,
+            'rtt_max': rtt.max,
+            'rtt_p95': rtt.quantile(0.95),
+            'rtt_p99': rtt.quantile(0.99),
+            'jitter_ms': self.jitter_sum / self.client_rows,
+            'jitter_max_ms': self.jitter_max,
+        })
+        duration = (self.last_timestamp - self.first_timestamp).total_seconds()
+        metrics['throughput_mbps'] = (self.client_bytes.sum() * 8) / (duration * 1_000_000)
+        
+        if self.client_delay.count:
+            metrics['client_host_delay_mean'] = self.client_delay.mean()
+            metrics['client_host_delay_p99'] = self.client_delay.quantile(0.99)
+            network_rtt_mean = self.kernel_rtt.mean()
+            if self.server_delay.count:
+                metrics['server_host_delay_mean'] = self.server_delay.mean()
+                metrics['server_host_delay_p99'] = self.server_delay.quantile(0.99)
+                # Per-packet network RTT needs a join, but its mean is a difference of means
+                network_rtt_mean -= self.server_delay.mean()
+            else:
+                metrics['network_rtt_p99'] = self.kernel_rtt.quantile(0.99)
+            metrics['network_rtt_mean'] = network_rtt_mean
+        return metrics
+
+    def flow_metrics(self) -> pd.DataFrame:
+        """Per-flow packets, RTT mean and RTT standard deviation"""
+        flows = self.flows.sort_index()
+        packets = flows['packets']
+        mean = flows['rtt_sum'] / packets
+        variance = (flows['rtt_sum_sq'] - flows['rtt_sum'] * mean) / (packets - 1)
+        return pd.DataFrame({'rtt_mean': mean, 'rtt_std': np.sqrt(variance.clip(lower=0)),
+                             'packets': packets})
+
+def analyze_streaming(client_log: str, server_log: str, chunk_size: int) -> StreamingAnalysis:
+    """Build the streaming aggregates, reading each log one chunk at a time"""
+    analysis = StreamingAnalysis()
+    for chunk in iter_log_chunks(client_log, chunk_size, analysis.CLIENT_COLUMNS):
+        analysis.add_client_chunk(chunk)
+    for chunk in iter_log_chunks(server_log, chunk_size, analysis.SERVER_COLUMNS):
+        analysis.add_server_chunk(chunk)
+    return analysis
+
+def analyze_uploads(server_log: str, chunk_size: int, sent_counts: Optional[pd.DataFrame] = None,
+                    clock_fit: Optional[pd.DataFrame] = None,
+                    clock_sync: Optional[dict] = None) -> Optional[UploadAnalysis]:
+    """Fold the upload logs next to the server log shards in chunks, if the server wrote any"""
+    paths = [upload_log_path(path) for path in log_shards(server_log)]
+    paths = [path for path in paths if os.path.exists(path)]
+    if not paths:
+        return None
+    uploads = UploadAnalysis(sent_counts, clock_fit, clock_sync)
+    for path in paths:
+        for chunk in iter_log_chunks(path, chunk_size, uploads.COLUMNS):
+            uploads.add_chunk(chunk)
+    if uploads.ignored_rows:
+        print(f"Ignoring {uploads.ignored_rows} upload log rows of other clients or tests")
+    return uploads
+
+def downloaded(client_rows: int, sent_counts: Optional[pd.DataFrame]) -> bool:
+    """Whether the run tested the download: DATA packets were logged or, per the send counts, requested"""
+    return client_rows > 0 or (sent_counts is not None and bool((sent_counts['requests'] > 0).any()))
+
 def plot_to_base64(plt_figure):
     """Convert matplotlib figure to base64 string"""
     buf = BytesIO()
@@ -69,35 +395,60 @@ def plot_rtt_distribution(client_df: pd.DataFrame) -> str:
     plt.grid(True)
     return plot_to_base64(plt.gcf())
 
+def plot_rtt_histogram(rtt: LogHistogram) -> str:
+    """Plot the RTT distribution from a streaming histogram and return as base64 string"""
+    edges = np.linspace(rtt.min, rtt.max, 51) if rtt.count else np.linspace(0, 1, 51)
+    counts = rtt.rebin(edges)
+    density = counts / (max(counts.sum(), 1) * np.diff(edges))
+    plt.figure(figsize=(10, 6))
+    plt.stairs(density, edges, fill=True)
+    plt.title('RTT Distribution')
+    plt.xlabel('RTT (ms)')
+    plt.ylabel('Density')
+    plt.grid(True)
+    return plot_to_base64(plt.gcf())
+
 def plot_throughput_over_time(client_df: pd.DataFrame) -> str:
     """Plot throughput over time and return as base64 string"""
     # Calculate throughput for each second
     client_df['second'] = client_df['timestamp'].dt.floor('s')
-    throughput = client_df.groupby('second').size() * 1400 * 8 / 1_000_000  # Mbps
+    return plot_throughput_series(packet_bytes(client_df).groupby(client_df['second']).sum())
+
+def plot_throughput_series(bytes_per_second: pd.Series, title: str = 'Throughput Over Time') -> str:
+    """Plot throughput from per-second byte counts"""
+    throughput = bytes_per_second * 8 / 1_000_000  # Mbps
     
     plt.figure(figsize=(12, 6))
     throughput.plot()
-    plt.title('Throughput Over Time')
+    plt.title(title)
     plt.xlabel('Time')
     plt.ylabel('Throughput (Mbps)')
     plt.grid(True)
     return plot_to_base64(plt.gcf())
 
-def plot_packet_loss(client_df: pd.DataFrame, server_df: pd.DataFrame) -> str:
+def plot_packet_loss(client_df: pd.DataFrame, server_df: pd.DataFrame,
+                     sequences: Optional[Tuple[pd.DataFrame, pd.DataFrame]] = None) -> str:
     """Plot packet loss over time and return as base64 string"""
-    # Calculate packet loss for each second
-    client_df['second'] = client_df['timestamp'].dt.floor('s')
-    server_df['second'] = server_df['timestamp'].dt.floor('s')
-    
-    client_packets = client_df.groupby('second').size()
-    server_packets = server_df.groupby('second').size()
-    
+    if sequences is None:
+        sequences = sequence_metrics(client_df, server_df)
+    return plot_sequence_loss(sequences[1])
+
+def plot_sequence_loss(per_flow_second: pd.DataFrame) -> str:
+    """Plot packet loss from per-(flow, second) sequence counts and return as base64 string"""
+    # Sequence-gap loss per second on the server clock, summed over flows
+    per_second = per_flow_second.groupby(level='bin').sum()
+    sent = per_second['requests_received'] + per_second['request_lost']
+    lost = per_second['request_lost'] + per_second['data_lost']
+    return plot_packet_loss_series(sent, sent - lost)
+
+def plot_packet_loss_series(sent: pd.Series, delivered: pd.Series) -> str:
+    """Plot packet loss from per-second counts of packets sent and delivered"""
     # Align the series and calculate loss
-    all_seconds = pd.concat([client_packets, server_packets]).index.unique()
-    client_packets = client_packets.reindex(all_seconds, fill_value=0)
-    server_packets = server_packets.reindex(all_seconds, fill_value=0)
+    all_seconds = pd.concat([sent, delivered]).index.unique()
+    sent = sent.reindex(all_seconds, fill_value=0)
+    delivered = delivered.reindex(all_seconds, fill_value=0)
     
-    loss_rate = (client_packets - server_packets) / client_packets * 100
+    loss_rate = (sent - delivered) / sent * 100
     
     plt.figure(figsize=(12, 6))
     loss_rate.plot()
@@ -107,19 +458,55 @@ def plot_packet_loss(client_df: pd.DataFrame, server_df: pd.DataFrame) -> str:
     plt.grid(True)
     return plot_to_base64(plt.gcf())
 
+def plot_one_way_delay(client_df: pd.DataFrame, clock_fit: pd.DataFrame) -> str:
+    """Plot per-second mean forward and reverse delay"""
+    forward, reverse = one_way_delays(client_df, clock_fit)
+    delays = pd.DataFrame({'Forward (client to server)': forward, 'Reverse (server to client)': reverse},
+                          index=client_df['timestamp']).resample('1s').mean()
+    
+    plt.figure(figsize=(12, 6))
+    for column in delays.columns:
+        plt.plot(delays.index, delays[column], label=column)
+    plt.title('One-Way Delay Over Time')
+    plt.xlabel('Time')
+    plt.ylabel('Delay (ms)')
+    plt.legend()
+    plt.grid(True)
+    return plot_to_base64(plt.gcf())
+
+def plot_jitter(per_window: pd.DataFrame) -> str:
+    """Plot RFC 3550 jitter and p99 IPDV per time window, averaged over flows"""
+    windows = per_window.groupby(level='second')[['jitter_ms', 'ipdv_p99_ms']].mean()
+    
+    plt.figure(figsize=(12, 6))
+    plt.plot(windows.index, windows['jitter_ms'], label='Jitter (RFC 3550)')
+    plt.plot(windows.index, windows['ipdv_p99_ms'], label='99th Percentile IPDV')
+    plt.title('Delay Variation Over Time')
+    plt.xlabel('Time (s)')
+    plt.ylabel('Delay Variation (ms)')
+    plt.legend()
+    plt.grid(True)
+    return plot_to_base64(plt.gcf())
+
 def plot_flow_metrics(client_df: pd.DataFrame) -> Tuple[str, str]:
     """Plot metrics for each flow and return as base64 strings"""
     # Calculate metrics per flow
-    flow_metrics = client_df.groupby('flow_id').agg({
-        'rtt_ms': ['mean', 'std', 'min', 'max'],
-        'sequence_number': 'count'
-    }).reset_index()
+    flow_metrics = client_df.groupby('flow_id').agg(
+        rtt_mean=('rtt_ms', 'mean'),
+        rtt_std=('rtt_ms', 'std'),
+        packets=('sequence_number', 'count')
+    )
+    return plot_flow_summary(flow_metrics)
+
+def plot_flow_summary(flow_metrics: pd.DataFrame) -> Tuple[str, str]:
+    """Plot per-flow RTT and packet counts from a frame indexed by flow_id"""
+    flow_ids = flow_metrics.index
     
     # Plot RTT statistics per flow
     plt.figure(figsize=(12, 6))
-    plt.bar(flow_metrics['flow_id'], flow_metrics[('rtt_ms', 'mean')])
-    plt.errorbar(flow_metrics['flow_id'], flow_metrics[('rtt_ms', 'mean')],
-                yerr=flow_metrics[('rtt_ms', 'std')], fmt='none', color='black')
+    plt.bar(flow_ids, flow_metrics['rtt_mean'])
+    plt.errorbar(flow_ids, flow_metrics['rtt_mean'],
+                yerr=flow_metrics['rtt_std'], fmt='none', color='black')
     plt.title('Average RTT per Flow')
     plt.xlabel('Flow ID')
     plt.ylabel('RTT (ms)')
@@ -128,7 +515,7 @@ def plot_flow_metrics(client_df: pd.DataFrame) -> Tuple[str, str]:
     
     # Plot packets per flow
     plt.figure(figsize=(12, 6))
-    plt.bar(flow_metrics['flow_id'], flow_metrics[('sequence_number', 'count')])
+    plt.bar(flow_ids, flow_metrics['packets'])
     plt.title('Packets per Flow')
     plt.xlabel('Flow ID')
     plt.ylabel('Number of Packets')
@@ -137,6 +524,78 @@ def plot_flow_metrics(client_df: pd.DataFrame) -> Tuple[str, str]:
     
     return rtt_img, packets_img
 
+# Download metrics, left out of upload-only runs: (key, label, unit)
+SUMMARY_METRICS = [
+    ('rtt_mean', 'Average RTT', 'ms'),
+    ('rtt_std', 'RTT Standard Deviation', 'ms'),
+    ('rtt_min', 'Minimum RTT', 'ms'),
+    ('rtt_max', 'Maximum RTT', 'ms'),
+    ('rtt_p95', '95th Percentile RTT', 'ms'),
+    ('rtt_p99', '99th Percentile RTT', 'ms'),
+    ('packet_loss_rate', 'Packet Loss Rate', '%'),
+    ('throughput_mbps', 'Average Throughput', 'Mbps'),
+    ('jitter_ms', 'Jitter (RFC 3550)', 'ms'),
+]
+
+# Metrics that only some runs produce: (key, label, unit)
+OPTIONAL_METRICS = [
+    ('jitter_max_ms', 'Maximum Jitter (RFC 3550)', 'ms'),
+    ('ipdv_p50', 'Median IPDV', 'ms'),
+    ('ipdv_p95', '95th Percentile IPDV', 'ms'),
+    ('ipdv_p99', '99th Percentile IPDV', 'ms'),
+    ('network_rtt_mean', 'Average Network RTT (kernel timestamps)', 'ms'),
+    ('network_rtt_p99', '99th Percentile Network RTT', 'ms'),
+    ('client_host_delay_mean', 'Average Client Host Delay', 'ms'),
+    ('client_host_delay_p99', '99th Percentile Client Host Delay', 'ms'),
+    ('server_host_delay_mean', 'Average Server Host Delay', 'ms'),
+    ('server_host_delay_p99', '99th Percentile Server Host Delay', 'ms'),
+    ('forward_delay_mean', 'Average Forward Delay (client to server)', 'ms'),
+    ('forward_delay_p99', '99th Percentile Forward Delay', 'ms'),
+    ('forward_jitter_ms', 'Forward Jitter', 'ms'),
+    ('reverse_delay_mean', 'Average Reverse Delay (server to client)', 'ms'),
+    ('reverse_delay_p99', '99th Percentile Reverse Delay', 'ms'),
+    ('reverse_jitter_ms', 'Reverse Jitter', 'ms'),
+    ('clock_offset_ms', 'Estimated Clock Offset (server - client)', 'ms'),
+    ('clock_skew_ppm', 'Estimated Clock Skew', 'ppm'),
+    ('clock_sync_offset_ms', 'Startup Clock Sync Offset', 'ms'),
+    ('request_loss_rate', 'Request Loss Rate (client to server)', '%'),
+    ('data_loss_rate', 'DATA Loss Rate (server to client)', '%'),
+    ('reordered_rate', 'Reordered Packets', '%'),
+    ('max_reorder_extent', 'Maximum Reordering Extent', 'packets'),
+    ('max_reorder_distance', 'Maximum Reordering Distance', 'seq'),
+    ('duplicate_packets', 'Duplicate Packets', 'packets'),
+    ('upload_throughput_mbps', 'Average Upload Throughput', 'Mbps'),
+    ('upload_loss_rate', 'Upload Loss Rate', '%'),
+    ('upload_packets_received', 'Upload Packets Received', 'packets'),
+    ('upload_duplicate_packets', 'Duplicate Upload Packets', 'packets'),
+    ('upload_jitter_ms', 'Upload Jitter (RFC 3550)', 'ms'),
+    ('upload_jitter_max_ms', 'Maximum Upload Jitter', 'ms'),
+    ('upload_delay_mean', 'Average Upload One-Way Delay', 'ms'),
+    ('upload_delay_p99', '99th Percentile Upload One-Way Delay', 'ms'),
+]
+
+def metric_cards(metrics: dict, specs: list) -> str:
+    """HTML metric cards for the metrics of specs present in this run"""
+    cards = []
+    for key, label, unit in specs:
+        if key in metrics and pd.notna(metrics[key]):
+            cards.append(f"""
+                <div class="metric-card">
+                    <div class="metric-label">{label}</div>
+                    <div class="metric-value">{metrics[key]:.2f} {unit}</div>
+                </div>""")
+    return ''.join(cards)
+
+def optional_plot(images: dict, key: str, title: str) -> str:
+    """HTML plot section for a plot only some runs produce"""
+    if key not in images:
+        return ''
+    return f"""
+            <div class="plot">
+                <h3>{title}</h3>
+                <img src="data:image/png;base64,{images[key]}" alt="{title}">
+            </div>"""
+
 def generate_html_report(metrics: dict, images: dict, output_dir: str):
     """Generate an HTML report with all metrics and plots"""
     html_content = f"""
@@ -161,62 +620,19 @@ def generate_html_report(metrics: dict, images: dict, output_dir: str):
             
             <h2>Summary Metrics</h2>
             <div class="metric-grid">
-                <div class="metric-card">
-                    <div class="metric-label">Average RTT</div>
-                    <div class="metric-value">{metrics['rtt_mean']:.2f} ms</div>
-                </div>
-                <div class="metric-card">
-                    <div class="metric-label">RTT Standard Deviation</div>
-                    <div class="metric-value">{metrics['rtt_std']:.2f} ms</div>
-                </div>
-                <div class="metric-card">
-                    <div class="metric-label">Minimum RTT</div>
-                    <div class="metric-value">{metrics['rtt_min']:.2f} ms</div>
-                </div>
-                <div class="metric-card">
-                    <div class="metric-label">Maximum RTT</div>
-                    <div class="metric-value">{metrics['rtt_max']:.2f} ms</div>
-                </div>
-                <div class="metric-card">
-                    <div class="metric-label">95th Percentile RTT</div>
-                    <div class="metric-value">{metrics['rtt_p95']:.2f} ms</div>
-                </div>
-                <div class="metric-card">
-                    <div class="metric-label">99th Percentile RTT</div>
-                    <div class="metric-value">{metrics['rtt_p99']:.2f} ms</div>
-                </div>
-                <div class="metric-card">
-                    <div class="metric-label">Packet Loss Rate</div>
-                    <div class="metric-value">{metrics['packet_loss_rate']:.2f}%</div>
-                </div>
-                <div class="metric-card">
-                    <div class="metric-label">Average Throughput</div>
-                    <div class="metric-value">{metrics['throughput_mbps']:.2f} Mbps</div>
-                </div>
-                <div class="metric-card">
-                    <div class="metric-label">Jitter</div>
-                    <div class="metric-value">{metrics['jitter_ms']:.2f} ms</div>
-                </div>
+                {metric_cards(metrics, SUMMARY_METRICS)}
+                {metric_cards(metrics, OPTIONAL_METRICS)}
             </div>
             
             <h2>Plots</h2>
-            <div class="plot">
-                <h3>RTT Distribution</h3>
-                <img src="data:image/png;base64,{images['rtt_dist']}" alt="RTT Distribution">
-            </div>
-            <div class="plot">
-                <h3>Throughput Over Time</h3>
-                <img src="data:image/png;base64,{images['throughput']}" alt="Throughput Over Time">
-            </div>
-            <div class="plot">
-                <h3>Packet Loss Rate</h3>
-                <img src="data:image/png;base64,{images['loss']}" alt="Packet Loss Rate">
-            </div>
-            <div class="plot">
-                <h3>Flow Metrics</h3>
-                <img src="data:image/png;base64,{images['flow_rtt']}" alt="Flow RTT">
-                <img src="data:image/png;base64,{images['flow_packets']}" alt="Flow Packets">
-            </div>
+            {optional_plot(images, 'rtt_dist', 'RTT Distribution')}
+            {optional_plot(images, 'throughput', 'Throughput Over Time')}
+            {optional_plot(images, 'loss', 'Packet Loss Rate')}
+            {optional_plot(images, 'flow_rtt', 'Average RTT per Flow')}
+            {optional_plot(images, 'flow_packets', 'Packets per Flow')}
+            {optional_plot(images, 'jitter', 'Delay Variation Over Time')}
+            {optional_plot(images, 'one_way_delay', 'One-Way Delay Over Time')}
+            {optional_plot(images, 'upload_throughput', 'Upload Throughput Over Time')}
         </div>
     </body>
     </html>
@@ -231,31 +647,81 @@ def main():
                       help='Path to client log file')
     parser.add_argument('--server-log', type=str, required=True,
                       help='Path to server log file')
+    parser.add_argument('--server-ack-log', type=str, default=None,
+                      help='Path to server ACK journal (default: derived from --server-log)')
     parser.add_argument('--output-dir', type=str, default='results',
                       help='Directory to save analysis results')
+    parser.add_argument('--streaming', action='store_true',
+                      help='Read the logs in chunks into running aggregates (constant memory, approximate quantiles)')
+    parser.add_argument('--chunk-size', type=int, default=1_000_000,
+                      help='Rows per chunk with --streaming')
     
     args = parser.parse_args()
     
     # Create output directory
     os.makedirs(args.output_dir, exist_ok=True)
     
-    # Load data
-    client_df, server_df = load_data(args.client_log, args.server_log)
-    
-    # Calculate metrics
-    metrics = calculate_metrics(client_df, server_df)
+    sent_counts = read_sent_counts(log_shards(args.client_log))
+    clock_sync = read_clock_sync(log_shards(args.client_log))
+    metrics, images, clock_fit = {}, {}, None
+    if args.streaming:
+        analysis = analyze_streaming(args.client_log, args.server_log, args.chunk_size)
+        if downloaded(analysis.client_rows, sent_counts):
+            sequences = analysis.sequences.frames(sent_sequence_numbers(sent_counts))
+            sequences[0].to_csv(os.path.join(args.output_dir, 'sequence_per_flow.csv'))
+            sequences[1].to_csv(os.path.join(args.output_dir, 'sequence_per_second.csv'))
+            metrics = analysis.metrics(sequences)
+            images['loss'] = plot_sequence_loss(sequences[1])
+            if analysis.client_rows:
+                images['rtt_dist'] = plot_rtt_histogram(analysis.rtt)
+                images['throughput'] = plot_throughput_series(analysis.client_bytes.sort_index())
+                images['flow_rtt'], images['flow_packets'] = plot_flow_summary(analysis.flow_metrics())
+    else:
+        # Load data
+        client_df, server_df = load_data(args.client_log, args.server_log, args.server_ack_log)
     
-    # Generate plots and convert to base64
-    images = {
-        'rtt_dist': plot_rtt_distribution(client_df),
-        'throughput': plot_throughput_over_time(client_df),
-        'loss': plot_packet_loss(client_df, server_df)
-    }
+        if downloaded(len(client_df), sent_counts):
+            # Sequence-number loss, reordering and duplicates per flow and per second
+            sequences = sequence_metrics(client_df, server_df, sent=sent_sequence_numbers(sent_counts))
+            sequences[0].to_csv(os.path.join(args.output_dir, 'sequence_per_flow.csv'))
+            sequences[1].to_csv(os.path.join(args.output_dir, 'sequence_per_second.csv'))
+        
+            # Per-flow clock offset and skew from min-RTT samples, falling back to the startup clock sync
+            clock_fit = estimate_clock_offset(client_df, prior=clock_sync)
+            clock_fit.to_csv(os.path.join(args.output_dir, 'clock_offset_per_flow.csv'))
+        
+            # RFC 3550 jitter and IPDV per flow and per second
+            jitter = delay_variation(client_df)
+            jitter[0].to_csv(os.path.join(args.output_dir, 'jitter_per_flow.csv'))
+            jitter[1].to_csv(os.path.join(args.output_dir, 'jitter_per_second.csv'))
+        
+            # Calculate metrics
+            metrics = calculate_metrics(client_df, server_df, sequences, clock_fit, jitter)
+        
+            # Generate plots and convert to base64
+            images['loss'] = plot_packet_loss(client_df, server_df, sequences)
+            if len(client_df):
+                images['rtt_dist'] = plot_rtt_distribution(client_df)
+                images['throughput'] = plot_throughput_over_time(client_df)
+                images['jitter'] = plot_jitter(jitter[1])
+                images['one_way_delay'] = plot_one_way_delay(client_df, clock_fit)
+            
+                # Get flow metrics plots
+                flow_rtt_img, flow_packets_img = plot_flow_metrics(client_df)
+                images['flow_rtt'] = flow_rtt_img
+                images['flow_packets'] = flow_packets_img
+    if clock_sync is not None:
+        metrics['clock_sync_offset_ms'] = clock_sync['offset'] * 1000
     
-    # Get flow metrics plots
-    flow_rtt_img, flow_packets_img = plot_flow_metrics(client_df)
-    images['flow_rtt'] = flow_rtt_img
-    images['flow_packets'] = flow_packets_img
+    # Upload loss, throughput, jitter and one-way delay from the server's upload log
+    uploads = analyze_uploads(args.server_log, args.chunk_size, sent_counts, clock_fit, clock_sync)
+    if uploads is not None:
+        upload_flows = uploads.flow_frame()
+        if len(upload_flows):
+            upload_flows.to_csv(os.path.join(args.output_dir, 'upload_per_flow.csv'))
+            metrics.update(uploads.metrics(upload_flows))
+            images['upload_throughput'] = plot_throughput_series(uploads.bytes_per_second.sort_index(),
+                                                                 'Upload Throughput Over Time')
     
     # Generate HTML report
     generate_html_report(metrics, images, args.output_dir)
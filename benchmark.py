@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+
+"""Loopback benchmark for the UDP server and client.
+
+Every point of the sweep (packet size x flow count x per-flow bandwidth)
+runs a fresh server and client as separate processes on 127.0.0.1 and
+records achieved Mbps and packets/sec, CPU time per packet on each side,
+RTT percentiles from the client log and the loss rate. Results are written
+as JSON; given a baseline file, matching points are compared and the exit
+status is 1 if any metric regressed beyond its tolerance.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from analyze_results import read_log
+from io_engine import EVENT_LOOPS, IO_ENGINES, install_event_loop
+from packet_log import LOG_EXTENSIONS, LOG_FORMATS
+from udp_client import UDPClient
+from udp_server import UDPServer
+
+logger = logging.getLogger(__name__)
+
+# Metrics compared against the baseline: metric -> +1 if higher is better, -1 if lower is
+COMPARED_METRICS = {
+    'achieved_mbps': 1,
+    'pps': 1,
+    'client_cpu_us_per_packet': -1,
+    'server_cpu_us_per_packet': -1,
+    'rtt_p99_ms': -1,
+    'loss_rate': -1,
+}
+POINT_KEYS = ('packet_size', 'flows', 'bandwidth_mbps')
+# Where --save-baseline writes and a bare --baseline reads; baselines are per machine, so it is not committed
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', 'benchmark_baseline.json')
+# Metadata that must match for a comparison to mean anything, and settings that are warned about
+# when they differ (comparing event loops or I/O engines against each other is deliberate)
+BASELINE_MACHINE_KEYS = ('platform', 'cpus')
+BASELINE_SETTING_KEYS = ('io_engine', 'log_format', 'event_loop', 'duration')
+
+def benchmark_server(server_kwargs: dict, results_queue: multiprocessing.Queue, verbose: bool,
+                     event_loop: str):
+    """Server process: serve until SIGINT, then report its CPU time"""
+    if not verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    install_event_loop(event_loop)
+    cpu_start = time.process_time()
+    server = UDPServer(**server_kwargs)
+    try:
+        asyncio.run(server.start())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        server.close()
+        results_queue.put({'cpu_time': time.process_time() - cpu_start})
+
+def benchmark_client(client_kwargs: dict, results_queue: multiprocessing.Queue, verbose: bool,
+                     event_loop: str):
+    """Client process: run one test, reporting its final stats and then its CPU time"""
+    if not verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    install_event_loop(event_loop)
+    cpu_start = time.process_time()
+    client = UDPClient(**client_kwargs, results_queue=results_queue)
+    try:
+        asyncio.run(client.start())
+    finally:
+        client.close()
+        results_queue.put({'cpu_time': time.process_time() - cpu_start})
+
+def run_point(packet_size: int, flows: int, bandwidth_mbps: float, args: argparse.Namespace,
+              log_dir: str) -> dict:
+    """Run one benchmark point and return its measurements"""
+    extension = LOG_EXTENSIONS[args.log_format]
+    client_log = os.path.join(log_dir, f"client_{packet_size}_{flows}_{bandwidth_mbps}{extension}")
+    server_log = os.path.join(log_dir, f"server_{packet_size}_{flows}_{bandwidth_mbps}{extension}")
+
+    server_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=benchmark_server, name='benchmark-server', args=({
+        'host': '127.0.0.1',
+        'port': args.port,
+        'packet_size': packet_size,
+        'log_file': server_log,
+        'io_engine': args.io_engine,
+        'log_format': args.log_format,
+    }, server_queue, args.verbose, args.event_loop))
+    server.start()
+    time.sleep(args.settle_time)
+
+    client_queue = multiprocessing.Queue()
+    client = multiprocessing.Process(target=benchmark_client, name='benchmark-client', args=({
+        'server_ip': '127.0.0.1',
+        'server_port': args.port,
+        'num_flows': flows,
+        'duration': args.duration,
+        'bandwidth_mbps': bandwidth_mbps,
+        'packet_size': packet_size,
+        'log_file': client_log,
+        'io_engine': args.io_engine,
+        'log_format': args.log_format,
+    }, client_queue, args.verbose, args.event_loop))
+    client.start()
+
+    try:
+        final = client_queue.get(timeout=args.duration + 60)
+        client_cpu = client_queue.get(timeout=30)['cpu_time']
+        client.join()
+    finally:
+        os.kill(server.pid, signal.SIGINT)
+        server_cpu = server_queue.get(timeout=30)['cpu_time']
+        server.join()
+
+    packets = max(final['packets_received'], 1)
+    rtt = read_log(client_log)['rtt_ms']
+    return {
+        'packet_size': packet_size,
+        'flows': flows,
+        'bandwidth_mbps': bandwidth_mbps,
+        'offered_mbps': flows * bandwidth_mbps,
+        'achieved_mbps': final['bytes_received'] * 8 / args.duration / 1_000_000,
+        'pps': final['packets_received'] / args.duration,
+        'loss_rate': final['packets_lost'] / max(final['responses_requested'], 1) * 100,
+        'client_cpu_us_per_packet': client_cpu / packets * 1_000_000,
+        'server_cpu_us_per_packet': server_cpu / packets * 1_000_000,
+        'rtt_p50_ms': float(rtt.quantile(0.5)),
+        'rtt_p95_ms': float(rtt.quantile(0.95)),
+        'rtt_p99_ms': float(rtt.quantile(0.99)),
+    }
+
+def compare_to_baseline(results: List[dict], baseline: List[dict], tolerance: float,
+                        rtt_tolerance: float, loss_tolerance: float) -> List[str]:
+    """Describe every metric that regressed against the matching baseline point"""
+    baseline_points = {tuple(point[key] for key in POINT_KEYS): point for point in baseline}
+    regressions = []
+    for result in results:
+        point = tuple(result[key] for key in POINT_KEYS)
+        reference = baseline_points.get(point)
+        if reference is None:
+            continue
+        for metric, direction in COMPARED_METRICS.items():
+            current, previous = result[metric], reference.get(metric)
+            if previous is None:
+                continue
+            if metric == 'loss_rate':
+                # Loss is compared in absolute percentage points
+                regressed = current > previous + loss_tolerance
+            else:
+                allowed = rtt_tolerance if metric.startswith('rtt_') else tolerance
+                if direction > 0:
+                    regressed = current < previous * (1 - allowed)
+                else:
+                    regressed = current > previous * (1 + allowed)
+            if regressed:
+                regressions.append(f"size {point[0]}, {point[1]} flows, {point[2]} Mbps/flow: "
+                                   f"{metric} {previous:.3f} -> {current:.3f}")
+    return regressions
+
+def baseline_mismatches(meta: dict, baseline_meta: dict, keys) -> List[str]:
+    """Describe the metadata keys whose values differ from the baseline's"""
+    return [f"{key} {baseline_meta.get(key)} -> {meta.get(key)}" for key in keys
+            if baseline_meta.get(key) != meta.get(key)]
+
+def git_revision() -> Optional[str]:
+    """Commit of the code under test, if this is a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_list(value: str, kind=int) -> list:
+    return [kind(item) for item in value.split(',') if item]
+
+def main():
+    parser = argparse.ArgumentParser(description='Loopback benchmark for the UDP traffic tester')
+    parser.add_argument('--packet-sizes', type=str, default='200,1400',
+                      help='Comma-separated packet sizes in bytes')
+    parser.add_argument('--flows', type=str, default='1,4',
+                      help='Comma-separated flow counts')
+    parser.add_argument('--bandwidths', type=str, default='10,50',
+                      help='Comma-separated target bandwidths per flow in Mbps')
+    parser.add_argument('--duration', type=int, default=5,
+                      help='Seconds per benchmark point')
+    parser.add_argument('--port', type=int, default=5900,
+                      help='UDP port used for the benchmark server')
+    parser.add_argument('--io-engine', type=str, default='asyncio', choices=IO_ENGINES,
+                      help='Socket I/O engine for both sides')
+    parser.add_argument('--log-format', type=str, default='csv', choices=LOG_FORMATS,
+                      help='Packet log encoding for both sides')
+    parser.add_argument('--event-loop', type=str, default='asyncio', choices=EVENT_LOOPS,
+                      help='Event loop for both sides (auto: uvloop if installed, else asyncio)')
+    parser.add_argument('--settle-time', type=float, default=0.5,
+                      help='Seconds to let the server start before the client')
+    parser.add_argument('--output', type=str, default='benchmark_results.json',
+                      help='Where to write the results as JSON')
+    parser.add_argument('--baseline', type=str, nargs='?', const=BASELINE_FILE, default=None,
+                      help=f'Earlier results JSON to compare against (without a path: {BASELINE_FILE})')
+    parser.add_argument('--save-baseline', action='store_true',
+                      help=f'Also save the results as the baseline in {BASELINE_FILE}')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                      help='Allowed relative regression of throughput and CPU per packet')
+    parser.add_argument('--rtt-tolerance', type=float, default=0.50,
+                      help='Allowed relative regression of the p99 RTT (loopback RTTs are noisy)')
+    parser.add_argument('--loss-tolerance', type=float, default=0.5,
+                      help='Allowed increase of the loss rate in percentage points')
+    parser.add_argument('--verbose', action='store_true',
+                      help='Show server and client logs')
+
+    args = parser.parse_args()
+    # Resolve auto (or a missing uvloop) once, so both sides and the metadata agree
+    args.event_loop = install_event_loop(args.event_loop)
+
+    points = list(itertools.product(parse_list(args.packet_sizes), parse_list(args.flows),
+                                    parse_list(args.bandwidths, float)))
+    results = []
+    with tempfile.TemporaryDirectory(prefix='udp-benchmark-') as log_dir:
+        for index, (packet_size, flows, bandwidth) in enumerate(points, 1):
+            logger.info(f"[{index}/{len(points)}] {packet_size} bytes, {flows} flows, "
+                        f"{bandwidth} Mbps per flow")
+            result = run_point(packet_size, flows, bandwidth, args, log_dir)
+            results.append(result)
+            logger.info(f"  {result['achieved_mbps']:.2f} of {result['offered_mbps']:.2f} Mbps, "
+                        f"{result['pps']:.0f} pps, loss {result['loss_rate']:.2f}%, "
+                        f"CPU {result['client_cpu_us_per_packet']:.2f}/"
+                        f"{result['server_cpu_us_per_packet']:.2f} us/packet (client/server), "
+                        f"RTT p50/p99 {result['rtt_p50_ms']:.3f}/{result['rtt_p99_ms']:.3f} ms")
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'duration': args.duration,
+            'io_engine': args.io_engine,
+            'log_format': args.log_format,
+            'event_loop': args.event_loop,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Results saved to {args.output}")
+
+    if args.baseline:
+        try:
+            with open(args.baseline) as f:
+                baseline_report = json.load(f)
+        except FileNotFoundError:
+            logger.error(f"No baseline at {args.baseline}; record one with --save-baseline")
+            sys.exit(2)
+        baseline, baseline_meta = baseline_report['results'], baseline_report.get('meta', {})
+        mismatches = baseline_mismatches(report['meta'], baseline_meta, BASELINE_MACHINE_KEYS)
+        if mismatches:
+            logger.error(f"Baseline {args.baseline} was recorded on another machine "
+                         f"({', '.join(mismatches)}); not comparing")
+            sys.exit(2)
+        mismatches = baseline_mismatches(report['meta'], baseline_meta, BASELINE_SETTING_KEYS)
+        if mismatches:
+            logger.warning(f"Baseline {args.baseline} used other settings ({', '.join(mismatches)}); "
+                           f"differences may come from them rather than the code")
+        regressions = compare_to_baseline(results, baseline, args.tolerance,
+                                          args.rtt_tolerance, args.loss_tolerance)
+        if regressions:
+            logger.error(f"{len(regressions)} regression(s) against {args.baseline}:")
+            for regression in regressions:
+                logger.error(f"  {regression}")
+            sys.exit(1)
+        logger.info(f"No regressions against {args.baseline}")
+
+    # Saved only after a clean comparison, so a regressed run never becomes the new baseline
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Baseline saved to {BASELINE_FILE}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""Client/server clock offset estimation and one-way delay.
+
+Every DATA packet gives the client three timestamps: ``t1`` (request sent,
+client clock), ``t2`` (DATA sent, server clock) and ``t3`` (DATA received,
+client clock). With ``theta(t)`` the server clock minus the client clock:
+
+- forward delay (client to server, including server processing) ``= t2 - theta - t1``
+- reverse delay (server to client) ``= t3 - t2 + theta``
+
+As in NTP, ``t2 - (t1 + t3) / 2`` estimates ``theta`` when both directions
+take equally long, which holds best for the packets that saw the emptiest
+queues. So per flow and time window only the lowest-RTT packet is kept, and
+a least-squares line through those points gives the offset and its drift
+(skew) for the whole run. Everything is vectorized over all flows at once.
+"""
+
+import json
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Flows with fewer min-RTT windows than this fall back to the startup clock sync, if any
+MIN_FIT_POINTS = 2
+
+def clock_sync_path(log_file: str) -> str:
+    """Path of the startup clock sync result written next to a client log"""
+    root, _ = os.path.splitext(log_file)
+    return f"{root}_clock.json"
+
+def read_clock_sync(log_files: List[str]) -> Optional[dict]:
+    """Best (lowest-RTT) startup clock sync among the given client log files, if any"""
+    results = []
+    for log_file in log_files:
+        path = clock_sync_path(log_file)
+        if os.path.exists(path):
+            with open(path) as f:
+                results.append(json.load(f))
+    return min(results, key=lambda result: result['rtt']) if results else None
+
+def estimate_clock_offset(client_df: pd.DataFrame, window_seconds: float = 1.0,
+                          prior: Optional[dict] = None) -> pd.DataFrame:
+    """Per-flow clock offset fit: theta(t) = offset + skew * (t - t0), t on the client clock.
+
+    Returns a frame indexed by flow_id with ``t0`` (seconds), ``offset_ms``,
+    ``skew_ppm`` and ``points`` (min-RTT windows used). ``prior`` is a
+    startup clock sync result (``offset`` in seconds) used for
+    flows with too few windows to fit.
+    """
+    flows, flow_index = np.unique(client_df['flow_id'].to_numpy(), return_inverse=True)
+    t1 = client_df['request_time'].to_numpy(np.float64)
+    t2 = client_df['server_send_time'].to_numpy(np.float64)
+    t3 = client_df['receive_time'].to_numpy(np.float64)
+    num_flows = len(flows)
+    t0 = t1.min() if len(t1) else 0.0
+
+    # Lowest-RTT packet of every (flow, window)
+    window = ((t1 - t0) // window_seconds).astype(np.int64)
+    order = np.lexsort((t3 - t1, window, flow_index))
+    group = flow_index[order] * (window.max(initial=0) + 1) + window[order]
+    first = np.empty(len(order), dtype=bool)
+    first[:1] = True
+    np.not_equal(group[1:], group[:-1], out=first[1:])
+    best = order[first]
+
+    # Least squares per flow from bincount sums
+    flow = flow_index[best]
+    x = t1[best] - t0
+    y = t2[best] - (t1[best] + t3[best]) / 2
+    n = np.bincount(flow, minlength=num_flows).astype(np.float64)
+    sx = np.bincount(flow, x, num_flows)
+    sy = np.bincount(flow, y, num_flows)
+    sxx = np.bincount(flow, x * x, num_flows)
+    sxy = np.bincount(flow, x * y, num_flows)
+    denominator = n * sxx - sx * sx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        skew = np.where(denominator > 0, (n * sxy - sx * sy) / denominator, 0.0)
+        offset = np.where(n > 0, (sy - skew * sx) / n, np.nan)
+
+    few = n < MIN_FIT_POINTS
+    if prior is not None and few.any():
+        skew[few] = 0.0
+        offset[few] = prior['offset']
+
+    return pd.DataFrame({
+        't0': t0,
+        'offset_ms': offset * 1000,
+        'skew_ppm': skew * 1_000_000,
+        'points': n.astype(np.int64),
+    }, index=pd.Index(flows, name='flow_id'))
+
+def clock_offsets(fit: pd.DataFrame, flow_ids: np.ndarray, client_times: np.ndarray) -> np.ndarray:
+    """theta in seconds at the given client clock times from the per-flow fit (NaN for flows without one)"""
+    flow_fit = fit.reindex(flow_ids)
+    return flow_fit['offset_ms'].to_numpy() / 1000 + \
+        flow_fit['skew_ppm'].to_numpy() / 1_000_000 * (client_times - flow_fit['t0'].to_numpy())
+
+def one_way_delays(client_df: pd.DataFrame, fit: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Forward and reverse delay in ms of every packet, corrected with the per-flow fit"""
+    t1 = client_df['request_time'].to_numpy(np.float64)
+    t2 = client_df['server_send_time'].to_numpy(np.float64)
+    t3 = client_df['receive_time'].to_numpy(np.float64)
+    theta = clock_offsets(fit, client_df['flow_id'].to_numpy(), t1)
+    forward = (t2 - theta - t1) * 1000
+    reverse = (t3 - t2 + theta) * 1000
+    return forward, reverse
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import math
+
+import numpy as np
+
+class LogHistogram:
+    """Mergeable log-bucketed histogram with running moments.
+
+    Bucket ``i >= 1`` covers ``[min_value * g**(i-1), min_value * g**i)``
+    with ``g = 1 + precision``, so every quantile is within ``precision``
+    (relative) of the exact value while memory stays fixed whatever the
+    number of samples. Bucket 0 collects values below ``min_value``
+    (including zero and negatives) and the last bucket everything above
+    ``max_value``. Count, sum, sum of squares, min and max are tracked
+    exactly. Histograms with the same layout merge by adding counts, so
+    per-chunk, per-flow or per-process histograms combine losslessly.
+    """
+
+    def __init__(self, precision: float = 0.01, min_value: float = 1e-3, max_value: float = 1e6):
+        self.precision = precision
+        self.min_value = min_value
+        self.max_value = max_value
+        self._log_growth = math.log1p(precision)
+        self.counts = np.zeros(int(math.ceil(math.log(max_value / min_value) / self._log_growth)) + 2,
+                               dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def bucket(self, value: float) -> int:
+        """Index of the bucket holding ``value``"""
+        if not value >= self.min_value:
+            return 0
+        return min(len(self.counts) - 1,
+                   1 + int(math.log(value / self.min_value) / self._log_growth))
+
+    def record(self, value: float):
+        """Add a single sample (cheap enough for per-packet use)"""
+        if value != value:  # NaN
+            return
+        self.counts[self.bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def add(self, values):
+        """Add an array of samples in one vectorized pass; NaNs are ignored"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        index = np.zeros(len(values), dtype=np.int64)
+        above = values >= self.min_value
+        index[above] = 1 + (np.log(values[above] / self.min_value) / self._log_growth).astype(np.int64)
+        np.minimum(index, len(self.counts) - 1, out=index)
+        self.counts += np.bincount(index, minlength=len(self.counts))
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.total_sq += float(np.dot(values, values))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other: 'LogHistogram'):
+        """Fold another histogram with the same layout into this one"""
+        if (other.precision, other.min_value, other.max_value) != (self.precision, self.min_value, self.max_value):
+            raise ValueError("Cannot merge histograms with different bucket layouts")
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def bucket_bounds(self) -> np.ndarray:
+        """Upper bound of every bucket (the last one is infinite)"""
+        bounds = self.min_value * np.exp(self._log_growth * np.arange(len(self.counts), dtype=np.float64))
+        bounds[-1] = math.inf
+        return bounds
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else math.nan
+
+    def std(self) -> float:
+        """Sample standard deviation (ddof=1, like pandas)"""
+        if self.count < 2:
+            return math.nan
+        variance = (self.total_sq - self.total * self.total / self.count) / (self.count - 1)
+        return math.sqrt(max(0.0, variance))
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile: the geometric middle of the bucket holding rank q"""
+        if not self.count:
+            return math.nan
+        rank = q * (self.count - 1)
+        index = int(np.searchsorted(np.cumsum(self.counts), rank, side='right'))
+        if index == 0:
+            value = self.min_value
+        else:
+            value = self.min_value * math.exp(self._log_growth * (index - 0.5))
+        return min(max(value, self.min), self.max)
+
+    def rebin(self, edges: np.ndarray) -> np.ndarray:
+        """Counts over arbitrary bin edges, placing each bucket at its middle"""
+        middles = self.min_value * np.exp(self._log_growth * (np.arange(len(self.counts)) - 0.5))
+        middles = np.clip(middles, self.min, self.max)
+        counts, _ = np.histogram(middles, bins=edges, weights=self.counts)
+        return counts
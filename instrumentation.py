@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+import asyncio
+import gc
+import logging
+import os
+import random
+import socket
+import time
+from typing import Dict, List, Optional
+
+from histogram import LogHistogram
+
+logger = logging.getLogger(__name__)
+
+PROC_NET_UDP = ('/proc/net/udp', '/proc/net/udp6')
+PROC_NET_SNMP = '/proc/net/snmp'
+SNMP_COUNTERS = ('InErrors', 'RcvbufErrors', 'SndbufErrors')
+
+def duration_histogram() -> LogHistogram:
+    """Microsecond histogram used for stage, loop-lag and GC timings"""
+    return LogHistogram(0.05, 0.01, 1e7)
+
+class Span:
+    """Consecutive stage timings for one sampled packet.
+
+    ``mark(stage)`` charges the time since the previous mark (or since the
+    span started) to ``stage``. One instance is reused for every sample, so
+    taking a span allocates nothing.
+    """
+
+    __slots__ = ('profiler', 'last_ns')
+
+    def __init__(self, profiler: 'HotPathProfiler'):
+        self.profiler = profiler
+        self.last_ns = 0
+
+    def start(self) -> 'Span':
+        self.last_ns = time.perf_counter_ns()
+        return self
+
+    def mark(self, stage: str):
+        now_ns = time.perf_counter_ns()
+        self.profiler.record(stage, now_ns - self.last_ns)
+        self.last_ns = now_ns
+
+class HotPathProfiler:
+    """Low-overhead self-instrumentation for ``--profile``.
+
+    - per-stage timings from one packet in every ``sample_every``; hot paths
+      call ``span()`` and only pay for ``perf_counter_ns`` when it returns a
+      span
+    - event-loop lag: how late a periodic timer wakes up
+    - garbage collector pauses per generation, via ``gc.callbacks``
+    - kernel drop counters of the watched sockets (``/proc/net/udp``) and the
+      host-wide UDP error counters (``/proc/net/snmp``)
+
+    ``log_summary`` writes everything at shutdown, with each stage's share
+    of wall time estimated from its sampled mean.
+    """
+
+    def __init__(self, name: str, sample_every: int = 64):
+        self.name = name
+        self.sample_every = max(1, sample_every)
+        self.stages: Dict[str, LogHistogram] = {}
+        self.unsampled = set()  # stages timed on every call (periodic work)
+        self.loop_lag = duration_histogram()
+        self.gc_pauses = duration_histogram()
+        self.gc_collections = [0, 0, 0]
+        self.inodes: List[int] = []
+        self._span = Span(self)
+        self._countdown = self.sample_every
+        self._gc_start_ns = 0
+        self._start_drops = {}
+        self._last_drops = {}
+        self._start_snmp = {}
+        self._start_ns = 0
+        self._lag_task = None
+
+    def span(self) -> Optional[Span]:
+        """A started span for one packet in every ``sample_every`` (on average), else None"""
+        self._countdown -= 1
+        if self._countdown:
+            return None
+        # A random gap keeps the sample from locking onto periodic traffic patterns
+        self._countdown = random.randint(1, 2 * self.sample_every - 1)
+        return self._span.start()
+
+    def record(self, stage: str, duration_ns: int, sampled: bool = True):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = duration_histogram()
+            if not sampled:
+                self.unsampled.add(stage)
+        histogram.record(duration_ns / 1000)
+
+    def watch_socket(self, sock: socket.socket):
+        """Report kernel drops for this socket in the summary"""
+        inode = os.fstat(sock.fileno()).st_ino
+        self.inodes.append(inode)
+        self._start_drops[inode] = self._last_drops[inode] = read_socket_drops().get(inode, 0)
+
+    def start(self):
+        """Begin GC and event-loop lag tracking (call from the running loop)"""
+        self._start_ns = time.perf_counter_ns()
+        self._start_snmp = read_udp_snmp()
+        gc.callbacks.append(self._gc_callback)
+        self._lag_task = asyncio.get_running_loop().create_task(self.monitor_loop_lag())
+
+    def stop(self):
+        if self._gc_callback in gc.callbacks:
+            gc.callbacks.remove(self._gc_callback)
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+
+    async def monitor_loop_lag(self, interval: float = 0.01):
+        """Sample how late the loop runs a timer that should fire every interval"""
+        ticks = 0
+        while True:
+            expected_ns = time.perf_counter_ns() + int(interval * 1_000_000_000)
+            await asyncio.sleep(interval)
+            self.loop_lag.record(max(0, time.perf_counter_ns() - expected_ns) / 1000)
+            ticks += 1
+            if ticks % 100 == 0:
+                # Sockets may be gone by shutdown, so keep the drop counts fresh
+                self.refresh_socket_drops()
+
+    def refresh_socket_drops(self):
+        drops = read_socket_drops()
+        for inode in self.inodes:
+            if inode in drops:
+                self._last_drops[inode] = drops[inode]
+
+    def _gc_callback(self, phase: str, info: dict):
+        if phase == 'start':
+            self._gc_start_ns = time.perf_counter_ns()
+        else:
+            self.gc_pauses.record((time.perf_counter_ns() - self._gc_start_ns) / 1000)
+            self.gc_collections[info.get('generation', 0)] += 1
+
+    def log_summary(self):
+        """Log the profile collected since ``start``"""
+        wall_ns = max(1, time.perf_counter_ns() - self._start_ns)
+        logger.info(f"Profile ({self.name}, 1 in {self.sample_every} packets sampled, "
+                    f"{wall_ns / 1e9:.1f} s):")
+        for stage, histogram in sorted(self.stages.items(), key=lambda item: -item[1].total):
+            # Sampled time scaled up to the estimated number of occurrences
+            scale = 1 if stage in self.unsampled else self.sample_every
+            share = histogram.total * 1000 * scale / wall_ns * 100
+            logger.info(f"  {stage:<14} {histogram.count * scale:>10} calls  "
+                        f"mean {histogram.mean():8.2f} us  p99 {histogram.quantile(0.99):8.2f} us  "
+                        f"max {histogram.max:8.2f} us  ~{share:5.1f}% of wall time")
+        lag = self.loop_lag
+        if lag.count:
+            logger.info(f"  event-loop lag: p50 {lag.quantile(0.5) / 1000:.3f} ms  "
+                        f"p99 {lag.quantile(0.99) / 1000:.3f} ms  max {lag.max / 1000:.3f} ms")
+        pauses = self.gc_pauses
+        logger.info(f"  GC: {sum(self.gc_collections)} collections (gen0/1/2 = "
+                    f"{'/'.join(map(str, self.gc_collections))}), "
+                    f"total pause {pauses.total / 1000:.2f} ms"
+                    + (f", max {pauses.max / 1000:.2f} ms" if pauses.count else ""))
+        if self.inodes:
+            self.refresh_socket_drops()
+            dropped = sum(self._last_drops[inode] - self._start_drops[inode] for inode in self.inodes)
+            logger.info(f"  socket drops: {dropped} over {len(self.inodes)} socket(s)")
+        snmp = read_udp_snmp()
+        if snmp:
+            deltas = ', '.join(f"{name} {snmp[name] - self._start_snmp.get(name, 0)}"
+                               for name in SNMP_COUNTERS if name in snmp)
+            logger.info(f"  host UDP counters: {deltas}")
+
+def read_socket_drops() -> Dict[int, int]:
+    """Kernel drop counts of every UDP socket, keyed by inode (empty if unavailable)"""
+    drops = {}
+    for path in PROC_NET_UDP:
+        try:
+            with open(path) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    drops[int(fields[9])] = int(fields[-1])
+        except (OSError, ValueError, IndexError, StopIteration):
+            continue
+    return drops
+
+def read_udp_snmp() -> Dict[str, int]:
+    """Host-wide UDP counters from /proc/net/snmp (empty if unavailable)"""
+    try:
+        with open(PROC_NET_SNMP) as f:
+            lines = [line.split() for line in f if line.startswith('Udp:')]
+        return dict(zip(lines[0][1:], map(int, lines[1][1:])))
+    except (OSError, ValueError, IndexError):
+        return {}
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import socket
+import struct
+import sys
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+IO_ENGINES = ('asyncio', 'mmsg')
+# auto: uvloop when it is installed, else the default asyncio loop
+EVENT_LOOPS = ('asyncio', 'uvloop', 'auto')
+
+# Receive slots are at least this large so oversized datagrams aren't truncated
+MIN_SLOT_SIZE = 2048
+
+# Kernel receive timestamps (struct timespec in a SOL_SOCKET control message)
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35)
+CMSG_HEADER = struct.Struct('@Nii')   # cmsg_len, cmsg_level, cmsg_type
+TIMESPEC = struct.Struct('@qq')       # tv_sec, tv_nsec
+CMSG_DATA_OFFSET = (CMSG_HEADER.size + ctypes.sizeof(ctypes.c_size_t) - 1) & ~(ctypes.sizeof(ctypes.c_size_t) - 1)
+CONTROL_SIZE = 64                     # room for one timestamp control message
+
+def install_event_loop(event_loop: str = 'asyncio') -> str:
+    """Select the event loop asyncio.run creates in this process and return its name.
+
+    uvloop runs datagram callbacks with much less per-packet overhead than
+    the default selector loop. If it is requested but not installed, the
+    default loop is used with a warning.
+    """
+    if event_loop not in EVENT_LOOPS:
+        raise ValueError(f"Unknown event loop: {event_loop}")
+    if event_loop != 'asyncio':
+        try:
+            import uvloop
+        except ImportError:
+            if event_loop == 'uvloop':
+                logger.warning("uvloop is not installed; using the default asyncio event loop")
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            return 'uvloop'
+    asyncio.set_event_loop_policy(None)
+    return 'asyncio'
+
+def event_loop_name(loop: asyncio.AbstractEventLoop) -> str:
+    """'uvloop' or 'asyncio', for startup logs and result metadata"""
+    return 'uvloop' if type(loop).__module__.startswith('uvloop') else 'asyncio'
+
+def enable_kernel_timestamps(sock: socket.socket):
+    """Ask the kernel to attach a receive timestamp to every datagram"""
+    if not sys.platform.startswith('linux'):
+        raise RuntimeError("Kernel timestamps require Linux (SO_TIMESTAMPNS)")
+    sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+
+def timespec_to_time(data) -> float:
+    """Convert a timespec control message payload to time.time() seconds"""
+    sec, nsec = TIMESPEC.unpack_from(data)
+    return sec + nsec / 1_000_000_000
+
+class iovec(ctypes.Structure):
+    _fields_ = [
+        ('iov_base', ctypes.c_void_p),
+        ('iov_len', ctypes.c_size_t),
+    ]
+
+class sockaddr_in(ctypes.Structure):
+    _fields_ = [
+        ('sin_family', ctypes.c_ushort),
+        ('sin_port', ctypes.c_uint16),      # network byte order
+        ('sin_addr', ctypes.c_uint8 * 4),
+        ('sin_zero', ctypes.c_uint8 * 8),
+    ]
+
+class msghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(iovec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_hdr', msghdr),
+        ('msg_len', ctypes.c_uint),
+    ]
+
+SOCKADDR_SIZE = ctypes.sizeof(sockaddr_in)
+MMSGHDR_SIZE = ctypes.sizeof(mmsghdr)
+
+_libc = None
+
+def _load_libc():
+    """Load libc with recvmmsg/sendmmsg prototypes, or raise if unavailable"""
+    global _libc
+    if _libc is not None:
+        return _libc
+    if not sys.platform.startswith('linux'):
+        raise RuntimeError("The mmsg I/O engine requires Linux (recvmmsg/sendmmsg)")
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    libc.recvmmsg.restype = ctypes.c_int
+    libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    libc.sendmmsg.restype = ctypes.c_int
+    _libc = libc
+    return libc
+
+class MessageRing:
+    """Preallocated mmsghdr array with one iovec, address and buffer slot per message"""
+
+    def __init__(self, batch_size: int, slot_size: int, control_size: int = 0):
+        self.batch_size = batch_size
+        self.slot_size = slot_size
+        self.control_size = control_size
+        self.controls = (ctypes.c_char * max(1, batch_size * control_size))()
+        self.controls_view = memoryview(self.controls).cast('B')
+        self.buffers = (ctypes.c_char * (batch_size * slot_size))()
+        self.names = (sockaddr_in * batch_size)()
+        self.iovs = (iovec * batch_size)()
+        self.msgs = (mmsghdr * batch_size)()
+        self.buffers_view = memoryview(self.buffers).cast('B')
+        self.names_view = memoryview(self.names).cast('B')
+
+        base = ctypes.addressof(self.buffers)
+        for i in range(batch_size):
+            self.iovs[i].iov_base = base + i * slot_size
+            self.iovs[i].iov_len = slot_size
+            hdr = self.msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self.names[i])
+            hdr.msg_namelen = SOCKADDR_SIZE
+            hdr.msg_iov = ctypes.pointer(self.iovs[i])
+            hdr.msg_iovlen = 1
+            if control_size:
+                hdr.msg_control = ctypes.addressof(self.controls) + i * control_size
+                hdr.msg_controllen = control_size
+
+        # Pristine headers, restored in one memmove before each receive
+        self.template = (mmsghdr * batch_size)()
+        ctypes.memmove(self.template, self.msgs, ctypes.sizeof(self.msgs))
+
+    def reset(self):
+        ctypes.memmove(self.msgs, self.template, ctypes.sizeof(self.msgs))
+
+class MmsgDatagramTransport(asyncio.BaseTransport):
+    """Datagram transport that batches I/O with recvmmsg/sendmmsg (Linux only).
+
+    Each readiness callback drains up to ``batch_size`` datagrams in one
+    syscall and hands them to the protocol in one ``datagrams_received``
+    call. Received data are memoryviews into the receive ring and are only
+    valid for the duration of that call. ``sendto`` copies into the send
+    ring; queued datagrams go out in one ``sendmmsg`` when the ring fills or
+    at the end of the current loop iteration.
+
+    Datagrams are delivered as ``(data, addr, kernel_time)``; ``kernel_time``
+    is the SO_TIMESTAMPNS receive time when ``kernel_timestamps`` is set,
+    otherwise None.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, sock: socket.socket,
+                 protocol: asyncio.DatagramProtocol, batch_size: int = 64,
+                 slot_size: int = MIN_SLOT_SIZE, kernel_timestamps: bool = False):
+        super().__init__()
+        self._libc = _load_libc()
+        self._loop = loop
+        self._sock = sock
+        self._fd = sock.fileno()
+        self._protocol = protocol
+        self._batch_size = batch_size
+        self._closing = False
+
+        slot_size = max(slot_size, MIN_SLOT_SIZE)
+        self._kernel_timestamps = kernel_timestamps
+        self._recv = MessageRing(batch_size, slot_size, CONTROL_SIZE if kernel_timestamps else 0)
+        self._send = MessageRing(batch_size, slot_size)
+        self._send_count = 0        # messages queued in the send ring
+        self._send_offset = 0       # first message not yet accepted by the kernel
+        self._flush_scheduled = False
+        self._writer_registered = False
+        self.send_dropped = 0
+        self.recv_truncated = 0     # datagrams dropped for not fitting a receive slot
+
+        # Raw sockaddr <-> (host, port) conversions are cached per peer
+        self._addr_cache = {}
+        self._sockaddr_cache = {}
+
+        sock.setblocking(False)
+        loop.add_reader(self._fd, self._read_ready)
+        loop.call_soon(protocol.connection_made, self)
+
+    def get_extra_info(self, name, default=None):
+        if name == 'socket':
+            return self._sock
+        if name == 'sockname':
+            return self._sock.getsockname()
+        return default
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._flush()
+        if self.recv_truncated:
+            logger.warning(f"Dropped {self.recv_truncated} datagrams larger than the receive slot")
+        self._loop.remove_reader(self._fd)
+        if self._writer_registered:
+            self._loop.remove_writer(self._fd)
+        self._loop.call_soon(self._protocol.connection_lost, None)
+        self._sock.close()
+
+    def _read_ready(self):
+        ring = self._recv
+        ring.reset()
+        count = self._libc.recvmmsg(self._fd, ring.msgs, ring.batch_size, socket.MSG_DONTWAIT, None)
+        if count < 0:
+            err = ctypes.get_errno()
+            if err not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                self._protocol.error_received(OSError(err, os.strerror(err)))
+            return
+
+        msgs = ring.msgs
+        buffers = ring.buffers_view
+        names = ring.names_view
+        slot_size = ring.slot_size
+        addr_cache = self._addr_cache
+        kernel_timestamps = self._kernel_timestamps
+        kernel_time = None
+        datagrams = []
+        for i in range(count):
+            msg_hdr = msgs[i].msg_hdr
+            if msg_hdr.msg_flags & socket.MSG_TRUNC:
+                # Larger than a receive slot: the kernel cut it short, so it can't be parsed
+                self.recv_truncated += 1
+                if self.recv_truncated == 1:
+                    logger.warning(f"Dropping datagrams larger than the {slot_size}-byte receive slot")
+                continue
+            raw_addr = bytes(names[i * SOCKADDR_SIZE + 2:i * SOCKADDR_SIZE + 8])
+            addr = addr_cache.get(raw_addr)
+            if addr is None:
+                addr = addr_cache[raw_addr] = (socket.inet_ntoa(raw_addr[2:]),
+                                               int.from_bytes(raw_addr[:2], 'big'))
+            if kernel_timestamps:
+                kernel_time = self._parse_control(i, msg_hdr.msg_controllen)
+            start = i * slot_size
+            datagrams.append((buffers[start:start + msgs[i].msg_len], addr, kernel_time))
+
+        try:
+            self._protocol.datagrams_received(datagrams)
+        finally:
+            # Replies queued while handling the batch go out together
+            self._flush()
+
+    def _parse_control(self, index: int, controllen: int) -> Optional[float]:
+        """Kernel receive time from message ``index``'s control buffer, if present"""
+        if controllen < CMSG_DATA_OFFSET + TIMESPEC.size:
+            return None
+        control = self._recv.controls_view
+        offset = index * self._recv.control_size
+        _, level, cmsg_type = CMSG_HEADER.unpack_from(control, offset)
+        if level != socket.SOL_SOCKET or cmsg_type != SO_TIMESTAMPNS:
+            return None
+        return timespec_to_time(control[offset + CMSG_DATA_OFFSET:offset + CMSG_DATA_OFFSET + TIMESPEC.size])
+
+    def sendto(self, data, addr=None):
+        ring = self._send
+        if self._send_count == ring.batch_size:
+            self._flush()
+            if self._send_count == ring.batch_size:
+                # Kernel still not accepting; drop rather than grow without bound
+                self.send_dropped += 1
+                return
+        size = len(data)
+        if size > ring.slot_size:
+            raise ValueError(f"Datagram of {size} bytes exceeds the {ring.slot_size}-byte send slot")
+
+        i = self._send_count
+        start = i * ring.slot_size
+        ring.buffers_view[start:start + size] = data
+        ring.iovs[i].iov_len = size
+        sockaddr = self._sockaddr_cache.get(addr)
+        if sockaddr is None:
+            sockaddr = self._sockaddr_cache[addr] = self._pack_sockaddr(addr)
+        ring.names_view[i * SOCKADDR_SIZE:(i + 1) * SOCKADDR_SIZE] = sockaddr
+        self._send_count += 1
+
+        if self._send_count == ring.batch_size:
+            self._flush()
+        elif not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._loop.call_soon(self._flush)
+
+    def _flush(self):
+        """Send queued datagrams with as few sendmmsg calls as the kernel allows"""
+        self._flush_scheduled = False
+        ring = self._send
+        while self._send_offset < self._send_count:
+            sent = self._libc.sendmmsg(self._fd,
+                                       ctypes.byref(ring.msgs, self._send_offset * MMSGHDR_SIZE),
+                                       self._send_count - self._send_offset, 0)
+            if sent < 0:
+                err = ctypes.get_errno()
+                if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    # Resume when the socket is writable
+                    if not self._writer_registered and not self._closing:
+                        self._writer_registered = True
+                        self._loop.add_writer(self._fd, self._write_ready)
+                    return
+                if err == errno.EINTR:
+                    continue
+                # Skip the datagram that failed and report the error
+                self._protocol.error_received(OSError(err, os.strerror(err)))
+                sent = 1
+            self._send_offset += sent
+        self._send_count = 0
+        self._send_offset = 0
+
+    def _write_ready(self):
+        self._loop.remove_writer(self._fd)
+        self._writer_registered = False
+        self._flush()
+
+    @staticmethod
+    def _pack_sockaddr(addr) -> bytes:
+        addr_struct = sockaddr_in()
+        addr_struct.sin_family = socket.AF_INET
+        addr_struct.sin_port = socket.htons(addr[1])
+        addr_struct.sin_addr[:] = socket.inet_aton(socket.gethostbyname(addr[0]))
+        return bytes(addr_struct)
+
+class RecvmsgDatagramTransport(asyncio.BaseTransport):
+    """One-datagram-per-callback transport that reads with ``recvmsg``.
+
+    Used by the asyncio engine when kernel timestamps are on, since asyncio's
+    own datagram transport discards ancillary data. Calls
+    ``datagram_received(data, addr, kernel_time)``.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, sock: socket.socket,
+                 protocol: asyncio.DatagramProtocol, slot_size: int = MIN_SLOT_SIZE):
+        super().__init__()
+        self._loop = loop
+        self._sock = sock
+        self._fd = sock.fileno()
+        self._protocol = protocol
+        self._bufsize = max(slot_size, MIN_SLOT_SIZE)
+        self._closing = False
+        self._buffer = deque()
+
+        sock.setblocking(False)
+        loop.add_reader(self._fd, self._read_ready)
+        loop.call_soon(protocol.connection_made, self)
+
+    def get_extra_info(self, name, default=None):
+        if name == 'socket':
+            return self._sock
+        if name == 'sockname':
+            return self._sock.getsockname()
+        return default
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.remove_reader(self._fd)
+        if self._buffer:
+            self._loop.remove_writer(self._fd)
+        self._loop.call_soon(self._protocol.connection_lost, None)
+        self._sock.close()
+
+    def _read_ready(self):
+        try:
+            data, ancdata, _, addr = self._sock.recvmsg(self._bufsize, CONTROL_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as exc:
+            self._protocol.error_received(exc)
+            return
+        kernel_time = None
+        for level, cmsg_type, cmsg_data in ancdata:
+            if level == socket.SOL_SOCKET and cmsg_type == SO_TIMESTAMPNS:
+                kernel_time = timespec_to_time(cmsg_data)
+        self._protocol.datagram_received(data, addr, kernel_time)
+
+    def sendto(self, data, addr=None):
+        if not self._buffer:
+            try:
+                self._sock.sendto(data, addr)
+                return
+            except (BlockingIOError, InterruptedError):
+                self._loop.add_writer(self._fd, self._write_ready)
+            except OSError as exc:
+                self._protocol.error_received(exc)
+                return
+        # Queue an immutable copy until the socket is writable
+        self._buffer.append((bytes(data), addr))
+
+    def _write_ready(self):
+        while self._buffer:
+            data, addr = self._buffer[0]
+            try:
+                self._sock.sendto(data, addr)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as exc:
+                self._protocol.error_received(exc)
+            self._buffer.popleft()
+        self._loop.remove_writer(self._fd)
+
+async def create_datagram_endpoint(protocol: asyncio.DatagramProtocol, sock: socket.socket,
+                                   io_engine: str = 'asyncio', batch_size: int = 64,
+                                   slot_size: Optional[int] = None,
+                                   kernel_timestamps: bool = False) -> asyncio.BaseTransport:
+    """Attach ``protocol`` to a bound UDP socket using the selected I/O engine"""
+    loop = asyncio.get_running_loop()
+    if kernel_timestamps:
+        enable_kernel_timestamps(sock)
+    if io_engine == 'asyncio':
+        if kernel_timestamps:
+            transport = RecvmsgDatagramTransport(loop, sock, protocol, slot_size or MIN_SLOT_SIZE)
+            await asyncio.sleep(0)
+            return transport
+        transport, _ = await loop.create_datagram_endpoint(lambda: protocol, sock=sock)
+        return transport
+    if io_engine == 'mmsg':
+        transport = MmsgDatagramTransport(loop, sock, protocol, batch_size,
+                                          slot_size or MIN_SLOT_SIZE, kernel_timestamps)
+        # connection_made runs on the next loop iteration, as with asyncio
+        await asyncio.sleep(0)
+        return transport
+    raise ValueError(f"Unknown I/O engine: {io_engine}")
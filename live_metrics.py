@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Optional
+
+from histogram import LogHistogram
+
+logger = logging.getLogger(__name__)
+
+# Coarse RTT layout for live use: 20% buckets from 10 us to 60 s (~90 buckets)
+RTT_PRECISION = 0.2
+RTT_MIN_MS = 0.01
+RTT_MAX_MS = 60_000.0
+
+COUNTERS = ('packets_sent', 'packets_received', 'bytes_sent', 'bytes_received', 'packets_lost')
+
+def rtt_histogram() -> LogHistogram:
+    return LogHistogram(RTT_PRECISION, RTT_MIN_MS, RTT_MAX_MS)
+
+class FlowMetrics:
+    """Cumulative counters and RTT histograms for one flow.
+
+    Everything is updated from the event loop thread only, so plain
+    attribute increments need no locking; the HTTP endpoint runs on the
+    same loop and reads consistent values between callbacks.
+    """
+
+    __slots__ = COUNTERS + ('rtt', 'interval_rtt', 'jitter_ms', 'last_counts', 'interval')
+
+    def __init__(self):
+        self.packets_sent = 0
+        self.packets_received = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.packets_lost = 0
+        self.rtt = rtt_histogram()            # whole run
+        self.interval_rtt = rtt_histogram()   # since the last roll
+        self.jitter_ms = 0.0                  # RFC 3550 interarrival jitter, set by the receiver
+        self.last_counts = dict.fromkeys(COUNTERS, 0)
+        self.interval = {}                    # last completed interval
+
+    def counts(self) -> dict:
+        return {name: getattr(self, name) for name in COUNTERS}
+
+    def record_rtt(self, rtt_ms: float):
+        self.rtt.record(rtt_ms)
+        self.interval_rtt.record(rtt_ms)
+
+    def roll(self, elapsed: float):
+        """Close the current interval, keeping its deltas and RTT quantiles"""
+        counts = self.counts()
+        interval = {name: counts[name] - self.last_counts[name] for name in COUNTERS}
+        interval['elapsed'] = elapsed
+        interval['rtt_count'] = self.interval_rtt.count
+        interval['rtt_mean_ms'] = self.interval_rtt.mean()
+        interval['rtt_p50_ms'] = self.interval_rtt.quantile(0.5)
+        interval['rtt_p99_ms'] = self.interval_rtt.quantile(0.99)
+        interval['rtt_max_ms'] = self.interval_rtt.max if self.interval_rtt.count else float('nan')
+        interval['jitter_ms'] = self.jitter_ms
+        self.interval = interval
+        self.last_counts = counts
+        self.interval_rtt = rtt_histogram()
+
+class LiveMetrics:
+    """Per-flow live metrics served as Prometheus text (``/metrics``) or JSON (``/json``).
+
+    ``role`` ('client' or 'server') and any extra ``labels`` (e.g. the
+    worker ID) are attached to every exported series. Intervals are closed
+    by ``roll``, which the stats reporters call on their usual schedule.
+    """
+
+    def __init__(self, role: str, labels: Optional[Dict[str, str]] = None):
+        self.role = role
+        self.labels = dict(labels or {}, role=role)
+        self.flows: Dict[int, FlowMetrics] = {}
+        self.start_time = time.time()
+        self.last_roll = self.start_time
+        self._server = None
+
+    def flow(self, flow_id: int) -> FlowMetrics:
+        """Metrics for a flow, created on first use; callers may keep the reference"""
+        metrics = self.flows.get(flow_id)
+        if metrics is None:
+            metrics = self.flows[flow_id] = FlowMetrics()
+        return metrics
+
+    def roll(self):
+        """Close the current interval for every flow"""
+        now = time.time()
+        for flow in self.flows.values():
+            flow.roll(now - self.last_roll)
+        self.last_roll = now
+
+    def snapshot(self) -> dict:
+        """Current, last-interval and cumulative values as plain data"""
+        flows = {}
+        for flow_id, flow in sorted(self.flows.items()):
+            flows[flow_id] = {
+                'cumulative': dict(flow.counts(),
+                                   rtt_count=flow.rtt.count,
+                                   rtt_mean_ms=flow.rtt.mean(),
+                                   rtt_p50_ms=flow.rtt.quantile(0.5),
+                                   rtt_p99_ms=flow.rtt.quantile(0.99)),
+                'current': dict({name: value - flow.last_counts[name]
+                                 for name, value in flow.counts().items()},
+                                elapsed=time.time() - self.last_roll,
+                                rtt_count=flow.interval_rtt.count,
+                                jitter_ms=flow.jitter_ms),
+                'interval': flow.interval,
+            }
+        return {'role': self.role, 'labels': self.labels, 'uptime': time.time() - self.start_time,
+                'flows': flows}
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        base = ','.join(f'{key}="{value}"' for key, value in sorted(self.labels.items()))
+        flows = sorted(self.flows.items())
+
+        for name in COUNTERS:
+            lines.append(f"# TYPE udptest_{name}_total counter")
+            for flow_id, flow in flows:
+                lines.append(f'udptest_{name}_total{{{base},flow="{flow_id}"}} {getattr(flow, name)}')
+
+        lines.append("# TYPE udptest_rtt_ms histogram")
+        for flow_id, flow in flows:
+            labels = f'{base},flow="{flow_id}"'
+            cumulative = 0
+            for bound, count in zip(flow.rtt.bucket_bounds(), flow.rtt.counts):
+                cumulative += int(count)
+                le = '+Inf' if bound == float('inf') else f"{bound:.6g}"
+                lines.append(f'udptest_rtt_ms_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'udptest_rtt_ms_sum{{{labels}}} {flow.rtt.total}')
+            lines.append(f'udptest_rtt_ms_count{{{labels}}} {flow.rtt.count}')
+
+        lines.append("# TYPE udptest_jitter_ms gauge")
+        for flow_id, flow in flows:
+            lines.append(f'udptest_jitter_ms{{{base},flow="{flow_id}"}} {flow.jitter_ms}')
+
+        # Last completed interval, for dashboards that don't compute rates themselves
+        lines.append("# TYPE udptest_interval_packets_per_second gauge")
+        lines.append("# TYPE udptest_interval_mbps gauge")
+        lines.append("# TYPE udptest_interval_rtt_ms gauge")
+        for flow_id, flow in flows:
+            interval = flow.interval
+            if not interval or interval['elapsed'] <= 0:
+                continue
+            labels = f'{base},flow="{flow_id}"'
+            elapsed = interval['elapsed']
+            packets = max(interval['packets_sent'], interval['packets_received'])
+            mbps = max(interval['bytes_sent'], interval['bytes_received']) * 8 / elapsed / 1_000_000
+            lines.append(f'udptest_interval_packets_per_second{{{labels}}} {packets / elapsed}')
+            lines.append(f'udptest_interval_mbps{{{labels}}} {mbps}')
+            for quantile in ('p50', 'p99', 'max'):
+                lines.append(f'udptest_interval_rtt_ms{{{labels},stat="{quantile}"}} '
+                             f'{interval[f"rtt_{quantile}_ms"]}')
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, host: str, port: int):
+        """Start the HTTP endpoint on the running event loop"""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        logger.info(f"Live metrics on http://{host}:{port}/metrics (JSON at /json)")
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answer one HTTP GET and close the connection"""
+        try:
+            request_line = await reader.readline()
+            # Skip the request headers
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            path = parts[1] if len(parts) > 1 else '/'
+            if path.startswith('/metrics'):
+                status, content_type, body = '200 OK', 'text/plain; version=0.0.4', self.render_prometheus()
+            elif path.startswith('/json'):
+                status, content_type, body = '200 OK', 'application/json', json.dumps(self.snapshot())
+            else:
+                status, content_type, body = '404 Not Found', 'text/plain', 'Try /metrics or /json\n'
+            payload = body.encode()
+            writer.write(f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload)
+            await writer.drain()
+        except Exception as e:
+            logger.error(f"Error serving live metrics: {e}")
+        finally:
+            writer.close()
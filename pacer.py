@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+import time
+from typing import Iterable
+
+import numpy as np
+
+CATCH_UP_POLICIES = ('burst', 'skip')
+
+class Pacer:
+    """Deadline-based packet pacer on the ``perf_counter_ns`` clock.
+
+    Packet ``k`` is due at ``start + k * interval``. Callers ask how many
+    packets are due, send them, and otherwise sleep until the next wake-up
+    deadline, so there is no polling between packets. Because event-loop
+    timers are only millisecond-accurate, high rates are reached by sending
+    every overdue packet at each wake-up.
+
+    ``burst`` is the token-bucket depth: in steady state the pacer waits until
+    ``burst`` packets are due and releases them together, trading smoothness
+    for fewer wake-ups. ``catch_up`` decides what happens when the sender
+    falls further behind than that:
+
+    - ``burst``: send every overdue packet, keeping the offered load exact
+    - ``skip``: send at most ``burst`` packets and drop the missed slots
+    """
+
+    def __init__(self, rate_pps: float, burst: int = 1, catch_up: str = 'burst'):
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(f"Unknown catch-up policy: {catch_up}")
+        self.rate_pps = rate_pps
+        self.interval_ns = max(1, round(1_000_000_000 / rate_pps))
+        self.burst = max(1, burst)
+        self.catch_up = catch_up
+
+        self.start_ns = 0
+        self.next_ns = 0
+
+        # Schedule accuracy
+        self.sent = 0
+        self.skipped = 0
+        self.lateness_sum_ns = 0
+        self.lateness_max_ns = 0
+
+    def start(self, now_ns: int = None):
+        """Anchor the schedule; the first packet is due immediately"""
+        if now_ns is None:
+            now_ns = time.perf_counter_ns()
+        self.start_ns = self.next_ns = now_ns
+
+    def due(self, now_ns: int) -> int:
+        """Number of packets to send now (0 means sleep)"""
+        wake_ns = self.next_ns + (self.burst - 1) * self.interval_ns
+        if now_ns < wake_ns:
+            return 0
+        count = (now_ns - self.next_ns) // self.interval_ns + 1
+        if self.catch_up == 'skip' and count > self.burst:
+            missed = count - self.burst
+            self.skipped += missed
+            self.next_ns += missed * self.interval_ns
+            count = self.burst
+        return count
+
+    def sent_packets(self, count: int, now_ns: int):
+        """Advance the schedule past ``count`` packets sent at ``now_ns``"""
+        if count <= 0:
+            return
+        first_late = now_ns - self.next_ns
+        # Lateness of packet i is first_late - i * interval
+        self.lateness_sum_ns += count * first_late - self.interval_ns * count * (count - 1) // 2
+        if first_late > self.lateness_max_ns:
+            self.lateness_max_ns = first_late
+        self.next_ns += count * self.interval_ns
+        self.sent += count
+
+    def sleep_time(self, now_ns: int) -> float:
+        """Seconds until the next wake-up deadline"""
+        wake_ns = self.next_ns + (self.burst - 1) * self.interval_ns
+        return max(0, wake_ns - now_ns) / 1_000_000_000
+
+    def drift(self, now_ns: int) -> dict:
+        """How far the actual send schedule drifted from the target"""
+        # Deadlines in [start, now)
+        target = max(0, -(-(now_ns - self.start_ns) // self.interval_ns))
+        return {
+            'target_packets': target,
+            'sent_packets': self.sent,
+            'skipped_packets': self.skipped,
+            'mean_lateness_us': self.lateness_sum_ns / self.sent / 1000 if self.sent else 0.0,
+            'max_lateness_us': self.lateness_max_ns / 1000,
+        }
+
+class SchedulePacer:
+    """Pacer that follows a schedule of send offsets.
+
+    Same interface as ``Pacer``, but packet ``k`` is due at
+    ``start + offset[k]`` (see ``traffic_profile``), so arbitrary rate
+    shapes and random inter-arrivals cost one binary search per wake-up.
+    The schedule arrives as an iterator of sorted offset arrays, one window
+    of the run each, which is consumed as the run reaches it, so only the
+    current window is held in memory. ``burst`` and ``catch_up`` behave as
+    in ``Pacer``; ``rate_pps`` is the mean rate over the run, for logging.
+    """
+
+    def __init__(self, windows: Iterable[np.ndarray], duration: float, rate_pps: float,
+                 burst: int = 1, catch_up: str = 'burst'):
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(f"Unknown catch-up policy: {catch_up}")
+        self.windows = iter(windows)
+        self.duration_ns = int(duration * 1_000_000_000)
+        self.rate_pps = rate_pps
+        self.burst = max(1, burst)
+        self.catch_up = catch_up
+
+        self.start_ns = 0
+        self.offsets_ns = np.empty(0, dtype=np.int64)  # unsent part of the schedule generated so far
+        self.next_index = 0       # next packet, as an index into offsets_ns
+        self.dropped = 0          # packets before offsets_ns[0]
+        self.exhausted = False
+
+        # Schedule accuracy
+        self.sent = 0
+        self.skipped = 0
+        self.lateness_sum_ns = 0
+        self.lateness_max_ns = 0
+
+        # The first window is ready before the flow starts
+        self.extend()
+
+    def start(self, now_ns: int = None):
+        """Anchor the schedule at now_ns"""
+        if now_ns is None:
+            now_ns = time.perf_counter_ns()
+        self.start_ns = now_ns
+
+    def extend(self) -> bool:
+        """Append the next window of the schedule, dropping the packets already passed"""
+        window = next(self.windows, None)
+        if window is None:
+            self.exhausted = True
+            return False
+        self.dropped += self.next_index
+        self.offsets_ns = np.concatenate((self.offsets_ns[self.next_index:], window))
+        self.next_index = 0
+        return True
+
+    def extend_past(self, elapsed_ns: int):
+        """Generate the schedule at least up to elapsed_ns after the start"""
+        while not self.exhausted and (not len(self.offsets_ns) or self.offsets_ns[-1] <= elapsed_ns):
+            self.extend()
+
+    def wake_ns(self) -> int:
+        """Deadline at which the next burst is released (after the run once the schedule is spent)"""
+        while self.next_index + self.burst > len(self.offsets_ns) and not self.exhausted:
+            self.extend()
+        index = self.next_index + self.burst - 1
+        if index >= len(self.offsets_ns):
+            if self.next_index >= len(self.offsets_ns):
+                return self.start_ns + self.duration_ns
+            index = len(self.offsets_ns) - 1
+        return self.start_ns + int(self.offsets_ns[index])
+
+    def due(self, now_ns: int) -> int:
+        """Number of packets to send now (0 means sleep)"""
+        if now_ns < self.wake_ns() or self.next_index >= len(self.offsets_ns):
+            return 0
+        self.extend_past(now_ns - self.start_ns)
+        count = int(np.searchsorted(self.offsets_ns, now_ns - self.start_ns, side='right')) - self.next_index
+        if self.catch_up == 'skip' and count > self.burst:
+            missed = count - self.burst
+            self.skipped += missed
+            self.next_index += missed
+            count = self.burst
+        return count
+
+    def sent_packets(self, count: int, now_ns: int):
+        """Advance the schedule past ``count`` packets sent at ``now_ns``"""
+        if count <= 0:
+            return
+        deadlines = self.offsets_ns[self.next_index:self.next_index + count]
+        late = now_ns - self.start_ns - int(deadlines[0])
+        self.lateness_sum_ns += count * (now_ns - self.start_ns) - int(deadlines.sum())
+        if late > self.lateness_max_ns:
+            self.lateness_max_ns = late
+        self.next_index += count
+        self.sent += count
+
+    def sleep_time(self, now_ns: int) -> float:
+        """Seconds until the next wake-up deadline"""
+        return max(0, self.wake_ns() - now_ns) / 1_000_000_000
+
+    def drift(self, now_ns: int) -> dict:
+        """How far the actual send schedule drifted from the target"""
+        # Deadlines in [start, now)
+        self.extend_past(now_ns - self.start_ns)
+        target = self.dropped + int(np.searchsorted(self.offsets_ns, now_ns - self.start_ns, side='left'))
+        return {
+            'target_packets': target,
+            'sent_packets': self.sent,
+            'skipped_packets': self.skipped,
+            'mean_lateness_us': self.lateness_sum_ns / self.sent / 1000 if self.sent else 0.0,
+            'max_lateness_us': self.lateness_max_ns / 1000,
+        }
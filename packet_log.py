@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+
+import csv
+import json
+import logging
+import math
+import os
+import queue
+import re
+import socket
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMATS = ('csv', 'binary')
+LOG_EXTENSIONS = {'csv': '.csv', 'binary': '.bin'}
+
+# How often close() rechecks that the writer thread is alive while the queue is full (seconds)
+CLOSE_POLL_INTERVAL = 0.1
+
+# Column types. Rows are written as tuples of raw values in column order and
+# each format decides how to encode them; None means "no value".
+TIME = 'time'   # wall-clock seconds; ISO-8601 local time in CSV, f64 in binary
+ADDR = 'addr'   # (host, port); "host:port" in CSV, u32 IPv4 + u16 port in binary
+U16 = 'u16'
+U64 = 'u64'
+F64 = 'f64'
+
+SERVER_LOG_COLUMNS = [
+    ('timestamp', TIME),
+    ('client_addr', ADDR),
+    ('flow_id', U16),
+    ('sequence_number', U64),
+    ('request_time', F64),
+    ('send_time', F64),
+    ('ack_time', F64),
+    ('rtt_ms', F64),
+    ('kernel_request_time', F64),
+    ('packet_size', U16),     # bytes of the DATA packet
+]
+ACK_LOG_COLUMNS = [
+    ('timestamp', TIME),
+    ('client_addr', ADDR),
+    ('flow_id', U16),
+    ('sequence_number', U64),
+    ('ack_time', F64),
+    ('rtt_ms', F64),
+    ('kernel_ack_time', F64),
+]
+UPLOAD_LOG_COLUMNS = [
+    ('timestamp', TIME),
+    ('client_addr', ADDR),
+    ('flow_id', U16),
+    ('sequence_number', U64),
+    ('send_time', F64),       # client clock
+    ('receive_time', F64),
+    ('kernel_receive_time', F64),
+    ('packet_size', U16),
+]
+CLIENT_LOG_COLUMNS = [
+    ('timestamp', TIME),
+    ('flow_id', U16),
+    ('sequence_number', U64),
+    ('request_time', F64),
+    ('server_send_time', F64),
+    ('receive_time', F64),
+    ('rtt_ms', F64),
+    ('kernel_receive_time', F64),
+    ('packet_size', U16),
+]
+
+# Binary log layout: magic, format version and the length of a JSON header
+# describing the record, then little-endian packed records back to back. The
+# header is padded so records start 8-byte aligned.
+BINARY_MAGIC = b'UDPTLOG\x00'
+BINARY_VERSION = 1
+BINARY_PREFIX = struct.Struct('<8sHHI')
+BINARY_FIELDS = {TIME: 'd', U16: 'H', U64: 'Q', F64: 'd'}
+NUMPY_TYPES = {'d': '<f8', 'H': '<u2', 'I': '<u4', 'Q': '<u8'}
+
+def binary_fields(columns: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Record fields (name, struct code) of a binary log; addresses take two fields"""
+    fields = []
+    for name, kind in columns:
+        if kind == ADDR:
+            fields.append((f"{name}_ip", 'I'))
+            fields.append((f"{name}_port", 'H'))
+        else:
+            fields.append((name, BINARY_FIELDS[kind]))
+    return fields
+
+def read_binary_header(path: str) -> Optional[dict]:
+    """Parse the header of a binary log, or return None if it isn't one.
+
+    The result holds ``columns``, numpy-style ``fields``, ``record_size``,
+    ``data_offset`` and ``records`` (complete records currently in the file).
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(BINARY_PREFIX.size)
+        if len(prefix) < BINARY_PREFIX.size or not prefix.startswith(BINARY_MAGIC):
+            return None
+        _, version, _, header_size = BINARY_PREFIX.unpack(prefix)
+        if version != BINARY_VERSION:
+            raise ValueError(f"{path}: unsupported binary log version {version}")
+        header = json.loads(f.read(header_size))
+    # A crash can leave a partial record at the end; it is ignored
+    size = os.path.getsize(path) - header['data_offset']
+    header['records'] = max(0, size) // header['record_size']
+    return header
+
+def ack_log_path(log_file: str) -> str:
+    """Path of the append-only ACK journal that accompanies a server send log"""
+    root, ext = os.path.splitext(log_file)
+    return f"{root}_acks{ext or '.csv'}"
+
+def upload_log_path(log_file: str) -> str:
+    """Path of the server's log of received upload packets"""
+    root, ext = os.path.splitext(log_file)
+    return f"{root}_uploads{ext or '.csv'}"
+
+def session_log_path(log_file: str, test_id: str) -> str:
+    """Path of a log in the per-session directory of one test"""
+    directory, name = os.path.split(log_file)
+    return os.path.join(directory, f"session_{test_id}", name)
+
+def shard_log_path(log_file: str, shard: int) -> str:
+    """Path of one numbered shard of a log written by several processes"""
+    root, ext = os.path.splitext(log_file)
+    return f"{root}.{shard}{ext or '.csv'}"
+
+def log_shards(log_file: str) -> List[str]:
+    """Files holding a log: the file itself if present, else its numbered shards"""
+    if os.path.exists(log_file):
+        return [log_file]
+    directory = os.path.dirname(log_file)
+    root, ext = os.path.splitext(os.path.basename(log_file))
+    pattern = re.compile(re.escape(root) + r'\.(\d+)' + re.escape(ext or '.csv') + '$')
+    shards = []
+    for name in os.listdir(directory or '.'):
+        match = pattern.match(name)
+        if match:
+            shards.append((int(match.group(1)), os.path.join(directory, name)))
+    return [path for _, path in sorted(shards)]
+
+class PacketLogWriter:
+    """Append-only CSV packet log with batched writes on a background thread.
+
+    Rows are collected in memory on the caller's thread (the event loop) and
+    handed to a writer thread in batches, so disk I/O and formatting never
+    run inside ``datagram_received``. The writer thread also hands over rows
+    that have waited ``flush_interval``, so a quiet log still reaches disk.
+    The hand-off queue is bounded: if the disk can't keep up, whole batches
+    are dropped and counted in ``dropped_rows`` instead of letting memory
+    grow without limit.
+    """
+
+    def __init__(self, path: str, columns: List[Tuple[str, str]], batch_size: int = 1024,
+                 flush_interval: float = 1.0, max_pending_batches: int = 256):
+        self.path = path
+        self.columns = columns
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.rows_written = 0
+        self.dropped_rows = 0
+
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        # Guards the buffer and dropped_rows, which both threads touch
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_pending_batches)
+        self._closed = False
+
+        # One long-lived handle for the whole run
+        self._open()
+
+        self._thread = threading.Thread(target=self._run, name=f"packet-log:{path}", daemon=True)
+        self._thread.start()
+
+    def _open(self):
+        """Create the file and write its header"""
+        self._file = open(self.path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([name for name, _ in self.columns])
+        self._file.flush()
+        formatters = {TIME: lambda t: datetime.fromtimestamp(t).isoformat(timespec='microseconds'),
+                      ADDR: lambda addr: f"{addr[0]}:{addr[1]}"}
+        self._formatters = [formatters.get(kind) for _, kind in self.columns]
+
+    def _write_batch(self, batch: list):
+        """Encode and write one batch of rows (writer thread)"""
+        formatters = self._formatters
+        self._writer.writerows(
+            ['' if value is None else fmt(value) if fmt is not None else value
+             for fmt, value in zip(formatters, row)]
+            for row in batch)
+
+    def write(self, row: tuple):
+        """Buffer a single row, submitting the batch when it is full"""
+        with self._lock:
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Hand the current buffer to the writer thread without blocking"""
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            self._count_dropped(len(batch))
+
+    def _count_dropped(self, rows: int):
+        with self._lock:
+            self.dropped_rows += rows
+
+    def _drop_queued(self):
+        """Count the batches left in the queue as dropped"""
+        while True:
+            try:
+                batch = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if batch:
+                self._count_dropped(len(batch))
+
+    def close(self, timeout: Optional[float] = None):
+        """Flush buffered rows, wait for the writer thread and close the file"""
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        # The sentinel must not be dropped, so wait for queue space, but only while the writer
+        # thread is alive to make some (a dead writer would leave a full queue forever)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=CLOSE_POLL_INTERVAL)
+                break
+            except queue.Full:
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+        else:
+            self._drop_queued()
+            logger.error(f"Packet log {self.path}: writer thread stopped before close")
+        self._thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        if self.dropped_rows:
+            logger.warning(f"Packet log {self.path}: dropped {self.dropped_rows} rows (disk too slow)")
+
+    def _run(self):
+        """Writer thread: drain batches to disk until the close sentinel"""
+        try:
+            while True:
+                try:
+                    batch = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    batch = []
+                if batch is None:
+                    break
+                if batch:
+                    try:
+                        self._write_batch(batch)
+                        self.rows_written += len(batch)
+                    except Exception as e:
+                        self._count_dropped(len(batch))
+                        logger.error(f"Failed to write packet log batch: {e}")
+                if self._queue.empty():
+                    try:
+                        self._file.flush()
+                    except Exception as e:
+                        logger.error(f"Failed to flush packet log: {e}")
+                    # Rows buffered since the last flush are picked up on the next pass
+                    if time.monotonic() - self._last_flush >= self.flush_interval:
+                        self.flush()
+        finally:
+            self._file.close()
+
+class BinaryPacketLogWriter(PacketLogWriter):
+    """Packet log of fixed-width little-endian records.
+
+    Each row is packed with one precompiled ``struct.Struct`` matching the
+    numpy dtype recorded in the header, so the analyzer can map the file
+    with ``np.memmap`` instead of parsing it. Missing floats are stored as
+    NaN and IPv4 addresses as a u32 plus a u16 port.
+    """
+
+    def _open(self):
+        """Create the file and write the magic, version and record layout"""
+        fields = binary_fields(self.columns)
+        self._record = struct.Struct('<' + ''.join(code for _, code in fields))
+        header = {
+            'columns': self.columns,
+            'fields': [(name, NUMPY_TYPES[code]) for name, code in fields],
+            'record_size': self._record.size,
+            'data_offset': 0,
+        }
+        encoded = json.dumps(header).encode()
+        # data_offset is part of the header, so size it with a placeholder first
+        offset = -(-(BINARY_PREFIX.size + len(encoded) + 16) // 8) * 8
+        header['data_offset'] = offset
+        encoded = json.dumps(header).encode()
+        encoded += b' ' * (offset - BINARY_PREFIX.size - len(encoded))
+
+        self._file = open(self.path, 'wb')
+        self._file.write(BINARY_PREFIX.pack(BINARY_MAGIC, BINARY_VERSION, 0, len(encoded)))
+        self._file.write(encoded)
+        self._file.flush()
+
+        self._addr_cache = {}
+        self._nullable = [kind == F64 for _, kind in self.columns]
+        self._addr_columns = [i for i, (_, kind) in enumerate(self.columns) if kind == ADDR]
+
+    def _encode_addr(self, addr: tuple) -> tuple:
+        """(host, port) -> (u32 IPv4, port), cached per peer"""
+        encoded = self._addr_cache.get(addr)
+        if encoded is None:
+            ip = int.from_bytes(socket.inet_aton(addr[0]), 'big')
+            encoded = self._addr_cache[addr] = (ip, addr[1])
+        return encoded
+
+    def _write_batch(self, batch: list):
+        """Pack one batch of rows into records (writer thread)"""
+        pack = self._record.pack
+        nullable = self._nullable
+        addr_columns = self._addr_columns
+        nan = math.nan
+        records = []
+        for row in batch:
+            values = [nan if value is None and null else value
+                      for null, value in zip(nullable, row)]
+            # Expand addresses right to left so earlier indexes stay valid
+            for i in reversed(addr_columns):
+                values[i:i + 1] = self._encode_addr(values[i])
+            records.append(pack(*values))
+        self._file.write(b''.join(records))
+
+def open_packet_log(path: str, columns: List[Tuple[str, str]], log_format: str = 'csv',
+                    **kwargs) -> PacketLogWriter:
+    """Open a packet log writer for ``log_format`` ('csv' or 'binary')"""
+    if log_format == 'csv':
+        return PacketLogWriter(path, columns, **kwargs)
+    if log_format == 'binary':
+        return BinaryPacketLogWriter(path, columns, **kwargs)
+    raise ValueError(f"Unknown log format: {log_format}")
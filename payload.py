@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import os
+import random
+from collections import OrderedDict
+from typing import List, Tuple
+
+from wire import WIRE_VERSION, MSG_DATA, DATA_HEADER, MAX_PACKET_SIZE
+
+PAYLOAD_PATTERNS = ('zeros', 'random', 'incompressible')
+
+# Random bytes the 'incompressible' pattern slides through, one window per packet
+POOL_SIZE = 1024 * 1024
+POOL_STRIDE = 4099  # prime, so consecutive packets never share a payload
+
+# Templates a server keeps per payload pattern; the least recently used size is dropped first
+TEMPLATE_CACHE_SIZE = 16
+
+# Named packet size distributions as (size, weight) pairs
+PACKET_SIZE_MIXES = {
+    'imix': [(64, 7), (576, 4), (1500, 1)],  # Simple IMIX
+}
+
+class DataPacketTemplate:
+    """Preallocated DATA packet for one packet size.
+
+    The payload is filled once at construction and only the header is
+    rewritten (with ``pack_into``) for each packet, so the send path does no
+    per-packet allocation. Patterns:
+
+    - ``zeros``: all-zero payload
+    - ``random``: one random payload shared by every packet
+    - ``incompressible``: each packet gets a different window of a random
+      pool, which defeats both compression and deduplication at the cost of
+      one payload-sized memcpy per packet
+    """
+
+    def __init__(self, packet_size: int, pattern: str = 'zeros'):
+        if pattern not in PAYLOAD_PATTERNS:
+            raise ValueError(f"Unknown payload pattern: {pattern}")
+        self.packet_size = max(packet_size, DATA_HEADER.size)
+        self.payload_size = self.packet_size - DATA_HEADER.size
+        self.pattern = pattern
+        self.buffer = bytearray(self.packet_size)
+
+        self._pool = None
+        self._offset = 0
+        if pattern == 'random':
+            self.buffer[DATA_HEADER.size:] = os.urandom(self.payload_size)
+        elif pattern == 'incompressible':
+            self._pool = memoryview(os.urandom(POOL_SIZE + self.payload_size))
+
+    def build(self, flow_id: int, seq_num: int, request_time: float, send_time: float) -> bytearray:
+        """Write the header into the template and return it, ready to send.
+
+        The returned buffer is reused by the next call; transports copy it if
+        they have to queue it, so it is safe to pass straight to ``sendto``.
+        """
+        DATA_HEADER.pack_into(self.buffer, 0, WIRE_VERSION, MSG_DATA, flow_id, seq_num,
+                              request_time, send_time)
+        if self._pool is not None:
+            offset = self._offset
+            self.buffer[DATA_HEADER.size:] = self._pool[offset:offset + self.payload_size]
+            self._offset = (offset + POOL_STRIDE) % POOL_SIZE
+        return self.buffer
+
+
+class DataTemplateCache:
+    """LRU cache of DataPacketTemplates by packet size, so mixed-size tests reuse prebuilt buffers"""
+
+    def __init__(self, pattern: str = 'zeros', capacity: int = TEMPLATE_CACHE_SIZE):
+        self.pattern = pattern
+        self.capacity = max(1, capacity)
+        self.templates = OrderedDict()
+
+    def get(self, packet_size: int) -> DataPacketTemplate:
+        template = self.templates.get(packet_size)
+        if template is None:
+            template = self.templates[packet_size] = DataPacketTemplate(packet_size, self.pattern)
+            if len(self.templates) > self.capacity:
+                self.templates.popitem(last=False)
+        else:
+            self.templates.move_to_end(packet_size)
+        return template
+
+def parse_packet_sizes(spec: str) -> List[Tuple[int, int]]:
+    """Parse a packet size spec into (size, weight) pairs.
+
+    Accepts a single size (``1400``), a named mix (``imix``) or weighted
+    sizes (``64:7,576:4,1500:1``; the weight defaults to 1).
+    """
+    mix = PACKET_SIZE_MIXES.get(spec.strip().lower())
+    if mix is not None:
+        return list(mix)
+    sizes = []
+    for part in spec.split(','):
+        size, _, weight = part.strip().partition(':')
+        try:
+            size, weight = int(size), int(weight or 1)
+        except ValueError:
+            raise ValueError(f"Invalid packet size spec: {spec}")
+        if not DATA_HEADER.size <= size <= MAX_PACKET_SIZE:
+            raise ValueError(f"Packet size {size} outside {DATA_HEADER.size}..{MAX_PACKET_SIZE} bytes")
+        if weight < 1:
+            raise ValueError(f"Packet size weights must be positive integers: {spec}")
+        sizes.append((size, weight))
+    return sizes
+
+def mean_packet_size(sizes: List[Tuple[int, int]]) -> float:
+    """Weighted mean packet size of a mix"""
+    return sum(size * weight for size, weight in sizes) / sum(weight for _, weight in sizes)
+
+def packet_size_cycle(sizes: List[Tuple[int, int]], seed: int) -> List[int]:
+    """One shuffled round of a mix, each size repeated by its weight"""
+    cycle = [size for size, weight in sizes for _ in range(weight)]
+    random.Random(seed).shuffle(cycle)
+    return cycle
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+from array import array
+from typing import Optional
+
+class PendingWindow:
+    """Fixed-size table of in-flight packets for one flow.
+
+    Entries live in a ring indexed by ``seq % window`` and hold a single
+    timestamp (request time on the client, send time on the server). Memory
+    is fixed at construction; an entry that is still outstanding when its
+    slot is reused, or that is older than ``timeout`` when ``expire`` runs,
+    is dropped as a loss. ``expire`` returns both kinds of drop since its
+    last call; ``expired`` keeps the running total.
+    """
+
+    __slots__ = ('window', 'timeout', 'seqs', 'times', 'head', 'tail',
+                 'outstanding', 'evicted', 'expired')
+
+    EMPTY = -1
+
+    def __init__(self, window: int = 16384, timeout: float = 2.0):
+        self.window = window
+        self.timeout = timeout
+        self.seqs = array('q', [self.EMPTY]) * window
+        self.times = array('d', [0.0]) * window
+        self.head = 0         # lowest sequence number that may still be pending
+        self.tail = 0         # one past the highest sequence number added
+        self.outstanding = 0
+        self.evicted = 0      # slot reuses not yet reported by expire
+        self.expired = 0
+
+    def __len__(self):
+        return self.outstanding
+
+    def add(self, seq: int, timestamp: float):
+        """Track a packet; evicts (and counts) whatever still occupied its slot"""
+        if seq < self.head:
+            return
+        slot = seq % self.window
+        if self.seqs[slot] != self.EMPTY:
+            self.evicted += 1
+            self.outstanding -= 1
+        self.seqs[slot] = seq
+        self.times[slot] = timestamp
+        self.outstanding += 1
+        if seq >= self.tail:
+            self.tail = seq + 1
+            if self.tail - self.head > self.window:
+                self.head = self.tail - self.window
+
+    def pop(self, seq: int) -> Optional[float]:
+        """Retire a packet, returning its timestamp or None if it isn't pending"""
+        slot = seq % self.window
+        if self.seqs[slot] != seq:
+            return None
+        self.seqs[slot] = self.EMPTY
+        self.outstanding -= 1
+        return self.times[slot]
+
+    def expire(self, now: float) -> int:
+        """Drop entries older than the timeout and return how many were dropped,
+        including entries evicted by ``add`` since the last call"""
+        deadline = now - self.timeout
+        seqs = self.seqs
+        window = self.window
+        count = 0
+        while self.head < self.tail:
+            slot = self.head % window
+            seq = seqs[slot]
+            if seq == self.EMPTY or seq > self.head:
+                # Already retired, or this sequence number was never seen
+                self.head += 1
+                continue
+            if seq == self.head and self.times[slot] > deadline:
+                break
+            seqs[slot] = self.EMPTY
+            count += 1
+            self.head += 1
+        self.outstanding -= count
+        count += self.evicted
+        self.evicted = 0
+        self.expired += count
+        return count
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+
+"""Sequence-number based loss, reordering and duplicate detection.
+
+Every flow numbers its requests 0, 1, 2, ... and the server echoes the
+number in the DATA packet, so gaps and repeats in ``sequence_number`` tell
+exactly what happened to each packet:
+
+- request loss: numbers below a flow's highest that never reached the server
+  (a DATA packet at the client also proves its request arrived)
+- data loss: requests that reached the server but whose DATA never arrived
+- duplicates: repeated numbers within a flow
+- reordering (RFC 4737): a packet arriving after one with a higher number;
+  its *extent* is how many arrivals ago the first such packet came and its
+  *distance* how far its number is below the highest seen so far
+
+Counts are of sequence numbers, i.e. of expected DATA packets: with
+``--responses K`` one request covers K numbers, so a lost request counts K
+times. How many numbers each flow used comes from the client's sidecar
+file (``read_sent_counts``); without it a flow is assumed to have sent up to
+the highest number seen, which misses loss at the end of a flow.
+
+Everything is computed on whole columns with NumPy. Flows are folded into a
+single int64 key (``flow_index << SEQ_BITS | sequence_number``) so one sort,
+one running maximum and a few ``unique``/``bincount`` calls cover all flows
+at once.
+"""
+
+import json
+import os
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+SEQ_BITS = 40
+
+def sent_counts_path(log_file: str) -> str:
+    """Path of the per-flow send counts written next to a client log"""
+    root, _ = os.path.splitext(log_file)
+    return f"{root}_sent.json"
+
+def read_sent_counts(log_files: List[str]) -> Optional[pd.DataFrame]:
+    """Per-flow send counts of the given client log files, indexed by flow_id, if any were written.
+
+    Columns: ``requests`` (REQUESTs sent, 0 in upload-only runs),
+    ``responses`` (DATA packets asked for per request) and
+    ``sequence_numbers`` (numbers used, by requests and upload packets alike)
+    and, in newer files, ``uploads`` (upload packets sent) and the flow's
+    ``start_time`` and ``end_time`` (client clock).
+    """
+    frames = []
+    for log_file in log_files:
+        path = sent_counts_path(log_file)
+        if os.path.exists(path):
+            with open(path) as f:
+                flows = json.load(f)['flows']
+            frames.append(pd.DataFrame.from_dict(flows, orient='index').set_axis(
+                pd.Index([int(flow) for flow in flows], name='flow_id')))
+    return pd.concat(frames).sort_index() if frames else None
+
+def sent_sequence_numbers(sent_counts: Optional[pd.DataFrame]) -> Optional[pd.Series]:
+    """Sequence numbers each flow requested DATA for, from read_sent_counts"""
+    if sent_counts is None:
+        return None
+    return sent_counts['sequence_numbers'].where(sent_counts['requests'] > 0, 0)
+
+def flow_keys(flow_index: np.ndarray, seqs: np.ndarray) -> np.ndarray:
+    """Combine flow indexes and sequence numbers into sortable int64 keys"""
+    return (flow_index.astype(np.int64) << SEQ_BITS) | seqs.astype(np.int64)
+
+def sorted_unique(keys: np.ndarray) -> np.ndarray:
+    """Sorted distinct keys (a sort plus a mask; faster than np.unique on large arrays)"""
+    keys = np.sort(keys)
+    keep = np.empty(len(keys), dtype=bool)
+    keep[:1] = True
+    np.not_equal(keys[1:], keys[:-1], out=keep[1:])
+    return keys[keep]
+
+def arrival_order(flow_index: np.ndarray, times: np.ndarray) -> np.ndarray:
+    """Permutation grouping packets by flow, in arrival order within each flow"""
+    return np.lexsort((times, flow_index))
+
+def reordering(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Classify packets given their keys grouped by flow in arrival order.
+
+    Returns (duplicate, reordered, extent, distance) arrays; extent and
+    distance are zero for packets that are not reordered.
+    """
+    n = len(keys)
+    duplicate = np.ones(n, dtype=bool)
+    duplicate[np.unique(keys, return_index=True)[1]] = False
+
+    # Keys of later flows are larger, so the running maximum never leaks across flows
+    running_max = np.maximum.accumulate(keys)
+    previous_max = np.empty(n, dtype=np.int64)
+    previous_max[:1] = -1
+    previous_max[1:] = running_max[:-1]
+    reordered = (keys < previous_max) & ~duplicate
+
+    # First arrival whose number exceeded this one (running_max is sorted)
+    first_higher = np.searchsorted(running_max, keys, side='right')
+    extent = np.where(reordered, np.arange(n) - first_higher, 0)
+    distance = np.where(reordered, previous_max - keys, 0)
+    return duplicate, reordered, extent, distance
+
+def sequence_metrics(client_df: pd.DataFrame, server_df: pd.DataFrame, bin_seconds: float = 1.0,
+                     sent: Optional[pd.Series] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Per-flow and per-(flow, time bin) loss, duplicate and reordering counts.
+
+    Loss is binned by the server clock (request loss at the server time of
+    the last request that did arrive before it, data loss at the DATA send
+    time); duplicates and reordering by client arrival time. Rows of other
+    clients in a shared server log are left out (see ``select_client_rows``).
+    ``sent`` holds the sequence numbers each flow used (see
+    ``sent_sequence_numbers``); flows in it that left no rows at all are
+    reported as fully lost.
+    """
+    logged_flows = sent.index if sent is not None else None
+    if 'flow_id' not in server_df:
+        server_df = attach_flow_ids(client_df, server_df)
+    server_df = select_client_rows(client_df, server_df, logged_flows)
+
+    flows, flow_index = np.unique(np.concatenate([client_df['flow_id'].to_numpy(np.int64),
+                                                  server_df['flow_id'].to_numpy(np.int64),
+                                                  np.asarray(logged_flows if sent is not None else [], np.int64)]),
+                                  return_inverse=True)
+    client_flow = flow_index[:len(client_df)]
+    server_flow = flow_index[len(client_df):len(client_df) + len(server_df)]
+    num_flows = len(flows)
+    bin_ns = int(bin_seconds * 1_000_000_000)
+
+    client_times = client_df['timestamp'].to_numpy('datetime64[ns]').astype(np.int64)
+    server_times = server_df['timestamp'].to_numpy('datetime64[ns]').astype(np.int64)
+
+    # Arrival-order analysis at the client
+    order = arrival_order(client_flow, client_times)
+    client_keys = flow_keys(client_flow, client_df['sequence_number'].to_numpy())[order]
+    duplicate, reordered, extent, distance = reordering(client_keys)
+    client_flow = client_flow[order]
+    client_bins = client_times[order] // bin_ns
+
+    # Requests the server saw (first occurrence) and those proven by a DATA arrival
+    server_keys = flow_keys(server_flow, server_df['sequence_number'].to_numpy())
+    server_unique, first = np.unique(server_keys, return_index=True)
+    server_unique_bins = server_times[first] // bin_ns
+    client_unique = sorted_unique(client_keys)
+    received = sorted_unique(np.concatenate([server_unique, client_unique]))
+    received_flow = received >> SEQ_BITS
+
+    # A flow sent at least up to the highest number seen anywhere, and as many as its client logged
+    last = np.searchsorted(received_flow, np.arange(num_flows), side='right') - 1
+    seen = np.bincount(received_flow, minlength=num_flows) > 0
+    highest = (received[np.maximum(last, 0)] & ((1 << SEQ_BITS) - 1)) + 1 if len(received) else 0
+    logged = sent.reindex(flows).fillna(0).to_numpy(np.int64) if sent is not None else 0
+    sent = np.maximum(np.where(seen, highest, 0), logged)
+
+    # Enumerate every number each flow sent and keep the ones nobody saw
+    offsets = np.repeat(np.cumsum(sent) - sent, sent)
+    all_keys = (np.repeat(np.arange(num_flows, dtype=np.int64), sent) << SEQ_BITS) | \
+        (np.arange(offsets.size, dtype=np.int64) - offsets)
+    request_lost = np.setdiff1d(all_keys, received, assume_unique=True)
+    data_lost_mask = ~np.isin(server_unique, client_unique, assume_unique=True)
+    data_lost = server_unique[data_lost_mask]
+
+    # Bin a lost request with the last request of the same flow that arrived before it
+    if len(server_unique):
+        before = np.searchsorted(server_unique, request_lost) - 1
+        same_flow = (before >= 0) & \
+            ((server_unique[np.maximum(before, 0)] >> SEQ_BITS) == (request_lost >> SEQ_BITS))
+        request_lost_bins = np.where(same_flow, server_unique_bins[np.maximum(before, 0)], server_unique_bins.min())
+    else:
+        request_lost_bins = np.zeros(len(request_lost), dtype=np.int64)
+
+    def per_flow(flow):
+        return np.bincount(flow, minlength=num_flows)
+
+    flow_frame = pd.DataFrame({
+        'packets_sent': sent,
+        'requests_received': per_flow(received_flow),
+        'request_lost': per_flow(request_lost >> SEQ_BITS),
+        'data_received': per_flow(client_unique >> SEQ_BITS),
+        'data_lost': per_flow(data_lost >> SEQ_BITS),
+        'duplicates': per_flow(client_flow[duplicate]),
+        'reordered': per_flow(client_flow[reordered]),
+        'max_reorder_extent': max_per_flow(client_flow, extent, num_flows),
+        'max_reorder_distance': max_per_flow(client_flow, distance, num_flows),
+    }, index=pd.Index(flows, name='flow_id'))
+    flow_frame['loss_rate'] = (flow_frame['request_lost'] + flow_frame['data_lost']) / \
+        flow_frame['packets_sent'] * 100
+
+    events = {
+        'requests_received': (server_unique >> SEQ_BITS, server_unique_bins),
+        'request_lost': (request_lost >> SEQ_BITS, request_lost_bins),
+        'data_lost': (data_lost >> SEQ_BITS, server_unique_bins[data_lost_mask]),
+        'duplicates': (client_flow[duplicate], client_bins[duplicate]),
+        'reordered': (client_flow[reordered], client_bins[reordered]),
+    }
+    bin_frame = pd.DataFrame({
+        name: pd.Series(1, index=pd.MultiIndex.from_arrays([flows[f], b], names=['flow_id', 'bin']))
+        .groupby(level=[0, 1]).size()
+        for name, (f, b) in events.items()
+    }).fillna(0).astype(np.int64)
+    bin_frame.index = bin_frame.index.set_levels(
+        pd.to_datetime(bin_frame.index.levels[1] * bin_ns), level='bin')
+    return flow_frame, bin_frame
+
+def max_per_flow(flow_index: np.ndarray, values: np.ndarray, num_flows: int) -> np.ndarray:
+    """Maximum of values per flow, given flow indexes in sorted order (0 for absent flows)"""
+    result = np.zeros(num_flows, dtype=np.int64)
+    present = np.bincount(flow_index, minlength=num_flows) > 0
+    if present.any():
+        starts = np.searchsorted(flow_index, np.arange(num_flows))
+        result[present] = np.maximum.reduceat(values, starts[present])
+    return result
+
+def select_client_rows(client_df: pd.DataFrame, server_df: pd.DataFrame,
+                       client_flows: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    """Server rows of the client that wrote client_df, for server logs shared by several tests.
+
+    Each flow has its own client socket, so a (flow, client address) pair
+    belongs to this client if any of its packets is also in the client log.
+    When every flow has a single address, all pairs are taken as ours if
+    their flows are in the client log or in ``client_flows``.
+    """
+    if 'client_addr' not in server_df or not len(server_df):
+        return server_df
+    pairs = server_df[['flow_id', 'client_addr']].drop_duplicates()
+    ours = set(client_df['flow_id']) | set(client_flows if client_flows is not None else ())
+    if not pairs['flow_id'].duplicated().any() and pairs['flow_id'].isin(ours).all():
+        return server_df  # one address per flow, all of them ours
+    keys = ['flow_id', 'sequence_number', 'request_time']
+    matches = server_df[['client_addr'] + keys].merge(client_df[keys].drop_duplicates(), on=keys)
+    ours = pd.MultiIndex.from_frame(matches[['flow_id', 'client_addr']].drop_duplicates())
+    return server_df[pd.MultiIndex.from_frame(server_df[['flow_id', 'client_addr']]).isin(ours)]
+
+def attach_flow_ids(client_df: pd.DataFrame, server_df: pd.DataFrame) -> pd.DataFrame:
+    """Recover flow IDs for server logs that predate the flow_id column.
+
+    Each flow has its own client socket, so the client address identifies it;
+    the address is matched to a flow through packets present in both logs.
+    """
+    matches = server_df[['client_addr', 'sequence_number', 'request_time']].merge(
+        client_df[['flow_id', 'sequence_number', 'request_time']],
+        on=['sequence_number', 'request_time'])
+    mapping = matches.drop_duplicates('client_addr').set_index('client_addr')['flow_id']
+    server_df = server_df.assign(flow_id=server_df['client_addr'].map(mapping))
+    return server_df.dropna(subset=['flow_id']).astype({'flow_id': np.int64})
+
+class StreamingSequences:
+    """``sequence_metrics`` folded over log chunks, for logs too large to load at once.
+
+    Every sequence number costs five bytes: the server time bin of its first
+    send (int32, relative to the first bin seen) per (flow, client address)
+    of the server log, and whether it reached the client (bool) per flow.
+    Duplicates and reordering carry each flow's highest number across
+    chunks, taking log order as arrival order between chunks. Server rows of other clients are left out as in
+    ``select_client_rows``, matching a (flow, address) to this client by the
+    request times of a sample of the client's packets. Reordering extent
+    needs the whole arrival history, so it is not reported.
+
+    Feed every client chunk before the first server chunk.
+    """
+
+    SAMPLE_EVERY = 256  # client packets sampled to match server rows to this client
+    UNSEEN = np.iinfo(np.int32).min
+
+    def __init__(self, bin_seconds: float = 1.0):
+        self.bin_ns = int(bin_seconds * 1_000_000_000)
+        self.bin_base = None
+        self.client_seen = {}    # flow -> bool per sequence number
+        self.max_seq = {}        # flow -> highest number arrived so far
+        self.max_distance = {}   # flow -> largest reordering distance
+        self.samples = {}        # (sequence number, request time) -> flow, for the sampled client packets
+        self.server_bins = {}    # (flow, client address) -> first send bin per sequence number
+        self.pair_flow = {}      # (flow, client address) -> client flow its sampled rows matched
+        self.client_events = {'duplicates': [], 'reordered': []}  # per-chunk counts by (flow, bin)
+
+    def add_client_chunk(self, chunk: pd.DataFrame):
+        """Fold client rows in, flagging duplicates and reordering in arrival order"""
+        flow_ids = chunk['flow_id'].to_numpy()
+        times = chunk['timestamp'].to_numpy('datetime64[ns]').astype(np.int64)
+        order = arrival_order(flow_ids, times)
+        flow_ids = flow_ids[order]
+        seqs = chunk['sequence_number'].to_numpy(np.int64)[order]
+        bins = times[order] // self.bin_ns
+        starts = np.flatnonzero(np.r_[True, flow_ids[1:] != flow_ids[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(seqs)]):
+            self.add_client_flow(int(flow_ids[start]), seqs[start:end], bins[start:end])
+
+        sampled = seqs % self.SAMPLE_EVERY == 0
+        request_times = chunk['request_time'].to_numpy()[order]
+        for seq, request_time, flow in zip(seqs[sampled], request_times[sampled], flow_ids[sampled]):
+            self.samples[(int(seq), float(request_time))] = int(flow)
+
+    def add_client_flow(self, flow: int, seqs: np.ndarray, bins: np.ndarray):
+        """Fold one flow's rows of a client chunk in, in arrival order"""
+        seen = self.client_seen[flow] = grow(self.client_seen.get(flow, np.zeros(0, dtype=bool)),
+                                             int(seqs.max()) + 1, False)
+        duplicate = np.ones(len(seqs), dtype=bool)
+        duplicate[np.unique(seqs, return_index=True)[1]] = False
+        duplicate |= seen[seqs]
+        seen[seqs] = True
+
+        # Highest number before each arrival, including earlier chunks
+        carried = self.max_seq.get(flow, -1)
+        previous_max = np.maximum.accumulate(np.r_[carried, seqs])[:-1]
+        reordered = (seqs < previous_max) & ~duplicate
+        self.max_seq[flow] = max(carried, int(seqs.max()))
+        if reordered.any():
+            distance = int((previous_max - seqs)[reordered].max())
+            self.max_distance[flow] = max(self.max_distance.get(flow, 0), distance)
+
+        for name, mask in (('duplicates', duplicate), ('reordered', reordered)):
+            if mask.any():
+                counts = pd.Series(bins[mask]).value_counts()
+                counts.index = pd.MultiIndex.from_arrays([np.full(len(counts), flow), counts.index],
+                                                         names=['flow_id', 'bin'])
+                self.client_events[name].append(counts)
+
+    def add_server_chunk(self, chunk: pd.DataFrame):
+        """Record the first send bin of every sequence number, per flow and client address"""
+        bins = chunk['timestamp'].to_numpy('datetime64[ns]').astype(np.int64) // self.bin_ns
+        if self.bin_base is None:
+            self.bin_base = int(bins.min())
+        bins = (bins - self.bin_base).astype(np.int32)
+        seqs = chunk['sequence_number'].to_numpy(np.int64)
+        request_times = chunk['request_time'].to_numpy()
+        # Logs from before flow IDs were logged are matched to a flow by address alone
+        pairs = pd.DataFrame({'flow': chunk['flow_id'] if 'flow_id' in chunk else -1,
+                              'addr': chunk['client_addr'] if 'client_addr' in chunk else ''}, index=chunk.index)
+        for (flow, addr), rows in pairs.groupby(['flow', 'addr']).indices.items():
+            pair = (int(flow), addr)
+            pair_seqs = seqs[rows]
+            unique, first = np.unique(pair_seqs, return_index=True)
+            table = self.server_bins[pair] = grow(self.server_bins.get(pair, np.zeros(0, dtype=np.int32)),
+                                                  int(unique[-1]) + 1, self.UNSEEN)
+            new = table[unique] == self.UNSEEN
+            table[unique[new]] = bins[rows][first[new]]
+
+            if pair not in self.pair_flow:
+                sampled = pair_seqs % self.SAMPLE_EVERY == 0
+                for seq, request_time in zip(pair_seqs[sampled], request_times[rows][sampled]):
+                    matched = self.samples.get((int(seq), float(request_time)))
+                    if matched is not None and pair[0] in (matched, -1):
+                        self.pair_flow[pair] = matched
+                        break
+
+    def client_pairs(self, client_flows: Iterable[int] = ()) -> dict:
+        """(flow, client address) pairs of this client's server rows, mapped to their flow"""
+        flows = [flow for flow, _ in self.server_bins]
+        ours = set(self.client_seen) | set(client_flows)
+        if -1 not in flows and len(set(flows)) == len(flows) and set(flows) <= ours:
+            return {pair: pair[0] for pair in self.server_bins}  # one address per flow, all of them ours
+        return self.pair_flow
+
+    def frames(self, sent: Optional[pd.Series] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Per-flow and per-(flow, time bin) counts, as ``sequence_metrics`` returns them"""
+        logged_flows = [int(flow) for flow in sent.index] if sent is not None else []
+        server = {}
+        for pair, flow in self.client_pairs(logged_flows).items():
+            table = self.server_bins[pair]
+            server[flow] = table if flow not in server else self.first_send(server[flow], table)
+        flows = sorted(set(self.client_seen) | set(server) | set(logged_flows))
+        first_bin = min((int(table[table != self.UNSEEN].min()) for table in server.values()
+                         if (table != self.UNSEEN).any()), default=0)
+
+        rows = []
+        events = {'requests_received': [], 'request_lost': [], 'data_lost': []}
+        for flow in flows:
+            send_bins = server.get(flow, np.zeros(0, dtype=np.int32))
+            arrived = self.client_seen.get(flow, np.zeros(0, dtype=bool))
+            size = max(len(send_bins), len(arrived))
+            send_bins = grow(send_bins, size, self.UNSEEN)[:size]
+            arrived = grow(arrived, size, False)[:size]
+            at_server = send_bins != self.UNSEEN
+            received = at_server | arrived
+
+            # A flow sent at least up to the highest number seen anywhere, and as many as its client logged
+            flow_sent = int(np.flatnonzero(received)[-1]) + 1 if received.any() else 0
+            if sent is not None and flow in sent.index:
+                flow_sent = max(flow_sent, int(sent[flow]))
+            received = grow(received, flow_sent, False)
+            request_lost = np.flatnonzero(~received[:flow_sent])
+            data_lost = at_server & ~arrived
+
+            # Bin a lost request with the last request of the flow that arrived before it
+            server_seqs = np.flatnonzero(at_server)
+            if len(server_seqs):
+                before = np.searchsorted(server_seqs, request_lost) - 1
+                request_lost_bins = np.where(before >= 0, send_bins[server_seqs[np.maximum(before, 0)]], first_bin)
+            else:
+                request_lost_bins = np.full(len(request_lost), first_bin)
+
+            for name, event_bins in (('requests_received', send_bins[at_server]),
+                                     ('request_lost', request_lost_bins),
+                                     ('data_lost', send_bins[data_lost])):
+                counts = pd.Series(event_bins.astype(np.int64) + (self.bin_base or 0)).value_counts()
+                counts.index = pd.MultiIndex.from_arrays([np.full(len(counts), flow), counts.index],
+                                                         names=['flow_id', 'bin'])
+                events[name].append(counts)
+            rows.append({
+                'packets_sent': flow_sent,
+                'requests_received': int(received.sum()),
+                'request_lost': len(request_lost),
+                'data_received': int(arrived.sum()),
+                'data_lost': int(data_lost.sum()),
+                'max_reorder_extent': np.nan,
+                'max_reorder_distance': self.max_distance.get(flow, 0),
+            })
+        events.update(self.client_events)
+
+        bin_frame = pd.DataFrame({
+            name: pd.concat(parts).groupby(level=[0, 1]).sum() if parts else
+            pd.Series(dtype=np.int64, index=pd.MultiIndex.from_arrays([[], []], names=['flow_id', 'bin']))
+            for name, parts in events.items()
+        }).fillna(0).astype(np.int64)
+        bin_frame.index = bin_frame.index.set_levels(
+            pd.to_datetime(bin_frame.index.levels[1] * self.bin_ns), level='bin')
+
+        flow_frame = pd.DataFrame(rows, index=pd.Index(flows, name='flow_id'), columns=[
+            'packets_sent', 'requests_received', 'request_lost', 'data_received', 'data_lost', 'duplicates',
+            'reordered', 'max_reorder_extent', 'max_reorder_distance'])
+        per_flow = bin_frame.groupby(level='flow_id').sum()
+        for name in self.client_events:
+            flow_frame[name] = per_flow[name].reindex(flow_frame.index, fill_value=0)
+        flow_frame['loss_rate'] = (flow_frame['request_lost'] + flow_frame['data_lost']) / \
+            flow_frame['packets_sent'] * 100
+        return flow_frame, bin_frame
+
+    def first_send(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """Earliest send bin per sequence number of two tables of the same flow"""
+        size = max(len(a), len(b))
+        a, b = grow(a, size, self.UNSEEN)[:size], grow(b, size, self.UNSEEN)[:size]
+        return np.where(a == self.UNSEEN, b, np.where(b == self.UNSEEN, a, np.minimum(a, b)))
+
+def grow(array: np.ndarray, size: int, fill) -> np.ndarray:
+    """The array, padded with fill to at least size (at least doubling, so growth is amortised)"""
+    if len(array) >= size:
+        return array
+    grown = np.full(max(size, 2 * len(array)), fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
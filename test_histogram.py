@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pytest
+
+from histogram import LogHistogram
+
+def test_merged_chunks_match_a_single_histogram():
+    values = np.random.default_rng(1).lognormal(mean=1.0, sigma=1.5, size=10_000)
+    single = LogHistogram()
+    single.add(values)
+    merged = LogHistogram()
+    for chunk in np.array_split(values, 7):
+        part = LogHistogram()
+        part.add(chunk)
+        merged.merge(part)
+
+    np.testing.assert_array_equal(merged.counts, single.counts)
+    assert merged.count == single.count
+    assert merged.min == single.min and merged.max == single.max
+    assert merged.mean() == pytest.approx(single.mean())
+    assert merged.std() == pytest.approx(single.std())
+    for q in (0.5, 0.95, 0.99):
+        assert merged.quantile(q) == single.quantile(q)
+
+def test_quantiles_within_precision():
+    values = np.random.default_rng(2).uniform(0.5, 500.0, size=50_000)
+    histogram = LogHistogram()
+    histogram.add(values)
+    for q in (0.1, 0.5, 0.9, 0.99):
+        assert histogram.quantile(q) == pytest.approx(np.quantile(values, q), rel=0.01)
+
+def test_record_matches_add_and_ignores_nan():
+    values = [0.0, 0.002, 1.5, 42.0, float('nan'), 3e6]
+    recorded = LogHistogram()
+    for value in values:
+        recorded.record(value)
+    added = LogHistogram()
+    added.add(values)
+    np.testing.assert_array_equal(recorded.counts, added.counts)
+    assert recorded.count == added.count == 5
+
+def test_merge_rejects_other_layouts():
+    with pytest.raises(ValueError):
+        LogHistogram().merge(LogHistogram(precision=0.02))
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pytest
+
+from jitter import BLOCK, JITTER_GAIN, interarrival_jitter, smoothed_jitter
+
+def reference_jitter(abs_d, groups, initial=None):
+    """The RFC 3550 recurrence one packet at a time (groups numbered 0, 1, ...)"""
+    jitter = np.empty(len(abs_d))
+    current = None
+    for i, (d, group) in enumerate(zip(abs_d, groups)):
+        if group != current:
+            current = group
+            j = initial[group] if initial is not None else 0.0
+        j += (d - j) * JITTER_GAIN
+        jitter[i] = j
+    return jitter
+
+@pytest.mark.parametrize('sizes', [[1], [BLOCK], [BLOCK + 1, 3, 5 * BLOCK - 7], [10 * BLOCK + 17]])
+def test_block_recurrence_matches_per_packet_loop(sizes):
+    rng = np.random.default_rng(len(sizes))
+    groups = np.repeat(np.arange(len(sizes)), sizes)
+    abs_d = rng.exponential(2.0, size=len(groups))
+    np.testing.assert_allclose(smoothed_jitter(abs_d, groups), reference_jitter(abs_d, groups),
+                               rtol=1e-9, atol=1e-12)
+
+def test_initial_jitter_is_carried_into_each_group():
+    rng = np.random.default_rng(3)
+    sizes = [2 * BLOCK + 5, 7]
+    groups = np.repeat(np.arange(len(sizes)), sizes)
+    abs_d = rng.exponential(1.0, size=len(groups))
+    initial = np.array([4.0, 0.5])
+    np.testing.assert_allclose(smoothed_jitter(abs_d, groups, initial), reference_jitter(abs_d, groups, initial),
+                               rtol=1e-9, atol=1e-12)
+
+def test_chunked_interarrival_jitter_matches_one_pass():
+    rng = np.random.default_rng(4)
+    n = 3000
+    flow_ids = rng.integers(0, 3, size=n)
+    send = np.cumsum(rng.uniform(0.0005, 0.0015, size=n))
+    receive = send + 0.01 + rng.exponential(0.002, size=n)
+
+    order, jitter = interarrival_jitter(flow_ids, send, receive)
+    whole = np.empty(n)
+    whole[order] = jitter
+
+    state = {}
+    chunked = np.empty(n)
+    for start in range(0, n, 700):
+        part = slice(start, start + 700)
+        order, jitter = interarrival_jitter(flow_ids[part], send[part], receive[part], state)
+        chunked[np.arange(start, min(start + 700, n))[order]] = jitter
+    np.testing.assert_allclose(chunked, whole, rtol=1e-9, atol=1e-12)
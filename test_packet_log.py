@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+
+from analyze_results import read_log_file
+from packet_log import SERVER_LOG_COLUMNS, open_packet_log, read_binary_header
+
+def server_rows(count: int) -> list:
+    rows = []
+    for i in range(count):
+        send_time = 1_700_000_000.0 + i * 0.001
+        rows.append((send_time, ('10.0.0.2', 40000 + i % 3), i % 3, i, send_time - 0.002, send_time,
+                     send_time + 0.004 if i % 2 else None, None, None, 1400 - i % 5))
+    return rows
+
+def write_log(path: str, log_format: str, rows: list):
+    log = open_packet_log(path, SERVER_LOG_COLUMNS, log_format, batch_size=64)
+    for row in rows:
+        log.write(row)
+    log.close()
+    assert log.rows_written == len(rows)
+    assert log.dropped_rows == 0
+
+def test_binary_log_round_trips_like_csv(tmp_path):
+    rows = server_rows(1000)
+    write_log(str(tmp_path / 'server_log.csv'), 'csv', rows)
+    write_log(str(tmp_path / 'server_log.bin'), 'binary', rows)
+
+    header = read_binary_header(str(tmp_path / 'server_log.bin'))
+    assert header['records'] == len(rows)
+    assert read_binary_header(str(tmp_path / 'server_log.csv')) is None
+
+    csv_df = read_log_file(str(tmp_path / 'server_log.csv'))
+    binary_df = read_log_file(str(tmp_path / 'server_log.bin'))
+    assert list(binary_df.columns) == list(csv_df.columns)
+
+    for name in ('flow_id', 'sequence_number', 'packet_size'):
+        np.testing.assert_array_equal(binary_df[name].to_numpy(), csv_df[name].to_numpy())
+    # Floats are stored exactly and missing ones come back as NaN
+    for index, name in ((4, 'request_time'), (5, 'send_time'), (6, 'ack_time'), (7, 'rtt_ms')):
+        expected = np.array([np.nan if row[index] is None else row[index] for row in rows])
+        np.testing.assert_array_equal(binary_df[name].to_numpy(np.float64), expected)
+        np.testing.assert_allclose(csv_df[name].to_numpy(np.float64), expected, rtol=1e-15)
+    # Binary addresses are IPv4 << 16 | port
+    ports = csv_df['client_addr'].str.split(':').str[1].astype(np.int64)
+    addrs = binary_df['client_addr'].to_numpy()
+    np.testing.assert_array_equal(addrs & 0xFFFF, ports.to_numpy())
+    assert (addrs >> 16 == (10 << 24) + 2).all()
+    # Same local wall-clock timestamps, to the microsecond CSV keeps
+    difference = (binary_df['timestamp'] - pd.to_datetime(csv_df['timestamp'])).abs()
+    assert difference.max() <= pd.Timedelta(microseconds=1)
+
+def test_truncated_binary_record_is_ignored(tmp_path):
+    path = str(tmp_path / 'server_log.bin')
+    write_log(path, 'binary', server_rows(10))
+    with open(path, 'ab') as f:
+        f.write(b'\0' * 5)
+    header = read_binary_header(path)
+    assert header['records'] == 10
+    assert len(read_log_file(path)) == 10
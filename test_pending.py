@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+from pending import PendingWindow
+
+def test_pop_returns_timestamp_once():
+    window = PendingWindow(window=8, timeout=1.0)
+    window.add(3, 10.0)
+    assert window.pop(3) == 10.0
+    assert window.pop(3) is None
+    assert len(window) == 0
+
+def test_slot_reuse_evicts_and_expire_reports_it():
+    window = PendingWindow(window=4, timeout=1.0)
+    for seq in range(4):
+        window.add(seq, 10.0)
+    # Sequence numbers 4 and 5 reuse the slots of 0 and 1, which were never answered
+    window.add(4, 10.5)
+    window.add(5, 10.5)
+    assert len(window) == 4
+    assert window.pop(0) is None
+    assert window.pop(4) == 10.5
+    assert window.expire(10.6) == 2
+    assert window.expired == 2
+    # Evictions are reported once
+    assert window.expire(10.6) == 0
+
+def test_expire_drops_only_entries_past_the_timeout():
+    window = PendingWindow(window=16, timeout=1.0)
+    window.add(0, 10.0)
+    window.add(1, 10.0)
+    window.add(2, 11.5)
+    window.pop(1)
+    assert window.expire(11.6) == 1
+    assert len(window) == 1
+    assert window.pop(2) == 11.5
+    assert window.expire(20.0) == 0
+    assert window.expired == 1
+
+def test_late_add_below_head_is_ignored():
+    window = PendingWindow(window=4, timeout=1.0)
+    for seq in range(8):
+        window.add(seq, 10.0)
+    window.add(1, 10.0)
+    assert window.pop(1) is None
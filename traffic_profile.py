@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+"""Time-varying send schedules for the client.
+
+A profile combines a rate *shape* (per-flow Mbps as a function of time)
+with an *arrival process*. Each flow's schedule is generated one window of
+``SCHEDULE_WINDOW`` seconds at a time, as int64 arrays of send offsets in
+nanoseconds, so memory stays flat whatever the run duration:
+
+1. the shape is evaluated on a fine time grid over the window and
+   integrated into the cumulative expected packet count ``L(t)``, carried
+   over from the previous window
+2. arrival "positions" are drawn in count space: ``0, 1, 2, ...`` for
+   paced sending, cumulative Exp(1) gaps for Poisson, cumulative unit-mean
+   Pareto gaps for heavy-tailed bursts
+3. each position ``k`` is mapped back to time through ``L^-1(k)``
+   (time rescaling), which turns a unit-rate process into one that follows
+   the shape; positions are drawn in chunks and those past the window wait
+   for the next one
+
+Profiles are written as ``shape[:p1,p2,...][+arrivals[:alpha]]``, e.g.
+``sine:50,20,10+poisson`` or ``onoff:0.5,1.5+pareto:1.5``, or loaded from a
+JSON file with the same fields (``shape``, ``params``, ``arrivals``,
+``alpha``, ``phase``, ``seed``).
+"""
+
+import json
+import os
+from typing import Iterator, Optional, Sequence
+
+import numpy as np
+
+# Shape name -> parameter names (rates in Mbps per flow, times in seconds)
+SHAPES = {
+    'constant': ('rate',),              # the --bandwidth rate unless given
+    'steps': None,                      # any number of rates, equal-length steps over the run
+    'ramp': ('start', 'end'),           # linear from start to end over the run
+    'sine': ('mean', 'amplitude', 'period'),
+    'onoff': ('on', 'off', 'rate'),     # rate (default --bandwidth) for `on` s, silent for `off` s
+}
+ARRIVALS = ('paced', 'poisson', 'pareto')
+
+# Resolution of the rate integration
+GRID_SECONDS = 0.0001
+# Seconds of schedule generated at a time
+SCHEDULE_WINDOW = 1.0
+# Arrival positions drawn at a time
+POSITION_CHUNK = 65536
+# Samples used to average the rate shape for logging
+MEAN_RATE_SAMPLES = 10_000
+
+class TrafficProfile:
+    """Rate shape plus arrival process; ``send_offsets`` builds one flow's schedule"""
+
+    def __init__(self, shape: str = 'constant', params: Sequence[float] = (), arrivals: str = 'paced',
+                 alpha: float = 1.5, phase: float = 0.0, seed: Optional[int] = None):
+        if shape not in SHAPES:
+            raise ValueError(f"Unknown traffic shape: {shape} (expected one of {', '.join(SHAPES)})")
+        if arrivals not in ARRIVALS:
+            raise ValueError(f"Unknown arrival process: {arrivals} (expected one of {', '.join(ARRIVALS)})")
+        names = SHAPES[shape]
+        if names is not None and len(params) > len(names):
+            raise ValueError(f"Shape {shape} takes at most {len(names)} parameters: {', '.join(names)}")
+        if shape == 'steps' and not params:
+            raise ValueError("Shape steps needs at least one rate")
+        if shape == 'sine' and len(params) < 3:
+            raise ValueError("Shape sine needs mean, amplitude and period")
+        if shape == 'sine' and params[2] <= 0:
+            raise ValueError("Shape sine needs a positive period")
+        if shape == 'onoff' and len(params) < 2:
+            raise ValueError("Shape onoff needs on and off durations")
+        if shape == 'onoff' and (params[0] < 0 or params[1] < 0 or params[0] + params[1] <= 0):
+            raise ValueError("Shape onoff needs non-negative on and off durations with a positive sum")
+        if shape == 'ramp' and len(params) < 2:
+            raise ValueError("Shape ramp needs start and end rates")
+        if arrivals == 'pareto' and alpha <= 1:
+            raise ValueError("Pareto arrivals need alpha > 1 for a finite mean")
+        self.shape = shape
+        self.params = [float(p) for p in params]
+        self.arrivals = arrivals
+        self.alpha = alpha
+        self.phase = phase    # per-flow time shift: flow i sees the shape at t + i * phase
+        self.seed = seed
+
+    def __repr__(self) -> str:
+        params = ','.join(f"{p:g}" for p in self.params)
+        arrivals = f"+pareto:{self.alpha:g}" if self.arrivals == 'pareto' else f"+{self.arrivals}"
+        return f"{self.shape}{':' + params if params else ''}{arrivals}"
+
+    def rate_mbps(self, t: np.ndarray, duration: float, bandwidth_mbps: float) -> np.ndarray:
+        """Per-flow rate at times t (seconds from the start of the run)"""
+        p = self.params
+        if self.shape == 'constant':
+            return np.full(len(t), p[0] if p else bandwidth_mbps)
+        if self.shape == 'steps':
+            index = np.clip((t / duration * len(p)).astype(np.int64), 0, len(p) - 1)
+            return np.asarray(p)[index]
+        if self.shape == 'ramp':
+            return p[0] + (p[1] - p[0]) * np.clip(t / duration, 0, 1)
+        if self.shape == 'sine':
+            return np.maximum(0.0, p[0] + p[1] * np.sin(2 * np.pi * t / p[2]))
+        # onoff
+        rate = p[2] if len(p) > 2 else bandwidth_mbps
+        return np.where(np.mod(t, p[0] + p[1]) < p[0], rate, 0.0)
+
+    def mean_rate_mbps(self, flow_id: int, duration: float, bandwidth_mbps: float) -> float:
+        """Per-flow rate averaged over the run"""
+        t = (np.arange(MEAN_RATE_SAMPLES) + 0.5) * duration / MEAN_RATE_SAMPLES + flow_id * self.phase
+        return float(self.rate_mbps(t, duration, bandwidth_mbps).mean())
+
+    def send_offsets(self, flow_id: int, duration: float, bandwidth_mbps: float,
+                     packet_size: float) -> Iterator[np.ndarray]:
+        """Send times of one flow in nanoseconds from the start, within [0, duration), one window at a time"""
+        positions = self.positions(flow_id)
+        pending = np.empty(0)     # drawn positions not yet reached
+        expected_start = 0.0      # L at the start of the window
+        windows = max(1, int(np.ceil(duration / SCHEDULE_WINDOW)))
+        for window in range(windows):
+            start = window * SCHEDULE_WINDOW
+            end = min(duration, start + SCHEDULE_WINDOW)
+            steps = max(1, int(np.ceil((end - start) / GRID_SECONDS)))
+            dt = (end - start) / steps
+            edges = start + np.arange(steps + 1) * dt
+            # Packets per second on each grid cell, sampled at its middle
+            pps = self.rate_mbps(edges[:-1] + dt / 2 + flow_id * self.phase, duration, bandwidth_mbps) * \
+                1_000_000 / (packet_size * 8)
+            expected = np.empty(steps + 1)
+            expected[0] = expected_start
+            np.cumsum(pps * dt, out=expected[1:])
+            expected[1:] += expected_start
+
+            while not len(pending) or pending[-1] < expected[-1]:
+                pending = np.concatenate((pending, next(positions)))
+            split = np.searchsorted(pending, expected[-1], side='left')
+            taken, pending = pending[:split], pending[split:]
+            # Cell holding each position; its rate is positive since L grows across it
+            cell = np.searchsorted(expected, taken, side='right') - 1
+            times = edges[cell] + (taken - expected[cell]) / pps[cell]
+            expected_start = expected[-1]
+            yield (times * 1_000_000_000).astype(np.int64)
+
+    def positions(self, flow_id: int) -> Iterator[np.ndarray]:
+        """Arrival positions in expected-packet-count space, as an endless series of increasing chunks"""
+        if self.arrivals == 'paced':
+            for first in range(0, 2 ** 62, POSITION_CHUNK):
+                yield np.arange(first, first + POSITION_CHUNK, dtype=np.float64)
+        rng = np.random.default_rng(None if self.seed is None else self.seed + flow_id)
+        position = 0.0
+        while True:
+            if self.arrivals == 'poisson':
+                gaps = rng.exponential(1.0, POSITION_CHUNK)
+            else:
+                # Lomax + 1 is Pareto with x_m = 1; rescale to a unit mean
+                gaps = (rng.pareto(self.alpha, POSITION_CHUNK) + 1) * (self.alpha - 1) / self.alpha
+            chunk = position + np.cumsum(gaps)
+            position = chunk[-1]
+            yield chunk
+
+def parse_traffic_profile(spec: str) -> TrafficProfile:
+    """Build a profile from an expression or a JSON file path"""
+    if os.path.isfile(spec):
+        with open(spec) as f:
+            fields = json.load(f)
+        return TrafficProfile(fields.get('shape', 'constant'), fields.get('params', ()),
+                              fields.get('arrivals', 'paced'), fields.get('alpha', 1.5),
+                              fields.get('phase', 0.0), fields.get('seed'))
+
+    shape_part, _, arrivals_part = spec.partition('+')
+    shape, _, params = shape_part.partition(':')
+    arrivals, _, alpha = arrivals_part.partition(':')
+    try:
+        params = [float(p) for p in params.split(',') if p]
+        alpha = float(alpha) if alpha else 1.5
+    except ValueError:
+        raise ValueError(f"Invalid traffic profile: {spec}")
+    return TrafficProfile(shape.strip(), params, arrivals.strip() or 'paced', alpha)
@@ -3,16 +3,36 @@
 import asyncio
 import argparse
 import csv
+import functools
+import json
 import logging
+import multiprocessing
+import queue
+import signal
 import socket
-import struct
 import time
-from datetime import datetime
-from typing import Dict, List, Optional
+import uuid
+from typing import Dict, List, Optional, Tuple
 import os
 import sys
 from tqdm import tqdm
 
+from clock_offset import clock_sync_path
+from histogram import LogHistogram
+from io_engine import EVENT_LOOPS, IO_ENGINES, create_datagram_endpoint, event_loop_name, install_event_loop
+from instrumentation import HotPathProfiler
+from jitter import JITTER_GAIN
+from live_metrics import LiveMetrics
+from packet_log import LOG_EXTENSIONS, LOG_FORMATS, CLIENT_LOG_COLUMNS, open_packet_log, shard_log_path
+from pacer import CATCH_UP_POLICIES, Pacer, SchedulePacer
+from payload import mean_packet_size, packet_size_cycle, parse_packet_sizes
+from pending import PendingWindow
+from sequence_analysis import sent_counts_path
+from traffic_profile import TrafficProfile, parse_traffic_profile
+from wire import (WIRE_VERSION, MSG_REQUEST, MSG_DATA, MSG_ACK, MSG_CONTROL, MSG_UPLOAD, MSG_UPLOAD_ACK,
+                  REQUEST, DATA_HEADER, ACK, UPLOAD, UPLOAD_ACK, CONTROL_HEADER, CTRL_SYNC, CTRL_HELLO,
+                  CTRL_HELLO_ACK, CTRL_BYE, CTRL_CONFIRM, SYNC, HELLO, SESSION, CONFIRM, TEST_ID_PATTERN)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -20,24 +40,89 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# down: request/DATA download test; up: the client streams upload packets; bidir: both on every flow
+DIRECTIONS = ('down', 'up', 'bidir')
+
+# Spacing of the startup clock sync probes
+CLOCK_SYNC_INTERVAL = 0.01
+# Seconds between HELLO retries for flows the server has not acknowledged yet
+SESSION_RETRY_INTERVAL = 0.2
+
 class UDPClient:
     def __init__(self, server_ip: str, server_port: int, num_flows: int,
-                 duration: int, bandwidth_mbps: float, packet_size: int, log_file: str):
+                 duration: int, bandwidth_mbps: float, packet_size: int, log_file: str,
+                 pending_timeout: float = 2.0, pending_window: int = 16384,
+                 burst: int = 1, catch_up: str = 'burst',
+                 io_engine: str = 'asyncio', batch_size: int = 64,
+                 kernel_timestamps: bool = False, log_format: str = 'csv',
+                 metrics_host: str = '127.0.0.1', metrics_port: Optional[int] = None,
+                 profile: bool = False, collect_rtt: bool = False,
+                 traffic_profile: Optional[TrafficProfile] = None, direction: str = 'down',
+                 responses: int = 1, response_gap_us: int = 0, clock_sync: int = 0,
+                 test_id: Optional[str] = None, packet_sizes: Optional[List[Tuple[int, int]]] = None,
+                 flow_ids: Optional[List[int]] = None,
+                 start_barrier: Optional[multiprocessing.Barrier] = None,
+                 start_ns: Optional[multiprocessing.Value] = None,
+                 results_queue: Optional[multiprocessing.Queue] = None):
         self.server_ip = server_ip
         self.server_port = server_port
         self.num_flows = num_flows
         self.duration = duration
         self.bandwidth_mbps = bandwidth_mbps
-        self.packet_size = packet_size
+        # Packet size mix as (size, weight) pairs; rates are computed from its mean
+        self.packet_sizes = packet_sizes or [(packet_size, 1)]
+        self.packet_size = mean_packet_size(self.packet_sizes)
+        self.max_packet_size = max(size for size, _ in self.packet_sizes)
         self.log_file = log_file
+        self.pending_timeout = pending_timeout
+        self.pending_window = pending_window
+        self.burst = burst
+        self.catch_up = catch_up
+        self.io_engine = io_engine
+        self.batch_size = batch_size
+        self.kernel_timestamps = kernel_timestamps
+        self.log_format = log_format
+        self.metrics_host = metrics_host
+        self.metrics_port = metrics_port
+        # Per-flow counters and RTT histograms served over HTTP (off unless a port is given)
+        self.metrics = LiveMetrics('client') if metrics_port else None
+        # Sampled hot-path timings, loop lag, GC and socket drops (--profile)
+        self.profiler = HotPathProfiler('client') if profile else None
+        # Whole-run RTT distribution across all flows, for --find-max trials
+        self.rtt_histogram = LogHistogram() if collect_rtt else None
+        # Time-varying send schedule; constant-rate pacing when None
+        self.traffic_profile = traffic_profile
+        self.direction = direction
+        # DATA packets per request and their spacing; each request covers `responses` sequence numbers
+        self.responses = max(1, responses)
+        self.response_gap_us = response_gap_us
+        # Startup clock sync probes and their (t1, t2, t3, t4) replies
+        self.clock_sync = clock_sync
+        self.sync_replies = []
+        # Test session on the server (HELLO handshake and BYE); none when test_id is None
+        self.test_id = test_id
+        self.session_flows = set()  # Flow IDs whose address the server confirmed
+        # RTT of upload packets, sampled from the server's batched UPLOAD_ACKs
+        self.upload_rtt = LogHistogram()
+        # Flow IDs run by this process; a slice of range(num_flows) in multi-process mode
+        self.flow_ids = list(flow_ids) if flow_ids is not None else list(range(num_flows))
+        self.start_barrier = start_barrier
+        self.start_ns = start_ns
+        self.results_queue = results_queue  # Set in multi-process mode: final stats go to the parent
+        self.protocols = []
+        self.event_loop = None  # Name of the running event loop, set on start
         
         # Calculate packets per second per flow
-        self.packets_per_second = (bandwidth_mbps * 1_000_000) / (packet_size * 8)
+        self.packets_per_second = (bandwidth_mbps * 1_000_000) / (self.packet_size * 8)
         self.packet_interval = 1.0 / self.packets_per_second
+        self.requests_per_second = self.packets_per_second / self.responses
         
         self.stats = {
             'packets_received': 0,
             'bytes_received': 0,
+            'packets_lost': 0,  # Cumulative; requests with no DATA before the timeout
+            'total_packets_received': 0,  # Updated from the interval counters on each report
+            'total_bytes_received': 0,
             'start_time': None,
             'last_stats_time': None,
             'flow_stats': {}
@@ -46,19 +131,9 @@ class UDPClient:
         # Create results directory if it doesn't exist
         os.makedirs('results', exist_ok=True)
         
-        # Initialize log file with headers
+        # Open the packet log once for the whole run
         try:
-            with open(self.log_file, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    'timestamp',
-                    'flow_id',
-                    'sequence_number',
-                    'request_time',
-                    'server_send_time',
-                    'receive_time',
-                    'rtt_ms'
-                ])
+            self.packet_log = open_packet_log(self.log_file, CLIENT_LOG_COLUMNS, self.log_format)
         except Exception as e:
             logger.error(f"Failed to initialize log file: {e}")
             sys.exit(1)
@@ -69,31 +144,82 @@ class UDPClient:
             self.flow_id = flow_id
             self.transport = None
             self.sequence_number = 0
-            self.pending_requests = {}
+            # Sequence numbers per scheduled send: DATA packets per request as granted by the server
+            # (one without a confirmed session), or the upload packets per send in upload-only runs
+            self.responses = client.responses if client.direction == 'up' or client.responses == 1 else 1
+            self.pending_requests = PendingWindow(client.pending_window, client.pending_timeout)
             self.start_time = None
             self.is_running = False
-            self.next_request_time = 0
+            if client.traffic_profile is not None:
+                # The schedule is generated a window at a time as the run reaches it
+                # One scheduled send covers `responses` packets
+                profile = client.traffic_profile
+                send_size = client.packet_size * client.responses
+                windows = profile.send_offsets(flow_id, client.duration, client.bandwidth_mbps, send_size)
+                rate_pps = profile.mean_rate_mbps(flow_id, client.duration, client.bandwidth_mbps) * \
+                    1_000_000 / (send_size * 8)
+                self.pacer = SchedulePacer(windows, client.duration, rate_pps, client.burst, client.catch_up)
+            else:
+                self.pacer = Pacer(client.requests_per_second, client.burst, client.catch_up)
+            self.metrics = client.metrics.flow(flow_id) if client.metrics is not None else None
+            self.profiler = client.profiler
+            self.send_requests = client.direction != 'up'
+            # Size of each scheduled send's packets, cycled through in shuffled order
+            self.size_cycle = packet_size_cycle(client.packet_sizes, flow_id)
+            # Preallocated upload packet for the largest size; smaller packets send a prefix of it
+            self.upload_buffer = None
+            if client.direction != 'down':
+                self.upload_buffer = memoryview(bytearray(max(client.max_packet_size, UPLOAD.size)))
+            self.uploads_sent = 0
+            self.uploads_received = 0  # Confirmed by the server's cumulative counts
+            self.upload_bytes_received = 0
+            # RFC 3550 interarrival jitter of DATA packets, from their transit times
+            self.jitter_ms = 0.0
+            self.last_transit = None
 
         def connection_made(self, transport):
             self.transport = transport
             self.start_time = time.time()
-            self.next_request_time = self.start_time
             self.is_running = True
             logger.info(f"Flow {self.flow_id}: Connected to server {self.client.server_ip}:{self.client.server_port}")
 
-        def datagram_received(self, data, addr):
+        def datagram_received(self, data, addr, kernel_time: Optional[float] = None):
             try:
-                # Parse data packet
-                seq_num, request_time, server_send_time = struct.unpack('!Qdd', data[:24])
-                payload = data[24:]
-                
+                span = self.profiler.span() if self.profiler is not None else None
                 # Calculate RTT
                 current_time = time.time()
+                
+                # Parse data packet
+                if data[0] != WIRE_VERSION:
+                    return
+                if data[1] != MSG_DATA:
+                    if data[1] == MSG_UPLOAD_ACK:
+                        self.upload_ack_received(data, current_time)
+                    elif data[1] == MSG_CONTROL:
+                        self.client.control_received(self, data, current_time)
+                    return
+                _, _, _, seq_num, request_time, server_send_time = DATA_HEADER.unpack_from(data)
+                if span:
+                    span.mark('parse')
+                
                 rtt = (current_time - request_time) * 1000  # Convert to milliseconds
+                transit = current_time - server_send_time
+                if self.last_transit is not None:
+                    self.jitter_ms += (abs(transit - self.last_transit) * 1000 - self.jitter_ms) * JITTER_GAIN
+                self.last_transit = transit
                 
                 # Update statistics
                 self.client.stats['packets_received'] += 1
                 self.client.stats['bytes_received'] += len(data)
+                if self.metrics is not None:
+                    self.metrics.packets_received += 1
+                    self.metrics.bytes_received += len(data)
+                    self.metrics.record_rtt(rtt)
+                    self.metrics.jitter_ms = self.jitter_ms
+                if self.client.rtt_histogram is not None:
+                    self.client.rtt_histogram.record(rtt)
+                if span:
+                    span.mark('stats')
                 
                 # Log packet reception
                 self.client.log_packet(
@@ -102,86 +228,176 @@ class UDPClient:
                     request_time,
                     server_send_time,
                     current_time,
-                    rtt
+                    rtt,
+                    kernel_time,
+                    len(data)
                 )
+                if span:
+                    span.mark('log')
                 
                 # Remove from pending requests
-                if seq_num in self.pending_requests:
-                    del self.pending_requests[seq_num]
+                self.pending_requests.pop(seq_num)
                 
                 # Send ACK
-                ack_data = struct.pack('!Qd', seq_num, current_time)
+                ack_data = ACK.pack(WIRE_VERSION, MSG_ACK, self.flow_id, seq_num, current_time)
                 self.transport.sendto(ack_data, addr)
+                if span:
+                    span.mark('ack_send')
                 
             except Exception as e:
                 logger.error(f"Flow {self.flow_id}: Error processing data packet: {e}")
 
-        async def request_data(self):
+        def upload_ack_received(self, data, receive_time: float):
+            """Take the server's receive counts and an RTT sample from a batched UPLOAD_ACK"""
+            _, _, _, _, send_time, server_receive_time, server_send_time, packets, nbytes = \
+                UPLOAD_ACK.unpack_from(data)
+            # As with SYNC, leave out the time the server held the packet before acknowledging it
+            hold_time = server_send_time - server_receive_time
+            self.client.upload_rtt.record((receive_time - send_time - hold_time) * 1000)
+            # Counts are cumulative, so a reordered or lost ACK is harmless
+            if packets > self.uploads_received:
+                self.uploads_received = packets
+                self.upload_bytes_received = nbytes
+
+        def datagrams_received(self, datagrams):
+            """Process a batch of (data, addr, kernel_time) tuples from a batching I/O engine"""
+            for data, addr, kernel_time in datagrams:
+                self.datagram_received(data, addr, kernel_time)
+
+        async def request_data(self, start_ns: Optional[int] = None):
             """Request data packets from the server at the specified rate"""
             if not self.is_running:
                 logger.error(f"Flow {self.flow_id}: Protocol not connected")
                 return
 
-            logger.info(f"Flow {self.flow_id}: Starting to request data at {self.client.packets_per_second:.2f} packets/sec")
+            # Hold until the common start time shared by all flows
+            if start_ns is not None:
+                await asyncio.sleep(max(0, start_ns - time.perf_counter_ns()) / 1_000_000_000)
+            
+            responses = self.responses
+            gap_us = self.client.response_gap_us
+            logger.info(f"Flow {self.flow_id}: Starting to request data at "
+                        f"{self.pacer.rate_pps * responses:.2f} packets/sec"
+                        + (f" ({self.pacer.rate_pps:.2f} requests/sec)" if responses > 1 else ""))
+            
+            server_addr = (self.client.server_ip, self.client.server_port)
+            send_requests = self.send_requests
+            upload_buffer = self.upload_buffer
+            size_cycle = self.size_cycle
+            pacer = self.pacer
+            pacer.start(start_ns)
+            end_ns = pacer.start_ns + int(self.client.duration * 1_000_000_000)
             
             try:
-                while time.time() - self.start_time < self.client.duration and self.is_running:
-                    current_time = time.time()
+                while self.is_running:
+                    now_ns = time.perf_counter_ns()
+                    if now_ns >= end_ns:
+                        break
+                    
+                    due = pacer.due(now_ns)
+                    if not due:
+                        # Sleep exactly until the next packet is due
+                        await asyncio.sleep(pacer.sleep_time(now_ns))
+                        continue
                     
-                    if current_time >= self.next_request_time:
+                    # Send every packet that is due in one burst
+                    upload_bytes = 0
+                    for _ in range(due):
+                        span = self.profiler.span() if self.profiler is not None else None
                         # Create request packet with sequence number and timestamp
-                        request_data = struct.pack('!Qd', self.sequence_number, current_time)
-                        
-                        # Send request
-                        self.transport.sendto(request_data, (self.client.server_ip, self.client.server_port))
+                        current_time = time.time()
+                        seq_num = self.sequence_number
+                        packet_size = size_cycle[seq_num // responses % len(size_cycle)]
+                        if send_requests:
+                            request_data = REQUEST.pack(WIRE_VERSION, MSG_REQUEST, self.flow_id,
+                                                        seq_num, current_time, responses, gap_us, packet_size)
+                            if span:
+                                span.mark('request_pack')
+                            
+                            # Send request
+                            self.transport.sendto(request_data, server_addr)
+                            if span:
+                                span.mark('request_send')
+                            
+                            # Store request info for RTT calculation, once per expected DATA packet
+                            for index in range(responses):
+                                self.pending_requests.add(seq_num + index, current_time)
+                            if span:
+                                span.mark('request_track')
                         
-                        # Store request info for RTT calculation
-                        self.pending_requests[self.sequence_number] = current_time
+                        # Upload packets with the same sequence numbers
+                        if upload_buffer is not None:
+                            for index in range(responses):
+                                UPLOAD.pack_into(upload_buffer, 0, WIRE_VERSION, MSG_UPLOAD, self.flow_id,
+                                                 seq_num + index, current_time)
+                                self.transport.sendto(upload_buffer[:packet_size], server_addr)
+                            upload_bytes += packet_size * responses
+                            if span:
+                                span.mark('upload_send')
                         
                         # Update sequence number
-                        self.sequence_number += 1
-                        
-                        # Calculate next request time
-                        self.next_request_time += self.client.packet_interval
+                        self.sequence_number = seq_num + responses
+                    pacer.sent_packets(due, now_ns)
+                    if upload_buffer is not None:
+                        self.uploads_sent += due * responses
+                    if self.metrics is not None:
+                        uploads = due * responses if upload_buffer is not None else 0
+                        self.metrics.packets_sent += (due if send_requests else 0) + uploads
+                        self.metrics.bytes_sent += (due * REQUEST.size if send_requests else 0) + upload_bytes
                     
-                    # Small sleep to prevent busy waiting
-                    await asyncio.sleep(0.0001)
+                    # Let received packets be processed between bursts
+                    await asyncio.sleep(0)
                 
-                logger.info(f"Flow {self.flow_id}: Finished requesting {self.sequence_number} packets")
+                drift = pacer.drift(end_ns)
+                logger.info(f"Flow {self.flow_id}: Finished requesting {self.sequence_number} packets "
+                            f"(target {drift['target_packets'] * responses}, "
+                            f"skipped {drift['skipped_packets'] * responses}, "
+                            f"mean lateness {drift['mean_lateness_us']:.1f} us, "
+                            f"max lateness {drift['max_lateness_us']:.1f} us)")
                 
             except Exception as e:
                 logger.error(f"Flow {self.flow_id}: Error in request_data: {e}")
                 raise
 
     def log_packet(self, flow_id: int, seq_num: int, request_time: float,
-                  server_send_time: float, receive_time: float, rtt: float):
-        """Log packet information to CSV file"""
+                  server_send_time: float, receive_time: float, rtt: float,
+                  kernel_receive_time: Optional[float] = None, packet_size: Optional[int] = None):
+        """Log packet information to the packet log"""
         try:
-            with open(self.log_file, 'a', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    datetime.now().isoformat(),
-                    flow_id,
-                    seq_num,
-                    request_time,
-                    server_send_time,
-                    receive_time,
-                    rtt
-                ])
+            self.packet_log.write((
+                receive_time,
+                flow_id,
+                seq_num,
+                request_time,
+                server_send_time,
+                receive_time,
+                rtt,
+                kernel_receive_time,
+                packet_size
+            ))
         except Exception as e:
             logger.error(f"Failed to log packet: {e}")
 
+    def close(self):
+        """Flush and close the packet log"""
+        self.packet_log.close()
+        if self.metrics is not None:
+            self.metrics.close()
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler.log_summary()
+
     async def start(self):
         """Start the UDP client with multiple flows"""
         try:
             loop = asyncio.get_running_loop()
+            self.event_loop = event_loop_name(loop)
             
             self.stats['start_time'] = time.time()
             self.stats['last_stats_time'] = self.stats['start_time']
             
-            # Create tasks for each flow
-            tasks = []
-            for flow_id in range(self.num_flows):
+            # Create an endpoint for each flow
+            for flow_id in self.flow_ids:
                 # Create socket for this flow
                 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
                 sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -192,33 +408,224 @@ class UDPClient:
                 
                 # Create protocol and transport
                 protocol = self.ClientProtocol(self, flow_id)
-                transport, _ = await loop.create_datagram_endpoint(
-                    lambda: protocol,
-                    sock=sock
+                transport = await create_datagram_endpoint(
+                    protocol,
+                    sock,
+                    self.io_engine,
+                    self.batch_size,
+                    self.max_packet_size,
+                    self.kernel_timestamps
                 )
-                
-                # Start requesting data
-                task = asyncio.create_task(protocol.request_data())
-                tasks.append(task)
+                self.protocols.append(protocol)
+                if self.profiler is not None:
+                    self.profiler.watch_socket(sock)
+            
+            if self.metrics is not None:
+                await self.metrics.serve(self.metrics_host, self.metrics_port)
+            if self.profiler is not None:
+                self.profiler.start()
             
-            # Start statistics reporting
+            if self.clock_sync:
+                await self.sync_clock()
+            if self.test_id is not None:
+                await self.open_session()
+            
+            # Start every flow on the same monotonic-clock deadline
+            start_ns = await self.wait_for_start()
+            self.stats['start_time'] = time.time() + max(0, start_ns - time.perf_counter_ns()) / 1_000_000_000
+            self.stats['last_stats_time'] = self.stats['start_time']
+            tasks = [asyncio.create_task(protocol.request_data(start_ns)) for protocol in self.protocols]
+            
+            # Start statistics reporting and pending-request expiry
             stats_task = asyncio.create_task(self.report_stats())
+            expiry_task = asyncio.create_task(self.expire_pending())
             
             logger.info(f"Starting {self.num_flows} flows to {self.server_ip}:{self.server_port}")
-            logger.info(f"Target download bandwidth: {self.bandwidth_mbps} Mbps per flow")
+            target = {'down': 'download', 'up': 'upload', 'bidir': 'download and upload'}[self.direction]
+            logger.info(f"Target {target} bandwidth: {self.bandwidth_mbps} Mbps per flow")
+            if len(self.packet_sizes) > 1:
+                mix = ', '.join(f"{size} x{weight}" for size, weight in self.packet_sizes)
+                logger.info(f"Packet sizes: {mix} (mean {self.packet_size:.1f} bytes)")
+            if self.traffic_profile is not None:
+                logger.info(f"Traffic profile: {self.traffic_profile}")
             logger.info(f"Test duration: {self.duration} seconds")
+            logger.info(f"I/O engine: {self.io_engine}"
+                        f"{' with kernel timestamps' if self.kernel_timestamps else ''}")
+            logger.info(f"Event loop: {self.event_loop}")
             
             # Wait for all flows to complete
             await asyncio.gather(*tasks)
+            self.save_sent_counts()
+            
+            # Give in-flight requests until the timeout to complete, then count the rest as lost
+            await self.drain_pending()
+            if self.test_id is not None:
+                self.close_session()
+            expiry_task.cancel()
             stats_task.cancel()
             
-            # Print final statistics
-            self.print_final_stats()
+            # Print final statistics, or hand them to the parent process
+            if self.results_queue is not None:
+                self.results_queue.put(self.final_stats())
+            else:
+                self.print_final_stats()
             
         except Exception as e:
             logger.error(f"Client error: {e}")
             raise
 
+    def control_received(self, protocol, data, receive_time: float):
+        """Handle out-of-band control replies from the server to one flow"""
+        subtype = data[CONTROL_HEADER.size - 1] if len(data) >= CONTROL_HEADER.size else None
+        if subtype == CTRL_SYNC and len(data) >= SYNC.size:
+            _, _, _, _, _, send_time, server_receive_time, server_send_time = SYNC.unpack_from(data)
+            self.sync_replies.append((send_time, server_receive_time, server_send_time, receive_time))
+        elif subtype == CTRL_HELLO_ACK and len(data) >= SESSION.size:
+            # Echo the address cookie, proving this address receives what the server sends it
+            _, _, flow_id, cookie, _, raw_id = SESSION.unpack_from(data)
+            protocol.transport.sendto(CONFIRM.pack(WIRE_VERSION, MSG_CONTROL, flow_id, cookie, CTRL_CONFIRM, raw_id,
+                                                   self.responses), (self.server_ip, self.server_port))
+        elif subtype == CTRL_CONFIRM and len(data) >= CONFIRM.size:
+            _, _, flow_id, _, _, _, granted = CONFIRM.unpack_from(data)
+            if flow_id not in self.session_flows and self.direction != 'up':
+                protocol.responses = max(1, min(granted, self.responses))
+            self.session_flows.add(flow_id)
+
+    async def open_session(self):
+        """Register every flow's address with the server under the test ID"""
+        server_addr = (self.server_ip, self.server_port)
+        raw_id = self.test_id.encode('ascii')
+        deadline = time.monotonic() + self.pending_timeout
+        while len(self.session_flows) < len(self.protocols) and time.monotonic() < deadline:
+            for protocol in self.protocols:
+                if protocol.flow_id not in self.session_flows:
+                    protocol.transport.sendto(HELLO.pack(WIRE_VERSION, MSG_CONTROL, protocol.flow_id, 0, CTRL_HELLO,
+                                                         raw_id, self.num_flows, self.max_packet_size,
+                                                         float(self.duration)), server_addr)
+            retry = time.monotonic() + SESSION_RETRY_INTERVAL
+            while len(self.session_flows) < len(self.protocols) and time.monotonic() < retry:
+                await asyncio.sleep(CLOCK_SYNC_INTERVAL)
+        if len(self.session_flows) < len(self.protocols):
+            logger.warning(f"Session {self.test_id}: the server acknowledged {len(self.session_flows)} of "
+                           f"{len(self.protocols)} flows; the rest run without a session"
+                           + (" and get one DATA packet per request" if self.responses > 1 else ""))
+        else:
+            logger.info(f"Session {self.test_id}: {len(self.protocols)} flows registered with the server")
+        granted = min(protocol.responses for protocol in self.protocols)
+        if self.direction != 'up' and granted < self.responses:
+            logger.warning(f"Session {self.test_id}: the server sends at most {granted} of the {self.responses} "
+                           f"DATA packets asked for per request, so flows reach {granted / self.responses:.0%} "
+                           f"of the target bandwidth")
+
+    def close_session(self):
+        """Tell the server every flow has finished, so it can close the session right away"""
+        server_addr = (self.server_ip, self.server_port)
+        raw_id = self.test_id.encode('ascii')
+        for protocol in self.protocols:
+            protocol.transport.sendto(SESSION.pack(WIRE_VERSION, MSG_CONTROL, protocol.flow_id, 0, CTRL_BYE,
+                                                   raw_id), server_addr)
+
+    async def sync_clock(self):
+        """Estimate the server clock offset from the lowest-RTT reply to clock_sync probes.
+
+        The result is saved next to the packet log for the analyzer, which
+        falls back to it for flows too short to fit their own offset.
+        """
+        protocol = self.protocols[0]
+        server_addr = (self.server_ip, self.server_port)
+        for probe in range(self.clock_sync):
+            protocol.transport.sendto(SYNC.pack(WIRE_VERSION, MSG_CONTROL, protocol.flow_id, probe, CTRL_SYNC,
+                                                time.time(), 0.0, 0.0), server_addr)
+            await asyncio.sleep(CLOCK_SYNC_INTERVAL)
+        deadline = time.monotonic() + self.pending_timeout
+        while len(self.sync_replies) < self.clock_sync and time.monotonic() < deadline:
+            await asyncio.sleep(CLOCK_SYNC_INTERVAL)
+        if not self.sync_replies:
+            logger.warning("Clock sync: no replies from the server")
+            return
+        
+        # Server processing time is excluded from the RTT of each probe
+        t1, t2, t3, t4 = min(self.sync_replies, key=lambda reply: (reply[3] - reply[0]) - (reply[2] - reply[1]))
+        result = {
+            'offset': ((t2 - t1) + (t3 - t4)) / 2,  # server clock minus client clock
+            'rtt': (t4 - t1) - (t3 - t2),
+            'time': t4,
+            'probes': self.clock_sync,
+            'replies': len(self.sync_replies),
+        }
+        logger.info(f"Clock sync: server clock offset {result['offset'] * 1000:+.3f} ms "
+                    f"(RTT {result['rtt'] * 1000:.3f} ms, {result['replies']}/{result['probes']} replies)")
+        if self.log_file != os.devnull:
+            try:
+                with open(clock_sync_path(self.log_file), 'w') as f:
+                    json.dump(result, f, indent=2)
+            except OSError as e:
+                logger.error(f"Failed to save clock sync result: {e}")
+
+    def save_sent_counts(self):
+        """Write how many requests and sequence numbers each flow used next to the packet log.
+
+        The analyzer takes these as what each flow sent, so loss at the end
+        of a flow, which leaves no higher sequence number behind, is counted.
+        The flow's start and end times pick its packets out of a shared
+        server upload log.
+        """
+        if self.log_file == os.devnull:
+            return
+        end_time = time.time()
+        flows = {
+            str(p.flow_id): {
+                'requests': p.pacer.sent if p.send_requests else 0,
+                'responses': p.responses,
+                'sequence_numbers': p.sequence_number,
+                'uploads': p.uploads_sent,
+                'start_time': p.start_time,
+                'end_time': end_time,
+            }
+            for p in self.protocols
+        }
+        try:
+            with open(sent_counts_path(self.log_file), 'w') as f:
+                json.dump({'flows': flows}, f, indent=2)
+        except OSError as e:
+            logger.error(f"Failed to save per-flow send counts: {e}")
+
+    async def wait_for_start(self) -> int:
+        """Return the perf_counter_ns deadline at which all flows start"""
+        if self.start_barrier is None:
+            return time.perf_counter_ns()
+        # Every process waits here until all have their sockets ready
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.start_barrier.wait)
+        return self.start_ns.value
+
+    async def expire_pending(self):
+        """Periodically count requests with no DATA past the timeout as lost"""
+        interval = min(self.pending_timeout / 4, 0.5)
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                now = time.time()
+                for protocol in self.protocols:
+                    self.count_lost(protocol, protocol.pending_requests.expire(now))
+            except Exception as e:
+                logger.error(f"Error expiring pending requests: {e}")
+
+    async def drain_pending(self):
+        """Wait up to the pending timeout for outstanding requests and upload ACKs, then expire them all"""
+        deadline = time.time() + self.pending_timeout
+        while time.time() < deadline and any(len(p.pending_requests) or p.uploads_received < p.uploads_sent
+                                             for p in self.protocols):
+            await asyncio.sleep(0.05)
+        for protocol in self.protocols:
+            self.count_lost(protocol, protocol.pending_requests.expire(float('inf')))
+
+    def count_lost(self, protocol, lost: int):
+        """Add expired requests of one flow to the loss counters"""
+        self.stats['packets_lost'] += lost
+        if protocol.metrics is not None:
+            protocol.metrics.packets_lost += lost
+
     async def report_stats(self):
         """Report client statistics periodically"""
         while True:
@@ -227,26 +634,61 @@ class UDPClient:
                 
                 current_time = time.time()
                 elapsed = current_time - self.stats['last_stats_time']
+                if self.metrics is not None:
+                    self.metrics.roll()
                 
                 if elapsed > 0:
                     packets_per_sec = self.stats['packets_received'] / elapsed
                     bytes_per_sec = self.stats['bytes_received'] / elapsed
                     mbps = (bytes_per_sec * 8) / 1_000_000
                     
-                    logger.info(f"Stats: {packets_per_sec:.2f} packets/sec, {mbps:.2f} Mbps")
+                    jitter = sum(p.jitter_ms for p in self.protocols) / max(len(self.protocols), 1)
+                    logger.info(f"Stats: {packets_per_sec:.2f} packets/sec, {mbps:.2f} Mbps, "
+                                f"{self.stats['packets_lost']} lost, jitter {jitter:.3f} ms")
+                    if self.packet_log.dropped_rows:
+                        logger.warning(f"Packet log has dropped {self.packet_log.dropped_rows} rows")
                     
-                    # Reset counters
+                    # Fold the interval into the totals and reset counters
+                    self.stats['total_packets_received'] += self.stats['packets_received']
+                    self.stats['total_bytes_received'] += self.stats['bytes_received']
                     self.stats['packets_received'] = 0
                     self.stats['bytes_received'] = 0
                     self.stats['last_stats_time'] = current_time
             except Exception as e:
                 logger.error(f"Error in stats reporting: {e}")
 
+    def final_stats(self) -> dict:
+        """Totals for the whole run"""
+        now_ns = time.perf_counter_ns()
+        drifts = [p.pacer.drift(min(now_ns, p.pacer.start_ns + int(self.duration * 1_000_000_000)))
+                  for p in self.protocols]
+        return {
+            'duration': time.time() - self.stats['start_time'],
+            'packets_received': self.stats['total_packets_received'] + self.stats['packets_received'],
+            'bytes_received': self.stats['total_bytes_received'] + self.stats['bytes_received'],
+            'packets_lost': self.stats['packets_lost'],
+            'requests_scheduled': sum(d['target_packets'] for d in drifts),
+            'requests_sent': sum(d['sent_packets'] for d in drifts),
+            'responses_requested': (sum(d['sent_packets'] * p.responses for d, p in zip(drifts, self.protocols))
+                                    if self.direction != 'up' else 0),
+            'max_lateness_us': max((d['max_lateness_us'] for d in drifts), default=0.0),
+            'upload_packets_sent': sum(p.uploads_sent for p in self.protocols),
+            'upload_packets_received': sum(p.uploads_received for p in self.protocols),
+            'upload_bytes_received': sum(p.upload_bytes_received for p in self.protocols),
+            'upload_rtt': self.upload_rtt,
+            'event_loop': self.event_loop,
+        }
+
     def print_final_stats(self):
         """Print final statistics after test completion"""
-        total_time = time.time() - self.stats['start_time']
-        total_bytes = self.stats['bytes_received']
-        total_packets = self.stats['packets_received']
+        self.log_final_stats(self.final_stats())
+
+    @staticmethod
+    def log_final_stats(final: dict):
+        """Log run totals (from this process or combined across processes)"""
+        total_time = final['duration']
+        total_bytes = final['bytes_received']
+        total_packets = final['packets_received']
         
         avg_throughput = (total_bytes * 8) / (total_time * 1_000_000)  # Mbps
         avg_packets_per_sec = total_packets / total_time
@@ -254,8 +696,233 @@ class UDPClient:
         logger.info("\nFinal Statistics:")
         logger.info(f"Total duration: {total_time:.2f} seconds")
         logger.info(f"Total packets received: {total_packets}")
+        logger.info(f"Total packets lost: {final['packets_lost']}")
         logger.info(f"Average download throughput: {avg_throughput:.2f} Mbps")
         logger.info(f"Average packets per second: {avg_packets_per_sec:.2f}")
+        
+        upload_sent = final['upload_packets_sent']
+        if upload_sent:
+            upload_received = final['upload_packets_received']
+            upload_mbps = final['upload_bytes_received'] * 8 / (total_time * 1_000_000)
+            logger.info(f"Upload packets received by the server: {upload_received} of {upload_sent} "
+                        f"({upload_sent - upload_received} lost, "
+                        f"{(upload_sent - upload_received) / upload_sent * 100:.2f}%)")
+            logger.info(f"Average upload throughput: {upload_mbps:.2f} Mbps")
+            rtt = final['upload_rtt']
+            if rtt.count:
+                logger.info(f"Upload RTT ({rtt.count} ACK samples): p50 {rtt.quantile(0.5):.3f} ms, "
+                            f"p99 {rtt.quantile(0.99):.3f} ms, max {rtt.max:.3f} ms")
+        
+        # Pacing accuracy across all flows
+        target = final['requests_scheduled']
+        sent = final['requests_sent']
+        if target:
+            logger.info(f"Requests sent: {sent} of {target} scheduled ({sent / target * 100:.2f}%), "
+                        f"max lateness {final['max_lateness_us']:.1f} us")
+
+def combine_final_stats(finals: List[dict]) -> dict:
+    """Merge per-process run totals; the run lasts as long as the slowest process"""
+    combined = {key: sum(final[key] for final in finals) for key in finals[0]
+                if key not in ('upload_rtt', 'event_loop')}
+    combined['event_loop'] = finals[0]['event_loop']
+    combined['duration'] = max(final['duration'] for final in finals)
+    combined['max_lateness_us'] = max(final['max_lateness_us'] for final in finals)
+    combined['upload_rtt'] = LogHistogram()
+    for final in finals:
+        combined['upload_rtt'].merge(final['upload_rtt'])
+    return combined
+
+def set_start_time(start_ns: multiprocessing.Value, delay: float = 0.05):
+    """Barrier action: pick the shared start deadline once every process is ready"""
+    start_ns.value = time.perf_counter_ns() + int(delay * 1_000_000_000)
+
+def run_client_process(index: int, client_kwargs: dict, flow_ids: List[int],
+                       start_barrier: multiprocessing.Barrier, start_ns: multiprocessing.Value,
+                       results_queue: multiprocessing.Queue, event_loop: str = 'asyncio'):
+    """Entry point of one client process running a slice of the flows"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - %(levelname)s - [process {index}] %(message)s',
+        force=True
+    )
+    install_event_loop(event_loop)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    client = UDPClient(**client_kwargs, flow_ids=flow_ids, start_barrier=start_barrier,
+                       start_ns=start_ns, results_queue=results_queue)
+    try:
+        asyncio.run(client.start())
+    except KeyboardInterrupt:
+        start_barrier.abort()
+    finally:
+        # A second Ctrl-C or SIGTERM must not cut the final log flush short
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        client.close()
+
+def run_client_processes(num_processes: int, client_kwargs: dict, event_loop: str = 'asyncio'):
+    """Spread the flows over N processes that start together, then merge their stats"""
+    num_flows = client_kwargs['num_flows']
+    num_processes = min(num_processes, num_flows)
+    # Contiguous, globally unique flow ID ranges per process
+    bounds = [round(i * num_flows / num_processes) for i in range(num_processes + 1)]
+    
+    start_ns = multiprocessing.Value('q', 0)
+    start_barrier = multiprocessing.Barrier(num_processes, action=functools.partial(set_start_time, start_ns),
+                                            timeout=30)
+    results_queue = multiprocessing.Queue()
+    
+    processes = []
+    for index in range(num_processes):
+        process_kwargs = dict(client_kwargs,
+                              log_file=shard_log_path(client_kwargs['log_file'], index))
+        if client_kwargs.get('metrics_port'):
+            # One endpoint per process on consecutive ports
+            process_kwargs['metrics_port'] = client_kwargs['metrics_port'] + index
+        process = multiprocessing.Process(
+            target=run_client_process, name=f"udp-client-{index}",
+            args=(index, process_kwargs, list(range(bounds[index], bounds[index + 1])),
+                  start_barrier, start_ns, results_queue, event_loop))
+        process.start()
+        processes.append(process)
+    
+    try:
+        finals = []
+        while len(finals) < num_processes and any(p.is_alive() for p in processes):
+            try:
+                finals.append(results_queue.get(timeout=1))
+            except queue.Empty:
+                continue
+        if finals:
+            UDPClient.log_final_stats(combine_final_stats(finals))
+    except KeyboardInterrupt:
+        # Processes normally get Ctrl-C from the terminal; forward it to any that didn't (SIGTERM)
+        deadline = time.monotonic() + 1
+        for process in processes:
+            process.join(timeout=max(0, deadline - time.monotonic()))
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGINT)
+        raise
+    finally:
+        for process in processes:
+            process.join()
+
+# A trial in which the client sent fewer of its scheduled requests than this is client-limited
+MIN_SEND_RATIO = 0.95
+# Fewest RTT samples for the p99 limit to apply; upload trials get one per batched UPLOAD_ACK
+MIN_RTT_SAMPLES = 20
+
+def run_trial(client_kwargs: dict, bandwidth_mbps: float) -> dict:
+    """Run one short test at a per-flow rate and summarize it"""
+    results = queue.Queue()
+    client = UDPClient(**dict(client_kwargs, bandwidth_mbps=bandwidth_mbps),
+                       collect_rtt=True, results_queue=results)
+    try:
+        asyncio.run(client.start())
+    finally:
+        client.close()
+    final = results.get_nowait()
+    if client.direction == 'up':
+        # Capacity of the upload direction, as confirmed by the server. Upload RTT samples exclude
+        # the time the server holds ACKs for batching, so ACK batching alone cannot fail a trial
+        received_bytes, rtt = final['upload_bytes_received'], final['upload_rtt']
+        lost = final['upload_packets_sent'] - final['upload_packets_received']
+    else:
+        received_bytes, rtt = final['bytes_received'], client.rtt_histogram
+        lost = final['packets_lost']
+    return {
+        'bandwidth_mbps': bandwidth_mbps,
+        'offered_mbps': bandwidth_mbps * client_kwargs['num_flows'],
+        'achieved_mbps': received_bytes * 8 / client_kwargs['duration'] / 1_000_000,
+        'loss_rate': lost / max(final['upload_packets_sent' if client.direction == 'up'
+                                      else 'responses_requested'], 1) * 100,
+        'send_ratio': final['requests_sent'] / max(final['requests_scheduled'], 1),
+        'rtt_p50_ms': rtt.quantile(0.5),
+        'rtt_p99_ms': rtt.quantile(0.99),
+        'rtt_samples': rtt.count,
+    }
+
+def trial_failure(trial: dict, max_loss: float, max_p99_ms: float) -> Optional[str]:
+    """Why a trial is past saturation, or None if it passed"""
+    if trial['send_ratio'] < MIN_SEND_RATIO:
+        return f"client sent only {trial['send_ratio'] * 100:.1f}% of scheduled requests"
+    if trial['loss_rate'] > max_loss:
+        return f"loss {trial['loss_rate']:.2f}% > {max_loss}%"
+    if trial['rtt_samples'] < MIN_RTT_SAMPLES:
+        # Too few samples for a meaningful p99 (a trial where nothing came back already failed on loss)
+        return None
+    if not trial['rtt_p99_ms'] <= max_p99_ms:
+        return f"p99 RTT {trial['rtt_p99_ms']:.2f} ms > {max_p99_ms} ms"
+    return None
+
+def find_max_rate(client_kwargs: dict, start_mbps: float, step: float, resolution: float,
+                  max_trials: int, max_loss: float, max_p99_ms: float):
+    """Search for the highest per-flow rate that stays within the loss and p99 RTT limits.
+
+    The rate is multiplied (or divided) by ``step`` until one trial passes and
+    another fails, then bisected geometrically until the two are within
+    ``resolution`` of each other. Returns the trials in the order they ran,
+    the highest passing rate and the lowest failing rate (None if not found).
+    """
+    curve = []
+    passed, failed = None, None
+    rate = start_mbps
+    while len(curve) < max_trials:
+        logger.info(f"Trial {len(curve) + 1}: {rate:.3f} Mbps per flow "
+                    f"({rate * client_kwargs['num_flows']:.3f} Mbps offered)")
+        trial = run_trial(client_kwargs, rate)
+        trial['failure'] = trial_failure(trial, max_loss, max_p99_ms)
+        curve.append(trial)
+        logger.info(f"Trial {len(curve)}: {trial['achieved_mbps']:.3f} Mbps achieved, "
+                    f"loss {trial['loss_rate']:.2f}%, p99 RTT {trial['rtt_p99_ms']:.3f} ms: "
+                    f"{trial['failure'] or 'pass'}")
+        
+        if trial['failure'] is None:
+            passed = rate if passed is None else max(passed, rate)
+        else:
+            failed = rate if failed is None else min(failed, rate)
+        if failed is None:
+            rate = passed * step
+        elif passed is None:
+            rate = failed / step
+        elif failed / passed <= 1 + resolution:
+            break
+        else:
+            rate = (passed * failed) ** 0.5
+    return curve, passed, failed
+
+def report_saturation(curve: List[dict], passed: Optional[float], failed: Optional[float],
+                      num_flows: int, output_file: str):
+    """Log the knee point and save the rate/response curve as CSV"""
+    curve = sorted(curve, key=lambda trial: trial['bandwidth_mbps'])
+    fields = ['bandwidth_mbps', 'offered_mbps', 'achieved_mbps', 'loss_rate', 'send_ratio',
+              'rtt_p50_ms', 'rtt_p99_ms', 'rtt_samples', 'failure']
+    try:
+        with open(output_file, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for trial in curve:
+                writer.writerow(dict(trial, failure=trial['failure'] or ''))
+    except Exception as e:
+        logger.error(f"Failed to save saturation curve: {e}")
+    
+    logger.info("\nSaturation Curve:")
+    logger.info(f"{'Mbps/flow':>12} {'offered':>10} {'achieved':>10} {'loss %':>8} {'p99 ms':>10}  result")
+    for trial in curve:
+        logger.info(f"{trial['bandwidth_mbps']:>12.3f} {trial['offered_mbps']:>10.3f} "
+                    f"{trial['achieved_mbps']:>10.3f} {trial['loss_rate']:>8.2f} "
+                    f"{trial['rtt_p99_ms']:>10.3f}  {trial['failure'] or 'pass'}")
+    if passed is None:
+        logger.info("No trial passed; lower --bandwidth to start the search below saturation")
+    else:
+        knee = next(trial for trial in curve if trial['bandwidth_mbps'] == passed)
+        logger.info(f"Knee point: {passed:.3f} Mbps per flow ({passed * num_flows:.3f} Mbps offered, "
+                    f"{knee['achieved_mbps']:.3f} Mbps achieved, p99 RTT {knee['rtt_p99_ms']:.3f} ms)")
+        if failed is None:
+            logger.info("No trial failed; the limit is above the highest rate tried")
+        else:
+            logger.info(f"Saturated at {failed:.3f} Mbps per flow")
+    logger.info(f"Curve saved to {output_file}")
 
 def main():
     parser = argparse.ArgumentParser(description='UDP Client for Traffic Testing')
@@ -268,13 +935,150 @@ def main():
     parser.add_argument('--duration', type=int, default=10,
                       help='Test duration in seconds')
     parser.add_argument('--bandwidth', type=float, default=50,
-                      help='Target download bandwidth per flow in Mbps')
-    parser.add_argument('--packet-size', type=int, default=1400,
-                      help='UDP packet size in bytes')
-    parser.add_argument('--log-file', type=str, default='client_log.csv',
-                      help='Output file for client logs')
+                      help='Target bandwidth per flow in Mbps (in each direction with --direction bidir)')
+    parser.add_argument('--packet-size', type=str, default='1400',
+                      help='Packet size in bytes, a named mix (imix) or weighted sizes (e.g. 64:7,576:4,1500:1)')
+    parser.add_argument('--log-file', type=str, default=None,
+                      help='Output file for client logs (default: client_log.csv or client_log.bin)')
+    parser.add_argument('--log-format', type=str, default='csv', choices=LOG_FORMATS,
+                      help='Packet log encoding (binary writes fixed-width records the analyzer memory-maps)')
+    parser.add_argument('--pending-timeout', type=float, default=2.0,
+                      help='Seconds to wait for a DATA packet before counting a request as lost')
+    parser.add_argument('--pending-window', type=int, default=16384,
+                      help='Maximum in-flight requests tracked per flow')
+    parser.add_argument('--burst', type=int, default=1,
+                      help='Requests released together per pacer wake-up')
+    parser.add_argument('--catch-up', type=str, default='burst', choices=CATCH_UP_POLICIES,
+                      help='When behind schedule, send all overdue requests (burst) or drop them (skip)')
+    parser.add_argument('--io-engine', type=str, default='asyncio', choices=IO_ENGINES,
+                      help='Socket I/O engine (mmsg batches packets with recvmmsg/sendmmsg, Linux only)')
+    parser.add_argument('--batch-size', type=int, default=64,
+                      help='Maximum packets per recvmmsg/sendmmsg call with --io-engine mmsg')
+    parser.add_argument('--kernel-timestamps', action='store_true',
+                      help='Log SO_TIMESTAMPNS kernel receive times alongside userspace times (Linux only)')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                      help='Serve live per-flow metrics over HTTP on this port (Prometheus text at /metrics)')
+    parser.add_argument('--metrics-host', type=str, default='127.0.0.1',
+                      help='Address for the live metrics endpoint')
+    parser.add_argument('--profile', action='store_true',
+                      help='Sample per-stage hot-path timings, event-loop lag, GC pauses and socket drops; '
+                           'print a summary at shutdown')
+    parser.add_argument('--event-loop', type=str, default='asyncio', choices=EVENT_LOOPS,
+                      help='Event loop implementation (auto: uvloop if installed, else asyncio)')
+    parser.add_argument('--processes', type=int, default=1,
+                      help='Processes to spread the flows over (logs are sharded per process)')
+    parser.add_argument('--direction', type=str, default='down', choices=DIRECTIONS,
+                      help='Load the downlink (request/DATA), the uplink (client streams upload packets) or both')
+    parser.add_argument('--responses', type=int, default=1,
+                      help='DATA packets the server sends per request (the request rate is divided by this)')
+    parser.add_argument('--response-gap', type=int, default=0,
+                      help='Microseconds between the DATA packets of one request (0: back to back)')
+    parser.add_argument('--traffic-profile', type=str, default=None,
+                      help='Time-varying send schedule: shape[:params][+arrivals[:alpha]] '
+                           '(e.g. sine:50,20,10+poisson) or a JSON file')
+    parser.add_argument('--flow-phase', type=float, default=None,
+                      help='Seconds by which each flow\'s traffic profile is shifted from the previous flow\'s')
+    parser.add_argument('--profile-seed', type=int, default=None,
+                      help='Random seed for Poisson/Pareto traffic profiles (flow N uses seed + N)')
+    parser.add_argument('--clock-sync', type=int, default=0,
+                      help='CONTROL probes exchanged at startup to measure the server clock offset (0: none)')
+    parser.add_argument('--test-id', type=str, default=None,
+                      help='Test session ID sent to the server (up to 16 of A-Z a-z 0-9 _ . -; default: random)')
+    parser.add_argument('--find-max', action='store_true',
+                      help='Search for the highest per-flow rate within the loss and p99 RTT limits, '
+                           'starting from --bandwidth')
+    parser.add_argument('--max-loss', type=float, default=1.0,
+                      help='Highest loss rate in percent a --find-max trial may show')
+    parser.add_argument('--max-p99', type=float, default=50.0,
+                      help='Highest p99 RTT in ms a --find-max trial may show')
+    parser.add_argument('--trial-duration', type=float, default=3.0,
+                      help='Seconds per --find-max trial')
+    parser.add_argument('--search-step', type=float, default=2.0,
+                      help='Rate multiplier between --find-max trials until saturation is bracketed')
+    parser.add_argument('--search-resolution', type=float, default=0.05,
+                      help='Stop --find-max once the passing and failing rates are this close (relative)')
+    parser.add_argument('--max-trials', type=int, default=20,
+                      help='Maximum number of --find-max trials')
+    parser.add_argument('--search-output', type=str, default=os.path.join('results', 'find_max.csv'),
+                      help='Where --find-max saves the rate/response curve')
     
     args = parser.parse_args()
+    if args.log_file is None:
+        args.log_file = f"client_log{LOG_EXTENSIONS[args.log_format]}"
+    if args.test_id is None:
+        args.test_id = uuid.uuid4().hex[:12]
+    elif not TEST_ID_PATTERN.fullmatch(args.test_id):
+        parser.error(f"Invalid test ID: {args.test_id}")
+    try:
+        packet_sizes = parse_packet_sizes(args.packet_size)
+    except ValueError as e:
+        parser.error(str(e))
+    packet_size = round(mean_packet_size(packet_sizes))
+    event_loop = install_event_loop(args.event_loop)
+    # Shut down on SIGTERM (kill, systemd, containers) as on Ctrl-C: logs flushed, summaries logged
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    
+    traffic_profile = None
+    if args.traffic_profile:
+        try:
+            traffic_profile = parse_traffic_profile(args.traffic_profile)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        if args.flow_phase is not None:
+            traffic_profile.phase = args.flow_phase
+        if args.profile_seed is not None:
+            traffic_profile.seed = args.profile_seed
+    
+    client_kwargs = {
+        'server_ip': args.server_ip,
+        'server_port': args.server_port,
+        'num_flows': args.flows,
+        'duration': args.duration,
+        'bandwidth_mbps': args.bandwidth,
+        'packet_size': packet_size,
+        'log_file': args.log_file,
+        'pending_timeout': args.pending_timeout,
+        'pending_window': args.pending_window,
+        'burst': args.burst,
+        'catch_up': args.catch_up,
+        'io_engine': args.io_engine,
+        'batch_size': args.batch_size,
+        'kernel_timestamps': args.kernel_timestamps,
+        'log_format': args.log_format,
+        'metrics_host': args.metrics_host,
+        'metrics_port': args.metrics_port,
+        'profile': args.profile,
+        'traffic_profile': traffic_profile,
+        'direction': args.direction,
+        'responses': args.responses,
+        'response_gap_us': args.response_gap,
+        'clock_sync': args.clock_sync,
+        'test_id': args.test_id,
+        'packet_sizes': packet_sizes,
+    }
+    
+    if args.find_max:
+        if args.processes > 1:
+            logger.warning("--find-max runs its trials in a single process; ignoring --processes")
+        # Trials are summarized in memory, so their packet logs are not kept
+        # Trials keep the test ID: each opens and closes its own session, which --responses needs
+        search_kwargs = dict(client_kwargs, duration=args.trial_duration, log_file=os.devnull)
+        try:
+            curve, passed, failed = find_max_rate(search_kwargs, args.bandwidth, args.search_step,
+                                                  args.search_resolution, args.max_trials,
+                                                  args.max_loss, args.max_p99)
+        except KeyboardInterrupt:
+            logger.info("Client stopped by user")
+            return
+        report_saturation(curve, passed, failed, args.flows, args.search_output)
+        return
+    
+    if args.processes > 1:
+        try:
+            run_client_processes(args.processes, client_kwargs, event_loop)
+        except KeyboardInterrupt:
+            logger.info("Client stopped by user")
+        return
     
     client = UDPClient(
         args.server_ip,
@@ -282,8 +1086,26 @@ def main():
         args.flows,
         args.duration,
         args.bandwidth,
-        args.packet_size,
-        args.log_file
+        packet_size,
+        args.log_file,
+        args.pending_timeout,
+        args.pending_window,
+        args.burst,
+        args.catch_up,
+        args.io_engine,
+        args.batch_size,
+        args.kernel_timestamps,
+        args.log_format,
+        args.metrics_host,
+        args.metrics_port,
+        args.profile,
+        traffic_profile=traffic_profile,
+        direction=args.direction,
+        responses=args.responses,
+        response_gap_us=args.response_gap,
+        clock_sync=args.clock_sync,
+        test_id=args.test_id,
+        packet_sizes=packet_sizes
     )
     
     try:
@@ -293,6 +1115,8 @@ def main():
     except Exception as e:
         logger.error(f"Client error: {e}")
         sys.exit(1)
+    finally:
+        client.close()
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
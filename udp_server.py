@@ -2,16 +2,31 @@
 
 import asyncio
 import argparse
-import csv
+import hmac
 import logging
+import math
+import multiprocessing
+import queue
+import signal
 import socket
-import struct
 import time
-from datetime import datetime
+from collections import deque
 from typing import Dict, List, Optional
 import os
 import sys
-from tqdm import tqdm
+
+from io_engine import EVENT_LOOPS, IO_ENGINES, create_datagram_endpoint, event_loop_name, install_event_loop
+from instrumentation import HotPathProfiler
+from jitter import JITTER_GAIN
+from live_metrics import LiveMetrics
+from packet_log import (LOG_EXTENSIONS, LOG_FORMATS, SERVER_LOG_COLUMNS, ACK_LOG_COLUMNS,
+                        UPLOAD_LOG_COLUMNS, ack_log_path, open_packet_log, session_log_path,
+                        shard_log_path, upload_log_path)
+from pending import PendingWindow
+from payload import PAYLOAD_PATTERNS, DataPacketTemplate, DataTemplateCache
+from wire import (WIRE_VERSION, MSG_REQUEST, MSG_ACK, MSG_CONTROL, MSG_UPLOAD, MSG_UPLOAD_ACK, HEADER,
+                  REQUEST, DATA_HEADER, ACK, UPLOAD, UPLOAD_ACK, CONTROL_HEADER, CTRL_SYNC, CTRL_HELLO, CTRL_HELLO_ACK,
+                  CTRL_BYE, CTRL_CONFIRM, SYNC, HELLO, SESSION, CONFIRM, TEST_ID_PATTERN, MAX_PACKET_SIZE)
 
 # Configure logging
 logging.basicConfig(
@@ -20,37 +35,163 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Flows with unacknowledged upload packets are acked at least this often (seconds)
+UPLOAD_ACK_INTERVAL = 0.02
+
+class UploadFlow:
+    """Receive state of one upload flow (per client address and flow ID)"""
+    
+    __slots__ = ('addr', 'packets', 'bytes', 'max_seq', 'unacked', 'last_seq', 'last_send_time',
+                 'last_receive_time', 'jitter_ms')
+    
+    def __init__(self, addr: tuple):
+        self.addr = addr           # where UPLOAD_ACKs go
+        self.packets = 0
+        self.bytes = 0
+        self.max_seq = -1
+        self.unacked = 0           # packets since the last UPLOAD_ACK
+        self.last_seq = 0          # newest packet, echoed in the next UPLOAD_ACK
+        self.last_send_time = 0.0
+        self.last_receive_time = 0.0
+        self.jitter_ms = 0.0       # RFC 3550 interarrival jitter
+    
+    def lost(self) -> int:
+        """Sequence numbers up to the highest seen that never arrived (duplicates aside)"""
+        return max(0, self.max_seq + 1 - self.packets)
+
+class Train:
+    """A queued paced response: count DATA packets from seq_num, gap seconds apart"""
+    
+    __slots__ = ('template', 'addr', 'seq_num', 'request_time', 'kernel_time', 'count', 'gap', 'index',
+                 'start')
+    
+    def __init__(self, template: DataPacketTemplate, addr: tuple, seq_num: int, request_time: float,
+                 kernel_time: Optional[float], count: int, gap: float):
+        self.template = template
+        self.addr = addr
+        self.seq_num = seq_num
+        self.request_time = request_time
+        self.kernel_time = kernel_time
+        self.count = count
+        self.gap = gap
+        self.index = 0             # next packet to send
+        self.start = None          # loop time packet 0 is due, set when the train reaches the queue head
+
+class Session:
+    """State of one client test: its addresses, per-flow windows, counters and logs.
+
+    Clients that send a HELLO share one session per test ID across all their
+    flow addresses; traffic from an address without a HELLO gets an
+    anonymous session of its own. An address is confirmed once it echoes
+    the cookie of its HELLO_ACK, which a client spoofing that address never
+    sees. Either kind is closed by a BYE from its
+    last address or after the idle timeout, which frees its state.
+    """
+    
+    __slots__ = ('key', 'test_id', 'flows', 'packet_size', 'duration', 'addrs', 'confirmed', 'pending', 'upload_flows',
+                 'packets', 'swept_packets', 'idle_since', 'start_time', 'closed',
+                 'max_packet_size', 'packets_sent', 'bytes_sent', 'acks_received', 'packets_lost', 'trains',
+                 'packet_log', 'ack_log', 'upload_log')
+    
+    def __init__(self, key, test_id: Optional[str], logs: tuple, flows: int = 0,
+                 packet_size: int = 0, duration: float = 0.0):
+        self.key = key                 # test ID, or the address of an anonymous session
+        self.test_id = test_id
+        self.flows = flows             # announced in the HELLO
+        self.packet_size = packet_size
+        self.duration = duration
+        self.addrs = set()
+        self.confirmed = set()         # addresses that echoed their HELLO_ACK cookie
+        self.pending: Dict[int, PendingWindow] = {}     # per-flow DATA packets waiting for ACK
+        self.upload_flows: Dict[int, UploadFlow] = {}   # per-flow upload receive state
+        self.packets = 0               # packets received, for idle detection
+        self.swept_packets = 0
+        self.idle_since = time.time()
+        self.start_time = self.idle_since
+        self.closed = False
+        self.max_packet_size = 0       # largest DATA packet a request may ask for, set by the server
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.acks_received = 0
+        self.packets_lost = 0
+        self.trains: Dict[int, deque] = {}  # per-flow paced trains, sent one after another
+        self.packet_log, self.ack_log, self.upload_log = logs
+    
+    def name(self) -> str:
+        if self.test_id is not None:
+            return f"Session {self.test_id}"
+        return f"Client {self.key[0]}:{self.key[1]}"
+
 class UDPServer:
-    def __init__(self, host: str, port: int, packet_size: int, log_file: str):
+    def __init__(self, host: str, port: int, packet_size: int, log_file: str,
+                 pending_timeout: float = 2.0, pending_window: int = 16384,
+                 payload_pattern: str = 'zeros', io_engine: str = 'asyncio',
+                 batch_size: int = 64, kernel_timestamps: bool = False,
+                 log_format: str = 'csv', metrics_host: str = '127.0.0.1',
+                 metrics_port: Optional[int] = None, profile: bool = False,
+                 upload_ack_every: int = 16, max_responses: int = 64, session_logs: bool = False,
+                 session_idle_timeout: float = 30.0, max_packet_size: int = 9000, reuse_port: bool = False,
+                 stats_queue: Optional[multiprocessing.Queue] = None,
+                 worker_id: Optional[int] = None):
         self.host = host
         self.port = port
-        self.packet_size = packet_size
+        self.packet_size = packet_size  # For requests that don't ask for a size
+        # Largest DATA packet a request may ask for; also sizes the mmsg engine's buffers
+        self.max_packet_size = min(max(packet_size, max_packet_size), MAX_PACKET_SIZE)
         self.log_file = log_file
+        self.ack_log_file = ack_log_path(log_file)
+        self.upload_log_file = upload_log_path(log_file)
+        self.pending_timeout = pending_timeout
+        self.pending_window = pending_window
+        self.payload_pattern = payload_pattern
+        self.io_engine = io_engine
+        self.batch_size = batch_size
+        self.kernel_timestamps = kernel_timestamps
+        self.log_format = log_format
+        self.metrics_host = metrics_host
+        self.metrics_port = metrics_port
+        self.upload_ack_every = max(1, upload_ack_every)
+        self.max_responses = max(1, max_responses)  # Caps the amplification of a single request
+        self.session_logs = session_logs  # Give each HELLO-opened session its own log directory
+        self.session_idle_timeout = session_idle_timeout
+        self.reuse_port = reuse_port
+        self.stats_queue = stats_queue  # Set in worker mode: stats go to the parent
+        self.worker_id = worker_id
+        self.protocol = None
+        self.event_loop = None  # Name of the running event loop, set on start
+        self.tasks: List[asyncio.Task] = []  # Periodic background tasks, cancelled on shutdown
+        self.closed_log_dropped_rows = 0  # Rows dropped by per-session logs already closed
+        # Per-flow counters and RTT histograms served over HTTP (off unless a port is given)
+        self.metrics = None
+        if metrics_port:
+            self.metrics = LiveMetrics('server', {'worker': worker_id} if worker_id is not None else None)
+        # Sampled hot-path timings, loop lag, GC and socket drops (--profile)
+        self.profiler = None
+        if profile:
+            self.profiler = HotPathProfiler('server' if worker_id is None else f"server worker {worker_id}")
         
         self.stats = {
             'packets_sent': 0,
             'bytes_sent': 0,
+            'acks_received': 0,
+            'invalid_packets': 0,
+            'packets_lost': 0,
+            'upload_packets_received': 0,
+            'upload_bytes_received': 0,
             'start_time': None,
-            'last_stats_time': None,
-            'client_stats': {}
+            'last_stats_time': None
         }
         
         # Create results directory if it doesn't exist
         os.makedirs('results', exist_ok=True)
         
-        # Initialize log file with headers
+        # Open the packet log once for the whole run
         try:
-            with open(self.log_file, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    'timestamp',
-                    'client_addr',
-                    'sequence_number',
-                    'request_time',
-                    'send_time',
-                    'ack_time',
-                    'rtt_ms'
-                ])
+            self.packet_log = open_packet_log(self.log_file, SERVER_LOG_COLUMNS, self.log_format)
+            # ACKs go to their own journal and are joined with sends at analysis time
+            self.ack_log = open_packet_log(self.ack_log_file, ACK_LOG_COLUMNS, self.log_format)
+            # Upload packets received from clients in --direction up/bidir tests
+            self.upload_log = open_packet_log(self.upload_log_file, UPLOAD_LOG_COLUMNS, self.log_format)
         except Exception as e:
             logger.error(f"Failed to initialize log file: {e}")
             sys.exit(1)
@@ -59,120 +200,507 @@ class UDPServer:
         def __init__(self, server):
             self.server = server
             self.transport = None
-            self.pending_packets = {}  # Track packets waiting for ACK
-            self.client_sequence_numbers = {}  # Track sequence numbers per client
+            self.sessions: Dict[object, Session] = {}          # Session key -> open session
+            self.session_by_addr: Dict[tuple, Session] = {}    # Client address -> its session
+            self.data_templates = DataTemplateCache(server.payload_pattern)  # Prebuilt DATA packets by size
+            self.cookie_key = os.urandom(16)  # Signs the address cookies sent in HELLO_ACKs
+            self.profiler = server.profiler
+            self.span = None  # Stage timer of the packet being handled, when sampled
+            self.handlers = {
+                MSG_REQUEST: self.handle_request,
+                MSG_ACK: self.handle_ack,
+                MSG_UPLOAD: self.handle_upload,
+                MSG_CONTROL: self.handle_control,
+            }
 
         def connection_made(self, transport):
             self.transport = transport
+            self.loop = asyncio.get_running_loop()
             logger.info(f"Server listening on {self.server.host}:{self.server.port}")
 
-        def datagram_received(self, data, addr):
+        def datagram_received(self, data, addr, kernel_time: Optional[float] = None):
             try:
-                if len(data) == 16:  # Request packet
-                    # Parse request packet
-                    seq_num, request_time = struct.unpack('!Qd', data)
-                    
-                    # Get or initialize client sequence number
-                    if addr not in self.client_sequence_numbers:
-                        self.client_sequence_numbers[addr] = 0
-                    
-                    # Create data packet
-                    current_time = time.time()
-                    packet_data = struct.pack('!Qdd', seq_num, request_time, current_time)
-                    # Add payload to reach desired packet size
-                    packet_data += b'x' * (self.server.packet_size - len(packet_data))
-                    
-                    # Send data packet
-                    self.transport.sendto(packet_data, addr)
-                    
-                    # Update statistics
-                    self.server.stats['packets_sent'] += 1
-                    self.server.stats['bytes_sent'] += len(packet_data)
-                    
-                    # Store packet info for RTT calculation
-                    self.pending_packets[(addr, seq_num)] = {
-                        'request_time': request_time,
-                        'send_time': current_time
-                    }
-                    
-                    # Log packet send
-                    self.server.log_packet(
-                        addr,
-                        seq_num,
-                        request_time,
-                        current_time,
-                        None,  # ACK time not yet received
-                        None   # RTT not yet calculated
-                    )
-                    
-                elif len(data) == 16:  # ACK packet
-                    # Parse ACK packet
-                    seq_num, ack_time = struct.unpack('!Qd', data)
-                    
-                    # Calculate RTT
-                    if (addr, seq_num) in self.pending_packets:
-                        packet_info = self.pending_packets[(addr, seq_num)]
-                        rtt = (ack_time - packet_info['request_time']) * 1000  # Convert to milliseconds
-                        
-                        # Update log with ACK time and RTT
-                        self.server.update_packet_log(
-                            addr,
-                            seq_num,
-                            ack_time,
-                            rtt
-                        )
-                        
-                        # Remove from pending packets
-                        del self.pending_packets[(addr, seq_num)]
+                self.span = self.profiler.span() if self.profiler is not None else None
+                if len(data) < HEADER.size or data[0] != WIRE_VERSION:
+                    self.server.stats['invalid_packets'] += 1
+                    return
+                
+                # Dispatch on message type
+                handler = self.handlers.get(data[1])
+                if handler is None:
+                    self.server.stats['invalid_packets'] += 1
+                    return
+                handler(data, addr, kernel_time)
                 
             except Exception as e:
                 logger.error(f"Error processing packet from {addr}: {e}")
 
-    def log_packet(self, client_addr: tuple, seq_num: int, request_time: float,
-                  send_time: float, ack_time: Optional[float], rtt: Optional[float]):
-        """Log packet information to CSV file"""
+        def datagrams_received(self, datagrams):
+            """Process a batch of (data, addr, kernel_time) tuples from a batching I/O engine"""
+            for data, addr, kernel_time in datagrams:
+                self.datagram_received(data, addr, kernel_time)
+
+        def handle_request(self, data, addr, kernel_time):
+            """Answer a REQUEST with its K DATA packets, back to back or as a paced train"""
+            span = self.span
+            _, _, flow_id, seq_num, request_time, count, gap_us, packet_size = REQUEST.unpack_from(data)
+            if span:
+                span.mark('parse')
+            
+            session = self.session(addr)
+            if self.server.metrics is not None:
+                flow = self.server.metrics.flow(flow_id)
+                flow.packets_received += 1
+                flow.bytes_received += len(data)
+            
+            # Only addresses that confirmed their HELLO get more than one packet per request, or sizes above
+            # the server's own, so neither a spoofed REQUEST nor a spoofed HELLO turns the server into an amplifier
+            confirmed = addr in session.confirmed
+            if packet_size:
+                limit = session.max_packet_size if confirmed else self.server.packet_size
+                packet_size = min(max(packet_size, DATA_HEADER.size), limit)
+            else:
+                packet_size = self.server.packet_size
+            template = self.data_templates.get(packet_size)
+            count = min(max(1, count), self.server.max_responses) if confirmed else 1
+            trains = session.trains.get(flow_id)
+            if trains or (gap_us and count > 1):
+                # Queue behind the flow's earlier trains, so their packets never interleave
+                if trains is None:
+                    trains = session.trains[flow_id] = deque()
+                trains.append(Train(template, addr, seq_num, request_time, kernel_time, count, gap_us / 1_000_000))
+                if len(trains) == 1:
+                    self.send_trains(session, flow_id)
+                return
+            for index in range(count):
+                self.send_data(session, template, addr, flow_id, seq_num + index, request_time, kernel_time)
+
+        def send_trains(self, session: Session, flow_id: int):
+            """Send the due packets of a flow's queued trains in order, then rearm for the next one.
+
+            Packet i of a train is due at start + i * gap. A train starts one gap
+            after the previous train's last packet was due, or when that packet
+            actually went out if its timer fired late.
+            """
+            self.span = None
+            if session.closed:
+                return
+            trains = session.trains[flow_id]
+            try:
+                now = self.loop.time()
+                while trains:
+                    train = trains[0]
+                    if train.start is None:
+                        train.start = now
+                    # Timers may fire a little early; allow for it rather than rearm for the same packet
+                    due = min(train.count, math.floor((now - train.start) / train.gap + 0.001) + 1) if train.gap \
+                        else train.count
+                    while train.index < due:
+                        self.send_data(session, train.template, train.addr, flow_id, train.seq_num + train.index,
+                                       train.request_time, train.kernel_time)
+                        train.index += 1
+                    if train.index < train.count:
+                        self.loop.call_at(train.start + train.index * train.gap, self.send_trains, session, flow_id)
+                        return
+                    trains.popleft()
+                    if trains:
+                        following = trains[0]
+                        following.start = max(now, train.start + (train.count - 1) * train.gap + following.gap)
+            except Exception as e:
+                trains.clear()
+                logger.error(f"Error sending DATA train to {session.name()}: {e}")
+
+        def send_data(self, session: Session, template: DataPacketTemplate, addr, flow_id: int, seq_num: int,
+                      request_time: float, kernel_time: Optional[float]):
+            """Send, track and log one DATA packet built from the template of its size"""
+            span = self.span
+            
+            # Fill in the header of the preallocated data packet
+            current_time = time.time()
+            packet_data = template.build(flow_id, seq_num, request_time, current_time)
+            if span:
+                span.mark('build')
+            
+            # Send data packet
+            self.transport.sendto(packet_data, addr)
+            if span:
+                span.mark('send')
+            
+            # Update statistics
+            self.server.stats['packets_sent'] += 1
+            self.server.stats['bytes_sent'] += len(packet_data)
+            session.packets_sent += 1
+            session.bytes_sent += len(packet_data)
+            if self.server.metrics is not None:
+                flow = self.server.metrics.flow(flow_id)
+                flow.packets_sent += 1
+                flow.bytes_sent += len(packet_data)
+            
+            # Store send time for RTT calculation
+            pending = session.pending.get(flow_id)
+            if pending is None:
+                pending = session.pending[flow_id] = PendingWindow(
+                    self.server.pending_window, self.server.pending_timeout)
+            pending.add(seq_num, current_time)
+            if span:
+                span.mark('stats')
+            
+            # Log packet send
+            self.server.log_packet(
+                session,
+                addr,
+                flow_id,
+                seq_num,
+                request_time,
+                current_time,
+                None,  # ACK time not yet received
+                None,  # RTT not yet calculated
+                kernel_time,
+                len(packet_data)
+            )
+            if span:
+                span.mark('log')
+
+        def handle_ack(self, data, addr, kernel_time):
+            """Retire a pending DATA packet and record the server-side RTT"""
+            span = self.span
+            _, _, flow_id, seq_num, client_receive_time = ACK.unpack_from(data)
+            if span:
+                span.mark('ack_parse')
+            
+            session = self.session(addr)
+            pending = session.pending.get(flow_id)
+            send_time = pending.pop(seq_num) if pending is not None else None
+            if send_time is None:
+                return
+            
+            # RTT on the server clock: DATA send to ACK arrival
+            ack_time = time.time()
+            rtt = (ack_time - send_time) * 1000  # Convert to milliseconds
+            self.server.stats['acks_received'] += 1
+            session.acks_received += 1
+            if self.server.metrics is not None:
+                self.server.metrics.flow(flow_id).record_rtt(rtt)
+            if span:
+                span.mark('ack_stats')
+            
+            # Record ACK time and RTT in the ACK journal
+            self.server.update_packet_log(
+                session,
+                addr,
+                flow_id,
+                seq_num,
+                ack_time,
+                rtt,
+                kernel_time
+            )
+            if span:
+                span.mark('ack_log')
+
+        def handle_upload(self, data, addr, kernel_time):
+            """Count and log an upload packet, acknowledging the flow every upload_ack_every packets"""
+            span = self.span
+            _, _, flow_id, seq_num, send_time = UPLOAD.unpack_from(data)
+            receive_time = time.time()
+            if span:
+                span.mark('upload_parse')
+            
+            session = self.session(addr)
+            flow = session.upload_flows.get(flow_id)
+            if flow is None:
+                flow = session.upload_flows[flow_id] = UploadFlow(addr)
+            flow.packets += 1
+            flow.bytes += len(data)
+            if seq_num > flow.max_seq:
+                flow.max_seq = seq_num
+            if flow.packets > 1:
+                transit = (receive_time - send_time) - (flow.last_receive_time - flow.last_send_time)
+                flow.jitter_ms += (abs(transit) * 1000 - flow.jitter_ms) * JITTER_GAIN
+            flow.last_seq = seq_num
+            flow.last_send_time = send_time
+            flow.last_receive_time = receive_time
+            flow.unacked += 1
+            if flow.unacked >= self.server.upload_ack_every:
+                self.send_upload_ack(flow_id, flow)
+            
+            self.server.stats['upload_packets_received'] += 1
+            self.server.stats['upload_bytes_received'] += len(data)
+            if self.server.metrics is not None:
+                metrics = self.server.metrics.flow(flow_id)
+                metrics.packets_received += 1
+                metrics.bytes_received += len(data)
+                metrics.jitter_ms = flow.jitter_ms
+            if span:
+                span.mark('upload_stats')
+            
+            self.server.log_upload(session, addr, flow_id, seq_num, send_time, receive_time, kernel_time,
+                                   len(data))
+            if span:
+                span.mark('upload_log')
+
+        def handle_control(self, data, addr, kernel_time):
+            """Answer out-of-band control messages: clock sync probes and the session handshake"""
+            receive_time = time.time()
+            subtype = data[CONTROL_HEADER.size - 1] if len(data) >= CONTROL_HEADER.size else None
+            if subtype == CTRL_SYNC and len(data) >= SYNC.size:
+                # Echo the client's send time with our receive and send times, NTP style
+                _, _, flow_id, seq_num, _, client_time, _, _ = SYNC.unpack_from(data)
+                self.transport.sendto(SYNC.pack(WIRE_VERSION, MSG_CONTROL, flow_id, seq_num, CTRL_SYNC,
+                                                client_time, receive_time, time.time()), addr)
+                return
+            if subtype == CTRL_HELLO and len(data) >= HELLO.size:
+                _, _, flow_id, seq_num, _, raw_id, flows, packet_size, duration = HELLO.unpack_from(data)
+                test_id = raw_id.rstrip(b'\0').decode('ascii', 'replace')
+                if TEST_ID_PATTERN.fullmatch(test_id):
+                    self.join_session(addr, test_id, flows, packet_size, duration)
+                    # Answered every time, so a client whose HELLO_ACK was lost can retry
+                    self.transport.sendto(SESSION.pack(WIRE_VERSION, MSG_CONTROL, flow_id,
+                                                       self.address_cookie(addr, test_id), CTRL_HELLO_ACK,
+                                                       raw_id), addr)
+                    return
+            elif subtype == CTRL_CONFIRM and len(data) >= CONFIRM.size:
+                _, _, flow_id, cookie, _, raw_id, responses = CONFIRM.unpack_from(data)
+                session = self.session_by_addr.get(addr)
+                if session is not None and session.test_id is not None and \
+                        cookie == self.address_cookie(addr, session.test_id):
+                    if addr not in session.confirmed and responses > self.server.max_responses:
+                        logger.warning(f"{session.name()} flow {flow_id} asks for {responses} DATA packets per "
+                                       f"request; granting {self.server.max_responses} (--max-responses)")
+                    session.confirmed.add(addr)
+                    # Tell the client how many packets per request it will get, so it expects no more
+                    granted = min(max(1, responses), self.server.max_responses)
+                    self.transport.sendto(CONFIRM.pack(WIRE_VERSION, MSG_CONTROL, flow_id, cookie, CTRL_CONFIRM,
+                                                       raw_id, granted), addr)
+                    return
+            elif subtype == CTRL_BYE and len(data) >= SESSION.size:
+                session = self.session_by_addr.get(addr)
+                if session is not None:
+                    self.leave_session(session, addr, 'finished')
+                return
+            self.server.stats['invalid_packets'] += 1
+
+        def address_cookie(self, addr, test_id: str) -> int:
+            """Keyed hash of a client address and test ID, echoed back to confirm the address"""
+            digest = hmac.digest(self.cookie_key, f"{addr[0]}|{addr[1]}|{test_id}".encode(), 'sha256')
+            return int.from_bytes(digest[:8], 'big')
+
+        def send_upload_ack(self, flow_id: int, flow: UploadFlow):
+            """Report the flow's cumulative receive counts, echoing the newest packet's send time"""
+            self.transport.sendto(UPLOAD_ACK.pack(WIRE_VERSION, MSG_UPLOAD_ACK, flow_id, flow.last_seq,
+                                                  flow.last_send_time, flow.last_receive_time, time.time(),
+                                                  flow.packets, flow.bytes), flow.addr)
+            flow.unacked = 0
+
+        def flush_upload_acks(self):
+            """Acknowledge every flow with packets still waiting for an UPLOAD_ACK"""
+            for session in self.sessions.values():
+                for flow_id, flow in session.upload_flows.items():
+                    if flow.unacked:
+                        self.send_upload_ack(flow_id, flow)
+
+        def expire_pending(self, now: float) -> int:
+            """Expire unacknowledged packets past the timeout, returning the loss count"""
+            total = 0
+            for session in self.sessions.values():
+                total += self.expire_session(session, now)
+            return total
+
+        def expire_session(self, session: Session, now: float) -> int:
+            """Expire one session's unacknowledged packets past the timeout, returning the loss count"""
+            metrics = self.server.metrics
+            total = 0
+            for flow_id, pending in session.pending.items():
+                lost = pending.expire(now)
+                if lost and metrics is not None:
+                    metrics.flow(flow_id).packets_lost += lost
+                total += lost
+            session.packets_lost += total
+            return total
+
+        def session(self, addr) -> Session:
+            """Session of a client address, anonymous if it sent no HELLO; counts the packet"""
+            session = self.session_by_addr.get(addr)
+            if session is None:
+                session = self.server.open_session(addr, None)
+                session.addrs.add(addr)
+                self.sessions[addr] = self.session_by_addr[addr] = session
+            session.packets += 1
+            return session
+
+        def join_session(self, addr, test_id: str, flows: int, packet_size: int, duration: float) -> Session:
+            """Move a flow address into the session of a test, opening it on the first HELLO"""
+            session = self.sessions.get(test_id)
+            if session is None:
+                session = self.sessions[test_id] = self.server.open_session(test_id, test_id, flows,
+                                                                            packet_size, duration)
+            previous = self.session_by_addr.get(addr)
+            if previous is not session:
+                if previous is not None:
+                    self.leave_session(previous, addr, 'address reused')
+                session.addrs.add(addr)
+                self.session_by_addr[addr] = session
+            return session
+
+        def leave_session(self, session: Session, addr, reason: str):
+            """Drop an address from its session, closing the session when it was the last one"""
+            session.addrs.discard(addr)
+            session.confirmed.discard(addr)
+            if self.session_by_addr.get(addr) is session:
+                del self.session_by_addr[addr]
+            if not session.addrs:
+                self.close_session(session, reason)
+
+        def close_session(self, session: Session, reason: str):
+            """Count the session's unacknowledged packets as lost and free its state"""
+            session.closed = True
+            self.server.stats['packets_lost'] += self.expire_session(session, float('inf'))
+            for addr in session.addrs:
+                if self.session_by_addr.get(addr) is session:
+                    del self.session_by_addr[addr]
+            self.sessions.pop(session.key, None)
+            self.server.session_closed(session, reason)
+
+        def evict_idle_sessions(self, now: float, idle_timeout: float) -> int:
+            """Close sessions that received nothing for idle_timeout seconds, returning how many"""
+            evicted = 0
+            for session in list(self.sessions.values()):
+                if session.packets != session.swept_packets:
+                    session.swept_packets = session.packets
+                    session.idle_since = now
+                elif now - session.idle_since >= idle_timeout:
+                    self.close_session(session, 'idle')
+                    evicted += 1
+            return evicted
+
+        def close_sessions(self, reason: str):
+            for session in list(self.sessions.values()):
+                self.close_session(session, reason)
+
+    def log_packet(self, session: Session, client_addr: tuple, flow_id: int, seq_num: int, request_time: float,
+                  send_time: float, ack_time: Optional[float], rtt: Optional[float],
+                  kernel_request_time: Optional[float] = None, packet_size: Optional[int] = None):
+        """Log packet information to the session's packet log"""
         try:
-            with open(self.log_file, 'a', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    datetime.now().isoformat(),
-                    f"{client_addr[0]}:{client_addr[1]}",
-                    seq_num,
-                    request_time,
-                    send_time,
-                    ack_time if ack_time is not None else '',
-                    rtt if rtt is not None else ''
-                ])
+            session.packet_log.write((
+                send_time,
+                client_addr,
+                flow_id,
+                seq_num,
+                request_time,
+                send_time,
+                ack_time,
+                rtt,
+                kernel_request_time,
+                packet_size
+            ))
         except Exception as e:
             logger.error(f"Failed to log packet: {e}")
 
-    def update_packet_log(self, client_addr: tuple, seq_num: int, ack_time: float, rtt: float):
-        """Update existing log entry with ACK time and RTT"""
+    def update_packet_log(self, session: Session, client_addr: tuple, flow_id: int, seq_num: int,
+                          ack_time: float, rtt: float, kernel_ack_time: Optional[float] = None):
+        """Record ACK time and RTT for a previously logged packet in the session's ACK journal"""
         try:
-            # Read all lines
-            with open(self.log_file, 'r', newline='') as f:
-                lines = list(csv.reader(f))
-            
-            # Find and update the matching entry
-            for i, line in enumerate(lines[1:], 1):  # Skip header
-                if (line[1] == f"{client_addr[0]}:{client_addr[1]}" and 
-                    int(line[2]) == seq_num):
-                    lines[i][5] = str(ack_time)  # ACK time
-                    lines[i][6] = str(rtt)       # RTT
-                    break
-            
-            # Write back all lines
-            with open(self.log_file, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerows(lines)
-                
+            session.ack_log.write((
+                ack_time,
+                client_addr,
+                flow_id,
+                seq_num,
+                ack_time,
+                rtt,
+                kernel_ack_time
+            ))
         except Exception as e:
             logger.error(f"Failed to update packet log: {e}")
 
+    def log_upload(self, session: Session, client_addr: tuple, flow_id: int, seq_num: int, send_time: float,
+                   receive_time: float, kernel_receive_time: Optional[float] = None,
+                   packet_size: Optional[int] = None):
+        """Log a received upload packet to the session's upload log"""
+        try:
+            session.upload_log.write((
+                receive_time,
+                client_addr,
+                flow_id,
+                seq_num,
+                send_time,
+                receive_time,
+                kernel_receive_time,
+                packet_size
+            ))
+        except Exception as e:
+            logger.error(f"Failed to log upload packet: {e}")
+
+    def log_upload_summary(self, session: Session):
+        """Log the per-flow receive totals of a session's upload flows"""
+        for flow_id, flow in sorted(session.upload_flows.items()):
+            loss = flow.lost() / (flow.max_seq + 1) * 100 if flow.max_seq >= 0 else 0.0
+            logger.info(f"Upload flow {flow_id} from {flow.addr[0]}:{flow.addr[1]}: {flow.packets} packets, "
+                        f"{flow.bytes} bytes received, {flow.lost()} missing ({loss:.2f}%), "
+                        f"jitter {flow.jitter_ms:.3f} ms")
+
+    def open_session(self, key, test_id: Optional[str], flows: int = 0, packet_size: int = 0,
+                     duration: float = 0.0) -> Session:
+        """New session state, with its own log files for a named test if --session-logs is set"""
+        logs = (self.packet_log, self.ack_log, self.upload_log)
+        if test_id is not None and self.session_logs:
+            try:
+                log_file = session_log_path(self.log_file, test_id)
+                os.makedirs(os.path.dirname(log_file), exist_ok=True)
+                logs = (open_packet_log(log_file, SERVER_LOG_COLUMNS, self.log_format),
+                        open_packet_log(ack_log_path(log_file), ACK_LOG_COLUMNS, self.log_format),
+                        open_packet_log(upload_log_path(log_file), UPLOAD_LOG_COLUMNS, self.log_format))
+            except Exception as e:
+                logger.error(f"Failed to open session logs for test {test_id}, using the main logs: {e}")
+        session = Session(key, test_id, logs, flows, packet_size, duration)
+        # Anonymous clients get at most the default size; sessions up to what they announced
+        session.max_packet_size = min(max(self.packet_size, packet_size), self.max_packet_size)
+        if test_id is not None:
+            logger.info(f"Session {test_id} opened: {flows} flows, packets up to {packet_size} bytes, "
+                        f"{duration:g} s")
+            if packet_size > self.max_packet_size:
+                logger.warning(f"Session {test_id} uses packets of up to {packet_size} bytes; "
+                               f"DATA packets are capped at {self.max_packet_size}")
+        return session
+
+    def session_closed(self, session: Session, reason: str):
+        """Log a closed session's totals and close its own logs"""
+        if session.test_id is not None:
+            logger.info(f"{session.name()} closed ({reason}) after {time.time() - session.start_time:.1f} s: "
+                        f"{session.packets_sent} packets, {session.bytes_sent} bytes sent, "
+                        f"{session.acks_received} acked, {session.packets_lost} lost")
+        self.log_upload_summary(session)
+        if session.packet_log is not self.packet_log:
+            for log in (session.packet_log, session.ack_log, session.upload_log):
+                log.close()
+                self.closed_log_dropped_rows += log.dropped_rows
+
+    def log_dropped_rows(self) -> int:
+        """Rows dropped so far by all packet logs: main, ACK, upload and per-session"""
+        logs = [self.packet_log, self.ack_log, self.upload_log]
+        if self.protocol is not None:
+            for session in self.protocol.sessions.values():
+                if session.packet_log is not self.packet_log:
+                    logs += [session.packet_log, session.ack_log, session.upload_log]
+        return self.closed_log_dropped_rows + sum(log.dropped_rows for log in logs)
+
+    def close(self):
+        """Close all sessions, then flush and close the packet log and ACK journal"""
+        if self.protocol is not None:
+            self.protocol.close_sessions('shutdown')
+        self.packet_log.close()
+        self.ack_log.close()
+        self.upload_log.close()
+        if self.metrics is not None:
+            self.metrics.close()
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler.log_summary()
+
     async def start(self):
         """Start the UDP server"""
         try:
             loop = asyncio.get_running_loop()
+            self.event_loop = event_loop_name(loop)
             
             self.stats['start_time'] = time.time()
             self.stats['last_stats_time'] = self.stats['start_time']
@@ -180,6 +708,9 @@ class UDPServer:
             # Create socket
             sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reuse_port:
+                # Let the kernel spread flows across worker sockets
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             
             # Increase socket buffer sizes
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
@@ -187,19 +718,38 @@ class UDPServer:
             
             # Bind socket
             sock.bind((self.host, self.port))
+            if self.profiler is not None:
+                self.profiler.watch_socket(sock)
+                self.profiler.start()
             
             # Create protocol and transport
             protocol = self.ServerProtocol(self)
-            transport, _ = await loop.create_datagram_endpoint(
-                lambda: protocol,
-                sock=sock
+            transport = await create_datagram_endpoint(
+                protocol,
+                sock,
+                self.io_engine,
+                self.batch_size,
+                self.max_packet_size,
+                self.kernel_timestamps
             )
+            self.protocol = protocol
+            if self.metrics is not None:
+                await self.metrics.serve(self.metrics_host, self.metrics_port)
             
-            # Start statistics reporting
-            stats_task = asyncio.create_task(self.report_stats())
+            # Start statistics reporting and pending-packet expiry
+            self.tasks = [
+                asyncio.create_task(self.report_stats()),
+                asyncio.create_task(self.expire_pending()),
+                asyncio.create_task(self.flush_upload_acks()),
+                asyncio.create_task(self.evict_idle_sessions()),
+            ]
             
             logger.info(f"Server started on {self.host}:{self.port}")
-            logger.info(f"Packet size: {self.packet_size} bytes")
+            logger.info(f"Packet size: {self.packet_size} bytes by default, up to {self.max_packet_size} "
+                        f"on request ({self.payload_pattern} payload)")
+            logger.info(f"I/O engine: {self.io_engine}"
+                        f"{' with kernel timestamps' if self.kernel_timestamps else ''}")
+            logger.info(f"Event loop: {self.event_loop}")
             
             # Keep server running
             while True:
@@ -208,6 +758,38 @@ class UDPServer:
         except Exception as e:
             logger.error(f"Server error: {e}")
             raise
+        finally:
+            for task in self.tasks:
+                task.cancel()
+
+    async def expire_pending(self):
+        """Periodically count unacknowledged packets past the timeout as lost"""
+        interval = min(self.pending_timeout / 4, 0.5)
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                self.stats['packets_lost'] += self.protocol.expire_pending(time.time())
+            except Exception as e:
+                logger.error(f"Error expiring pending packets: {e}")
+
+    async def evict_idle_sessions(self):
+        """Periodically close sessions that have gone quiet"""
+        interval = min(self.session_idle_timeout / 4, 1.0)
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                self.protocol.evict_idle_sessions(time.time(), self.session_idle_timeout)
+            except Exception as e:
+                logger.error(f"Error evicting idle sessions: {e}")
+
+    async def flush_upload_acks(self):
+        """Acknowledge the tail of upload bursts that did not fill a batch"""
+        while True:
+            try:
+                await asyncio.sleep(UPLOAD_ACK_INTERVAL)
+                self.protocol.flush_upload_acks()
+            except Exception as e:
+                logger.error(f"Error flushing upload ACKs: {e}")
 
     async def report_stats(self):
         """Report server statistics periodically"""
@@ -215,23 +797,147 @@ class UDPServer:
             try:
                 await asyncio.sleep(5)  # Report every 5 seconds
                 
-                current_time = time.time()
-                elapsed = current_time - self.stats['last_stats_time']
-                
-                if elapsed > 0:
-                    packets_per_sec = self.stats['packets_sent'] / elapsed
-                    bytes_per_sec = self.stats['bytes_sent'] / elapsed
-                    mbps = (bytes_per_sec * 8) / 1_000_000
-                    
-                    logger.info(f"Stats: {packets_per_sec:.2f} packets/sec, {mbps:.2f} Mbps")
-                    
-                    # Reset counters
-                    self.stats['packets_sent'] = 0
-                    self.stats['bytes_sent'] = 0
-                    self.stats['last_stats_time'] = current_time
+                start_ns = time.perf_counter_ns()
+                interval = self.take_interval_stats()
+                if self.metrics is not None:
+                    self.metrics.roll()
+                if self.stats_queue is not None:
+                    self.stats_queue.put((self.worker_id, interval))
+                else:
+                    self.log_interval_stats(interval)
+                if self.profiler is not None:
+                    self.profiler.record('report_stats', time.perf_counter_ns() - start_ns, sampled=False)
             except Exception as e:
                 logger.error(f"Error in stats reporting: {e}")
 
+    def take_interval_stats(self) -> dict:
+        """Snapshot the counters for the interval since the last call and reset them"""
+        current_time = time.time()
+        interval = {
+            'elapsed': current_time - self.stats['last_stats_time'],
+            'packets_sent': self.stats['packets_sent'],
+            'bytes_sent': self.stats['bytes_sent'],
+            'acks_received': self.stats['acks_received'],
+            'invalid_packets': self.stats['invalid_packets'],
+            'packets_lost': self.stats['packets_lost'],
+            'upload_packets_received': self.stats['upload_packets_received'],
+            'upload_bytes_received': self.stats['upload_bytes_received'],
+            'log_dropped_rows': self.log_dropped_rows(),
+            # Test IDs rather than a count: one test's flows may be spread over several workers
+            'sessions': sorted(session.test_id for session in self.protocol.sessions.values()
+                               if session.test_id is not None),
+        }
+        
+        # Reset counters
+        self.stats['packets_sent'] = 0
+        self.stats['bytes_sent'] = 0
+        self.stats['acks_received'] = 0
+        self.stats['invalid_packets'] = 0
+        self.stats['packets_lost'] = 0
+        self.stats['upload_packets_received'] = 0
+        self.stats['upload_bytes_received'] = 0
+        self.stats['last_stats_time'] = current_time
+        return interval
+
+    @staticmethod
+    def log_interval_stats(interval: dict):
+        """Log one interval snapshot (from this process or combined across workers)"""
+        elapsed = interval['elapsed']
+        if elapsed <= 0:
+            return
+        
+        packets_per_sec = interval['packets_sent'] / elapsed
+        bytes_per_sec = interval['bytes_sent'] / elapsed
+        mbps = (bytes_per_sec * 8) / 1_000_000
+        
+        ack_ratio = (interval['acks_received'] / interval['packets_sent'] * 100
+                     if interval['packets_sent'] else 0.0)
+        
+        sessions = f", {len(interval['sessions'])} sessions open" if interval['sessions'] else ''
+        logger.info(f"Stats: {packets_per_sec:.2f} packets/sec, {mbps:.2f} Mbps, "
+                    f"{ack_ratio:.1f}% acked, {interval['packets_lost']} lost{sessions}")
+        if interval['upload_packets_received']:
+            upload_mbps = interval['upload_bytes_received'] * 8 / elapsed / 1_000_000
+            logger.info(f"Upload: {interval['upload_packets_received'] / elapsed:.2f} packets/sec, "
+                        f"{upload_mbps:.2f} Mbps received")
+        if interval['invalid_packets']:
+            logger.warning(f"Ignored {interval['invalid_packets']} invalid packets")
+        if interval['log_dropped_rows']:
+            logger.warning(f"Packet logs have dropped {interval['log_dropped_rows']} rows")
+
+def combine_interval_stats(intervals: List[dict]) -> dict:
+    """Sum per-worker interval snapshots into one, averaging the interval length and merging sessions"""
+    combined = {key: sum(interval[key] for interval in intervals) for key in intervals[0] if key != 'sessions'}
+    combined['elapsed'] = combined['elapsed'] / len(intervals)
+    combined['sessions'] = sorted(set().union(*(interval['sessions'] for interval in intervals)))
+    return combined
+
+def run_worker(worker_id: int, server_kwargs: dict, stats_queue: multiprocessing.Queue,
+               event_loop: str = 'asyncio'):
+    """Entry point of one worker process: a full server on a SO_REUSEPORT socket"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - %(levelname)s - [worker {worker_id}] %(message)s',
+        force=True
+    )
+    install_event_loop(event_loop)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    server = UDPServer(**server_kwargs, reuse_port=True,
+                       stats_queue=stats_queue, worker_id=worker_id)
+    try:
+        asyncio.run(server.start())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # A second Ctrl-C or SIGTERM must not cut the final log flush short
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        server.close()
+
+def run_workers(num_workers: int, server_kwargs: dict, event_loop: str = 'asyncio'):
+    """Run the server as N worker processes and combine their statistics"""
+    stats_queue = multiprocessing.Queue()
+    workers = []
+    for worker_id in range(num_workers):
+        worker_kwargs = dict(server_kwargs,
+                             log_file=shard_log_path(server_kwargs['log_file'], worker_id))
+        if server_kwargs.get('metrics_port'):
+            # One endpoint per worker on consecutive ports
+            worker_kwargs['metrics_port'] = server_kwargs['metrics_port'] + worker_id
+        worker = multiprocessing.Process(target=run_worker, name=f"udp-server-worker-{worker_id}",
+                                         args=(worker_id, worker_kwargs, stats_queue, event_loop))
+        worker.start()
+        workers.append(worker)
+    
+    logger.info(f"Started {num_workers} workers on {server_kwargs['host']}:{server_kwargs['port']}")
+    
+    try:
+        # Log one combined line per round of worker reports
+        current_round = {}
+        while any(worker.is_alive() for worker in workers):
+            try:
+                worker_id, interval = stats_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if worker_id in current_round:
+                # A worker reported twice before the others caught up; flush what we have
+                UDPServer.log_interval_stats(combine_interval_stats(list(current_round.values())))
+                current_round = {}
+            current_round[worker_id] = interval
+            if len(current_round) == sum(worker.is_alive() for worker in workers):
+                UDPServer.log_interval_stats(combine_interval_stats(list(current_round.values())))
+                current_round = {}
+    finally:
+        # Workers normally get Ctrl-C from the terminal; forward it to any that didn't
+        deadline = time.monotonic() + 1
+        for worker in workers:
+            worker.join(timeout=max(0, deadline - time.monotonic()))
+        for worker in workers:
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGINT)
+        for worker in workers:
+            worker.join()
+
 def main():
     parser = argparse.ArgumentParser(description='UDP Server for Traffic Testing')
     parser.add_argument('--host', type=str, default='0.0.0.0',
@@ -239,17 +945,99 @@ def main():
     parser.add_argument('--port', type=int, default=5000,
                       help='Server port')
     parser.add_argument('--packet-size', type=int, default=1400,
-                      help='UDP packet size in bytes')
-    parser.add_argument('--log-file', type=str, default='server_log.csv',
-                      help='Output file for server logs')
+                      help='DATA packet size in bytes for requests that do not carry one')
+    parser.add_argument('--max-packet-size', type=int, default=9000,
+                      help='Largest DATA packet size a request may ask for (larger requests are capped)')
+    parser.add_argument('--log-file', type=str, default=None,
+                      help='Output file for server logs (default: server_log.csv or server_log.bin)')
+    parser.add_argument('--log-format', type=str, default='csv', choices=LOG_FORMATS,
+                      help='Packet log encoding (binary writes fixed-width records the analyzer memory-maps)')
+    parser.add_argument('--pending-timeout', type=float, default=2.0,
+                      help='Seconds to wait for an ACK before counting a packet as lost')
+    parser.add_argument('--pending-window', type=int, default=16384,
+                      help='Maximum in-flight packets tracked per flow')
+    parser.add_argument('--payload-pattern', type=str, default='zeros', choices=PAYLOAD_PATTERNS,
+                      help='DATA payload contents (incompressible defeats WAN optimizers)')
+    parser.add_argument('--io-engine', type=str, default='asyncio', choices=IO_ENGINES,
+                      help='Socket I/O engine (mmsg batches packets with recvmmsg/sendmmsg, Linux only)')
+    parser.add_argument('--batch-size', type=int, default=64,
+                      help='Maximum packets per recvmmsg/sendmmsg call with --io-engine mmsg')
+    parser.add_argument('--kernel-timestamps', action='store_true',
+                      help='Log SO_TIMESTAMPNS kernel receive times alongside userspace times (Linux only)')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                      help='Serve live per-flow metrics over HTTP on this port (Prometheus text at /metrics)')
+    parser.add_argument('--metrics-host', type=str, default='127.0.0.1',
+                      help='Address for the live metrics endpoint')
+    parser.add_argument('--profile', action='store_true',
+                      help='Sample per-stage hot-path timings, event-loop lag, GC pauses and socket drops; '
+                           'print a summary at shutdown')
+    parser.add_argument('--max-responses', type=int, default=64,
+                      help='Most DATA packets sent in answer to one request')
+    parser.add_argument('--upload-ack-every', type=int, default=16,
+                      help='Upload packets per batched UPLOAD_ACK (tails are acked every 20 ms)')
+    parser.add_argument('--session-logs', action='store_true',
+                      help='Write each test session (opened by a client HELLO) to its own log directory')
+    parser.add_argument('--session-idle-timeout', type=float, default=30.0,
+                      help='Seconds without packets after which a client session is closed and its state freed')
+    parser.add_argument('--event-loop', type=str, default='asyncio', choices=EVENT_LOOPS,
+                      help='Event loop implementation (auto: uvloop if installed, else asyncio)')
+    parser.add_argument('--workers', type=int, default=1,
+                      help='Worker processes sharing the port via SO_REUSEPORT (logs are sharded per worker)')
     
     args = parser.parse_args()
+    if args.log_file is None:
+        args.log_file = f"server_log{LOG_EXTENSIONS[args.log_format]}"
+    event_loop = install_event_loop(args.event_loop)
+    # Shut down on SIGTERM (kill, systemd, containers) as on Ctrl-C: logs flushed, summaries logged
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    
+    if args.workers > 1:
+        try:
+            run_workers(args.workers, {
+                'host': args.host,
+                'port': args.port,
+                'packet_size': args.packet_size,
+                'log_file': args.log_file,
+                'pending_timeout': args.pending_timeout,
+                'pending_window': args.pending_window,
+                'payload_pattern': args.payload_pattern,
+                'io_engine': args.io_engine,
+                'batch_size': args.batch_size,
+                'kernel_timestamps': args.kernel_timestamps,
+                'log_format': args.log_format,
+                'metrics_host': args.metrics_host,
+                'metrics_port': args.metrics_port,
+                'profile': args.profile,
+                'upload_ack_every': args.upload_ack_every,
+                'max_responses': args.max_responses,
+                'session_logs': args.session_logs,
+                'session_idle_timeout': args.session_idle_timeout,
+                'max_packet_size': args.max_packet_size,
+            }, event_loop)
+        except KeyboardInterrupt:
+            logger.info("Server stopped by user")
+        return
     
     server = UDPServer(
         args.host,
         args.port,
         args.packet_size,
-        args.log_file
+        args.log_file,
+        args.pending_timeout,
+        args.pending_window,
+        args.payload_pattern,
+        args.io_engine,
+        args.batch_size,
+        args.kernel_timestamps,
+        args.log_format,
+        args.metrics_host,
+        args.metrics_port,
+        args.profile,
+        args.upload_ack_every,
+        args.max_responses,
+        args.session_logs,
+        args.session_idle_timeout,
+        args.max_packet_size
     )
     
     try:
@@ -259,6 +1047,8 @@ def main():
     except Exception as e:
         logger.error(f"Server error: {e}")
         sys.exit(1)
+    finally:
+        server.close()
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
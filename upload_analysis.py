@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+"""Upload (client to server) analysis from the server's upload log.
+
+In ``--direction up``/``bidir`` runs the server logs every upload packet it
+receives with the client send time and its own receive time:
+
+- loss and duplicates from sequence numbers, against the upload packets each
+  flow sent per the client's send counts file (without one, up to the
+  highest sequence number seen)
+- throughput from the logged packet sizes over the receive time span
+- RFC 3550 interarrival jitter, which needs no clock sync since transit
+  differences cancel the clock offset
+- one-way delay ``receive - send - theta``, with ``theta`` from the per-flow
+  clock offset fit of the DATA packets or, for flows without any (upload-only
+  runs), the startup clock sync; without either it is not reported
+
+Chunks are folded into running aggregates, so the in-memory and streaming
+analyses share ``UploadAnalysis``; it keeps one byte per upload packet.
+"""
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from clock_offset import clock_offsets
+from histogram import LogHistogram
+from jitter import interarrival_jitter
+from sequence_analysis import grow
+
+def select_upload_rows(chunk: pd.DataFrame, sent_counts: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Upload log rows of the client whose send counts are given (all rows without them).
+
+    Client addresses can be rewritten by NAT, so rows are matched by flow ID
+    and by a send time (client clock) within the flow's run, which separates
+    consecutive tests sharing a server log.
+    """
+    if sent_counts is None or not len(chunk):
+        return chunk
+    flows = sent_counts.reindex(chunk['flow_id'].to_numpy())
+    ours = flows.index.isin(sent_counts.index)
+    if 'start_time' in flows:
+        send_time = chunk['send_time'].to_numpy(np.float64)
+        ours &= ~(send_time < flows['start_time'].to_numpy(np.float64))
+        ours &= ~(send_time > flows['end_time'].to_numpy(np.float64))
+    return chunk[ours]
+
+class UploadAnalysis:
+    """Running upload loss, throughput, jitter and one-way delay over upload log chunks"""
+
+    COLUMNS = ['timestamp', 'flow_id', 'sequence_number', 'send_time', 'receive_time', 'packet_size']
+
+    def __init__(self, sent_counts: Optional[pd.DataFrame] = None, clock_fit: Optional[pd.DataFrame] = None,
+                 clock_sync: Optional[dict] = None):
+        self.sent_counts = sent_counts
+        self.clock_fit = clock_fit
+        self.prior_offset = clock_sync['offset'] if clock_sync is not None else np.nan
+        self.seen = {}  # flow -> whether each sequence number arrived
+        self.flows = pd.DataFrame(columns=['packets', 'bytes'], dtype=np.int64)
+        self.bytes_per_second = pd.Series(dtype=np.int64)
+        self.delay = LogHistogram()
+        self.jitter_state = {}  # flow -> last (send_time, receive_time, jitter), carried across chunks
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+        self.rows = 0
+        self.ignored_rows = 0
+        self.first_receive = np.inf
+        self.last_receive = -np.inf
+
+    def add_chunk(self, chunk: pd.DataFrame):
+        """Fold a chunk of the upload log into the aggregates"""
+        rows = len(chunk)
+        chunk = select_upload_rows(chunk, self.sent_counts)
+        self.ignored_rows += rows - len(chunk)
+        if not len(chunk):
+            return
+        self.rows += len(chunk)
+        flow_ids = chunk['flow_id'].to_numpy(np.int64)
+        seqs = chunk['sequence_number'].to_numpy(np.int64)
+        send = chunk['send_time'].to_numpy(np.float64)
+        receive = chunk['receive_time'].to_numpy(np.float64)
+        sizes = chunk['packet_size'].to_numpy(np.int64)
+        self.first_receive = min(self.first_receive, receive.min())
+        self.last_receive = max(self.last_receive, receive.max())
+
+        second = chunk['timestamp'].dt.floor('s')
+        self.bytes_per_second = self.bytes_per_second.add(pd.Series(sizes).groupby(second.to_numpy()).sum(),
+                                                          fill_value=0)
+        flows = pd.DataFrame({'flow_id': flow_ids, 'bytes': sizes}).groupby('flow_id')['bytes']
+        chunk_flows = pd.DataFrame({'packets': flows.size(), 'bytes': flows.sum()})
+        self.flows = chunk_flows if self.flows.empty else self.flows.add(chunk_flows, fill_value=0)
+
+        # Log order is arrival order within each flow
+        order, jitter = interarrival_jitter(flow_ids, send, receive, self.jitter_state)
+        self.jitter_sum += jitter.sum()
+        self.jitter_max = max(self.jitter_max, jitter.max())
+
+        sorted_flows = flow_ids[order]
+        starts = np.flatnonzero(np.r_[True, sorted_flows[1:] != sorted_flows[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(order)]):
+            flow = int(sorted_flows[start])
+            flow_seqs = seqs[order[start:end]]
+            seen = self.seen[flow] = grow(self.seen.get(flow, np.zeros(0, dtype=bool)), flow_seqs.max() + 1, False)
+            seen[flow_seqs] = True
+
+        self.delay.add((receive - send - self.clock_offsets(flow_ids, send)) * 1000)
+
+    def clock_offsets(self, flow_ids: np.ndarray, send_times: np.ndarray) -> np.ndarray:
+        """Server minus client clock in seconds at each send, from the fit or the startup clock sync"""
+        theta = np.full(len(flow_ids), self.prior_offset)
+        if self.clock_fit is not None and len(self.clock_fit):
+            fitted = clock_offsets(self.clock_fit, flow_ids, send_times)
+            theta = np.where(np.isnan(fitted), theta, fitted)
+        return theta
+
+    def flow_frame(self) -> pd.DataFrame:
+        """Per-flow upload packets sent, received (distinct), lost and duplicated, and bytes received"""
+        received = pd.Series({flow: int(seen.sum()) for flow, seen in self.seen.items()}, dtype=np.int64)
+        highest = pd.Series({flow: int(np.flatnonzero(seen)[-1]) + 1 for flow, seen in self.seen.items()},
+                            dtype=np.int64)
+        flows = received.index
+        sent = highest
+        if self.sent_counts is not None and 'uploads' in self.sent_counts:
+            uploads = self.sent_counts['uploads']
+            flows = flows.union(uploads.index[uploads > 0])
+            sent = uploads.reindex(flows, fill_value=0).combine(highest.reindex(flows, fill_value=0), max)
+        received = received.reindex(flows, fill_value=0)
+        packets = self.flows['packets'].reindex(flows, fill_value=0).astype(np.int64)
+        return pd.DataFrame({
+            'packets_sent': sent.reindex(flows).astype(np.int64),
+            'packets_received': received,
+            'packets_lost': sent.reindex(flows).astype(np.int64) - received,
+            'duplicates': packets - received,
+            'bytes_received': self.flows['bytes'].reindex(flows, fill_value=0).astype(np.int64),
+        }, index=pd.Index(flows, name='flow_id'))
+
+    def metrics(self, per_flow: Optional[pd.DataFrame] = None) -> dict:
+        """Upload metrics for the report; empty without any upload packet sent or received"""
+        if per_flow is None:
+            per_flow = self.flow_frame()
+        if not len(per_flow):
+            return {}
+        totals = per_flow.sum()
+        duration = self.last_receive - self.first_receive
+        metrics = {
+            'upload_packets_received': totals['packets_received'],
+            'upload_loss_rate': totals['packets_lost'] / totals['packets_sent'] * 100,
+            'upload_duplicate_packets': totals['duplicates'],
+            'upload_throughput_mbps': (totals['bytes_received'] * 8 / (duration * 1_000_000)
+                                       if duration > 0 else np.nan),
+            'upload_jitter_ms': self.jitter_sum / self.rows if self.rows else np.nan,
+            'upload_jitter_max_ms': self.jitter_max if self.rows else np.nan,
+        }
+        if self.delay.count:
+            metrics['upload_delay_mean'] = self.delay.mean()
+            metrics['upload_delay_p99'] = self.delay.quantile(0.99)
+        return metrics
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""Wire format shared by the UDP client and server.
+
+Every datagram starts with a fixed 12-byte header::
+
+    version (u8) | msg_type (u8) | flow_id (u16) | sequence_number (u64)
+
+followed by a body that depends on the message type. All fields are in
+network byte order. Each message layout is a precompiled ``struct.Struct``
+so the hot paths pack and parse with a single call.
+"""
+
+import re
+import struct
+
+WIRE_VERSION = 5
+
+# Largest UDP payload over IPv4
+MAX_PACKET_SIZE = 65507
+
+# Message types
+MSG_REQUEST = 1   # client -> server: ask for a DATA packet
+MSG_DATA = 2      # server -> client: payload-carrying response
+MSG_ACK = 3       # client -> server: acknowledge a DATA packet
+MSG_CONTROL = 4   # either direction: out-of-band control messages
+MSG_UPLOAD = 5    # client -> server: payload-carrying upload packet
+MSG_UPLOAD_ACK = 6  # server -> client: batched acknowledgement of upload packets
+
+HEADER = struct.Struct('!BBHQ')
+# REQUEST body: request_time, number of DATA packets to send back (K), the gap between them in
+# microseconds (0: back to back) and their size in bytes (0: the server's default). The K responses
+# carry sequence numbers seq .. seq + K - 1.
+REQUEST = struct.Struct('!BBHQdHIH')
+# DATA body: request_time, server send_time, then padding up to the packet size
+DATA_HEADER = struct.Struct('!BBHQdd')
+# ACK body: client receive_time of the acknowledged DATA packet
+ACK = struct.Struct('!BBHQd')
+# UPLOAD body: client send_time, then padding up to the packet size
+UPLOAD = struct.Struct('!BBHQd')
+# UPLOAD_ACK (sequence number of the newest packet): its client send_time echoed back, its server
+# receive_time, the ACK's server send_time (so the client can subtract the time the ACK was held for
+# batching) and the flow's cumulative packets and bytes received
+UPLOAD_ACK = struct.Struct('!BBHQdddQQ')
+# CONTROL body starts with a subtype byte
+CONTROL_HEADER = struct.Struct('!BBHQB')
+CTRL_SYNC = 1       # clock sync probe, echoed back by the server with its own timestamps
+CTRL_HELLO = 2      # client -> server: join this flow's address to a test session
+CTRL_HELLO_ACK = 3  # server -> client: the flow joined the session
+CTRL_BYE = 4        # client -> server: the flow has finished
+CTRL_CONFIRM = 5    # client -> server: proves the flow's address received the HELLO_ACK; echoed back
+# SYNC (CONTROL subtype CTRL_SYNC): client send time; the server's reply adds its receive and send times
+SYNC = struct.Struct('!BBHQBddd')
+# HELLO: test ID (ASCII, NUL-padded), flows in the whole test, packet size and duration in seconds
+HELLO = struct.Struct('!BBHQB16sHId')
+# HELLO_ACK and BYE: test ID. The HELLO_ACK's sequence number is an address cookie that the client
+# echoes in a CONFIRM
+SESSION = struct.Struct('!BBHQB16s')
+# CONFIRM: test ID and DATA packets per request; the client sends the number it wants, the server's echo
+# the number it grants (capped by --max-responses)
+CONFIRM = struct.Struct('!BBHQB16sH')
+# Test IDs name the server's per-session log directories
+TEST_ID_PATTERN = re.compile(r'[A-Za-z0-9_-][A-Za-z0-9_.-]{0,15}')